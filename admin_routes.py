@@ -1,11 +1,26 @@
-from flask import Blueprint, render_template, request, redirect, url_for, flash
+from flask import (Blueprint, render_template, request, redirect, url_for, flash, jsonify, current_app,
+                   send_from_directory, Response, stream_with_context)
 from flask_login import login_required, current_user
-from models import db, User, Department, Doctor, Patient, Appointment, Treatment, DoctorAvailability
-from datetime import datetime, date
+from models import (db, User, Department, Doctor, Patient, Appointment, ArchivedAppointment, Treatment,
+                    DoctorAvailability)
+from datetime import datetime, date, timedelta
 from functools import wraps
+import queries
+from pagination import paginate
+from search import filter_matching, autocomplete
+from counters import dashboard_counts
+from availability import generate_from_rules, quarter_label, quarter_range
+from importer import KINDS, import_upload
+from exporter import EXPORT_FORMATS, available_formats, export_filename, stream_export
+from conditional import conditional, appointment_state
+import analytics
+from fanout import gather
+import os
 
 admin_bp = Blueprint('admin', __name__, url_prefix='/admin')
 
+MAX_ANALYTICS_DAYS = 366
+
 # Reuse this decorator
 
 def admin_required(f):
@@ -21,27 +36,23 @@ def admin_required(f):
 @login_required
 @admin_required
 def admin_dashboard():
-    total_doctors = Doctor.query.count()
-    total_patients = Patient.query.count()
-    total_appointments = Appointment.query.count()
-    upcoming_appointments = Appointment.query.filter(
-        Appointment.appointment_date >= date.today(),
-        Appointment.status == 'Booked'
-    ).count()
-    recent_appointments = Appointment.query.order_by(Appointment.created_at.desc()).limit(5).all()
-    return render_template('admin/dashboard.html',
-        total_doctors=total_doctors,
-        total_patients=total_patients,
-        total_appointments=total_appointments,
-        upcoming_appointments=upcoming_appointments,
-        recent_appointments=recent_appointments)
+    results = gather(
+        counts=dashboard_counts,
+        recent=lambda: queries.appointments_with_parties().order_by(Appointment.created_at.desc()).limit(5).all(),
+    )
+    return render_template('admin/dashboard.html', recent_appointments=results['recent'], **results['counts'])
 
 @admin_bp.route('/departments')
 @login_required
 @admin_required
 def admin_departments():
-    departments = Department.query.all()
-    return render_template('admin/departments.html', departments=departments)
+    departments = queries.departments()
+    doctor_counts = queries.department_doctor_counts()
+    current_quarter = quarter_label(date.today())
+    next_quarter = quarter_label(quarter_range(current_quarter)[1] + timedelta(days=1))
+    quarters = [current_quarter, next_quarter]
+    return render_template('admin/departments.html', departments=departments, doctor_counts=doctor_counts,
+                           quarters=quarters)
 
 @admin_bp.route('/department/add', methods=['GET','POST'])
 @login_required
@@ -99,20 +110,39 @@ def admin_delete_department(department_id):
     flash('Department deleted successfully!', 'success')
     return redirect(url_for('admin.admin_departments'))
 
+@admin_bp.route('/department/<int:department_id>/availability/generate', methods=['POST'])
+@login_required
+@admin_required
+def admin_generate_department_availability(department_id):
+    department = Department.query.get_or_404(department_id)
+    try:
+        start_date, end_date = quarter_range(request.form.get('quarter', ''))
+    except ValueError:
+        flash('Please select a valid quarter.', 'danger')
+        return redirect(url_for('admin.admin_departments'))
+    planned, written = generate_from_rules(start_date, end_date, department_id=department.id)
+    flash(f'{department.name}: generated {written} availability window(s) '
+          f'({planned - written} already present).', 'success')
+    return redirect(url_for('admin.admin_departments'))
+
 @admin_bp.route('/doctors')
 @login_required
 @admin_required
 def admin_doctors():
     search_query = request.args.get('search', '')
     if search_query:
-        doctors = Doctor.query.join(User).filter(
-            (Doctor.full_name.ilike(f'%{search_query}%')) |
-            (Doctor.specialization.ilike(f'%{search_query}%'))
-        ).all()
+        query = filter_matching(queries.doctors_with_department(), Doctor, search_query)
     else:
-        doctors = Doctor.query.all()
+        query = queries.doctors_with_department()
+    doctors = paginate(query, queries.DOCTOR_ORDER)
     return render_template('admin/doctors.html', doctors=doctors, search_query=search_query)
 
+@admin_bp.route('/doctors/autocomplete')
+@login_required
+@admin_required
+def admin_doctors_autocomplete():
+    return jsonify(autocomplete(Doctor, request.args.get('q', '')))
+
 @admin_bp.route('/doctor/add', methods=['GET', 'POST'])
 @login_required
 @admin_required
@@ -150,7 +180,7 @@ def admin_add_doctor():
         db.session.commit()
         flash('Doctor added successfully!', 'success')
         return redirect(url_for('admin.admin_doctors'))
-    departments = Department.query.all()
+    departments = queries.departments()
     return render_template('admin/add_doctor.html', departments=departments)
 
 @admin_bp.route('/doctor/edit/<int:doctor_id>', methods=['GET', 'POST'])
@@ -169,7 +199,7 @@ def admin_edit_doctor(doctor_id):
         db.session.commit()
         flash('Doctor updated successfully!', 'success')
         return redirect(url_for('admin.admin_doctors'))
-    departments = Department.query.all()
+    departments = queries.departments()
     return render_template('admin/edit_doctor.html', doctor=doctor, departments=departments)
 
 @admin_bp.route('/doctor/delete/<int:doctor_id>', methods=['POST'])
@@ -179,7 +209,8 @@ def admin_delete_doctor(doctor_id):
     doctor = Doctor.query.get_or_404(doctor_id)
     user = doctor.user
     # Check for related appointments
-    appointment_count = Appointment.query.filter_by(doctor_id=doctor_id).count()
+    appointment_count = (Appointment.query.filter_by(doctor_id=doctor_id).count()
+                         + ArchivedAppointment.query.filter_by(doctor_id=doctor_id).count())
     if appointment_count > 0:
         flash('Doctor has existing appointments and cannot be deleted. Please remove or reassign those appointments first.', 'danger')
         return redirect(url_for('admin.admin_doctors'))
@@ -197,14 +228,18 @@ def admin_delete_doctor(doctor_id):
 def admin_patients():
     search_query = request.args.get('search', '')
     if search_query:
-        patients = Patient.query.filter(
-            (Patient.full_name.ilike(f'%{search_query}%')) |
-            (Patient.contact_number.ilike(f'%{search_query}%'))
-        ).all()
+        query = filter_matching(queries.patients_with_user(), Patient, search_query)
     else:
-        patients = Patient.query.all()
+        query = queries.patients_with_user()
+    patients = paginate(query, queries.PATIENT_ORDER)
     return render_template('admin/patients.html', patients=patients, search_query=search_query)
 
+@admin_bp.route('/patients/autocomplete')
+@login_required
+@admin_required
+def admin_patients_autocomplete():
+    return jsonify(autocomplete(Patient, request.args.get('q', '')))
+
 @admin_bp.route('/patient/edit/<int:patient_id>', methods=['GET', 'POST'])
 @login_required
 @admin_required
@@ -239,6 +274,104 @@ def admin_delete_patient(patient_id):
 @admin_bp.route('/appointments')
 @login_required
 @admin_required
+@conditional(appointment_state)
 def admin_appointments():
-    appointments = Appointment.query.order_by(Appointment.appointment_date.desc(), Appointment.appointment_time.desc()).all()
-    return render_template('admin/appointments.html', appointments=appointments)
+    appointments = paginate(queries.appointments_with_parties(), queries.APPOINTMENT_ORDER)
+    return render_template('admin/appointments.html', appointments=appointments,
+                           export_formats=available_formats())
+
+@admin_bp.route('/appointments/export')
+@login_required
+@admin_required
+def admin_export_appointments():
+    fmt = request.args.get('format', 'csv')
+    compress = request.args.get('gzip') == '1'
+    statuses = [status for status in request.args.getlist('status') if status]
+    try:
+        start_date = datetime.strptime(request.args['start'], '%Y-%m-%d').date() if request.args.get('start') else None
+        end_date = datetime.strptime(request.args['end'], '%Y-%m-%d').date() if request.args.get('end') else None
+        chunks = stream_export(fmt, start_date, end_date, statuses, compress)
+    except ValueError:
+        flash('Invalid export format or date range.', 'danger')
+        return redirect(url_for('admin.admin_appointments'))
+    filename = export_filename(fmt, compress)
+    mimetype = 'application/gzip' if compress and fmt != 'parquet' else EXPORT_FORMATS[fmt]
+    return Response(stream_with_context(chunks), mimetype=mimetype,
+                    headers={'Content-Disposition': f'attachment; filename={filename}'})
+
+@admin_bp.route('/analytics')
+@login_required
+@admin_required
+def admin_analytics():
+    start_date, end_date = analytics.default_range()
+    try:
+        if request.args.get('start'):
+            start_date = datetime.strptime(request.args['start'], '%Y-%m-%d').date()
+        if request.args.get('end'):
+            end_date = datetime.strptime(request.args['end'], '%Y-%m-%d').date()
+    except ValueError:
+        flash('Invalid date range.', 'danger')
+        return redirect(url_for('admin.admin_analytics'))
+    if end_date < start_date or (end_date - start_date).days >= MAX_ANALYTICS_DAYS:
+        flash(f'Pick a range of at most {MAX_ANALYTICS_DAYS} days.', 'danger')
+        return redirect(url_for('admin.admin_analytics'))
+    department_id = request.args.get('department', type=int)
+    departments = queries.departments()
+    department_summaries = analytics.department_summaries(start_date, end_date, department_id)
+    doctor_summaries = analytics.doctor_summaries(start_date, end_date, department_id,
+                                                  limit=current_app.config['PAGE_SIZE'])
+    doctor_names = dict(db.session.query(Doctor.id, Doctor.full_name).filter(
+        Doctor.id.in_([summary.key for summary in doctor_summaries])).all()) if doctor_summaries else {}
+    return render_template('admin/analytics.html', start_date=start_date, end_date=end_date,
+                           department_id=department_id, departments=departments,
+                           department_names={department.id: department.name for department in departments},
+                           department_summaries=department_summaries, doctor_summaries=doctor_summaries,
+                           doctor_names=doctor_names,
+                           hours=analytics.hourly_load(start_date, end_date, department_id),
+                           pending_days=analytics.pending_days())
+
+@admin_bp.route('/analytics/refresh', methods=['POST'])
+@login_required
+@admin_required
+def admin_refresh_analytics():
+    with db.engine.begin() as connection:
+        days = analytics.refresh(connection)
+    flash(f'Analytics rebuilt for {days} changed day(s).', 'success')
+    return redirect(url_for('admin.admin_analytics', **request.args))
+
+def import_reports_dir():
+    return os.path.join(current_app.instance_path, 'imports')
+
+@admin_bp.route('/import', methods=['GET', 'POST'])
+@login_required
+@admin_required
+def admin_import():
+    if request.method == 'POST':
+        kind = request.form.get('kind')
+        upload = request.files.get('file')
+        if kind not in KINDS or not upload or not upload.filename:
+            flash('Please choose what to import and a CSV or NDJSON file.', 'danger')
+            return redirect(url_for('admin.admin_import'))
+        os.makedirs(import_reports_dir(), exist_ok=True)
+        report_name = f'{kind}-{datetime.now():%Y%m%d-%H%M%S}-rejects.csv'
+        report_path = os.path.join(import_reports_dir(), report_name)
+        try:
+            with open(report_path, 'w', newline='') as report:
+                result = import_upload(kind, upload, report)
+        except (ValueError, UnicodeDecodeError) as error:
+            os.remove(report_path)
+            flash(f'Could not read the file: {error}', 'danger')
+            return redirect(url_for('admin.admin_import'))
+        if not result.rejected:
+            os.remove(report_path)
+            report_name = None
+        flash(f'Imported {result.imported} of {result.read} {kind} '
+              f'({result.rows_per_second:,.0f} rows/s).', 'success' if not result.rejected else 'warning')
+        return render_template('admin/import.html', kinds=KINDS, result=result, report_name=report_name)
+    return render_template('admin/import.html', kinds=KINDS, result=None, report_name=None)
+
+@admin_bp.route('/import/reports/<path:report_name>')
+@login_required
+@admin_required
+def admin_import_report(report_name):
+    return send_from_directory(import_reports_dir(), report_name, as_attachment=True)
@@ -0,0 +1,306 @@
+import click
+from collections import namedtuple
+from datetime import date, timedelta
+from flask import current_app
+from flask.cli import with_appcontext
+from sqlalchemy import and_, case, event, exists, extract, func, inspect, or_, union_all
+from sqlalchemy.orm import Session, aliased, object_session
+from models import (db, Doctor, DoctorAvailability, Appointment, ArchivedAppointment, AppointmentRollup,
+                    DepartmentRollup, AvailabilityRollup, RollupDirtyDay)
+
+# Daily analytics rollups. appointment_rollups counts appointments per day,
+# doctor, hour and status (with the doctor's department and how many of them
+# were a patient's first visit); department_rollups sums those per
+# department, so hospital-wide figures over long ranges stay cheap;
+# availability_rollups holds each doctor's open availability minutes per
+# day. The analytics page reads only these.
+#
+# Rollups are rebuilt a day at a time, entirely in SQL: each day is deleted
+# and re-inserted from one INSERT ... SELECT ... GROUP BY, so no rows pass
+# through Python. Writes to appointments and availability record the days
+# they touched in rollup_dirty_days inside the same flush;
+# `flask analytics-refresh` (run from cron, or Refresh on the page) rebuilds
+# just those days. `flask analytics-backfill` rebuilds a date range and is
+# safe to re-run. A first visit only counts as such once the patient's
+# earlier appointments are in, so a backfill also settles those counts
+# after an import of historical appointments.
+
+BACKFILL_DAYS = 31
+DAY_CHUNK = 500  # days per IN list
+DEFAULT_RANGE_DAYS = 30
+
+appointment_rollups = AppointmentRollup.__table__
+department_rollups = DepartmentRollup.__table__
+availability_rollups = AvailabilityRollup.__table__
+dirty_days = RollupDirtyDay.__table__
+
+# Source rows: the date column and the columns whose change moves a rollup.
+SOURCES = {
+    Appointment: ('appointment_date', ('appointment_date', 'appointment_time', 'status', 'doctor_id', 'patient_id')),
+    DoctorAvailability: ('date', ('date', 'start_time', 'end_time', 'is_available', 'doctor_id')),
+}
+
+
+def _mark(session, connection, days):
+    marked = session.info.setdefault('rollup_days', set()) if session is not None else set()
+    fresh = {day for day in days if day is not None} - marked
+    if fresh:
+        connection.execute(dirty_days.insert(), [{'day': day} for day in sorted(fresh)])
+        marked.update(fresh)
+
+
+def mark_days(session, days):
+    # For writes that bypass the mapper events (bulk INSERTs).
+    _mark(session, session.connection(), days)
+
+
+def _source_written(mapper, connection, target):
+    date_column, _ = SOURCES[mapper.class_]
+    _mark(object_session(target), connection, {getattr(target, date_column)})
+
+
+def _source_updated(mapper, connection, target):
+    date_column, watched = SOURCES[mapper.class_]
+    state = inspect(target)
+    if not any(state.attrs[name].history.has_changes() for name in watched):
+        return
+    days = {getattr(target, date_column)}
+    days.update(state.attrs[date_column].history.deleted)
+    _mark(object_session(target), connection, days)
+
+
+for _model in SOURCES:
+    event.listen(_model, 'after_insert', _source_written)
+    event.listen(_model, 'after_delete', _source_written)
+    event.listen(_model, 'after_update', _source_updated)
+
+
+@event.listens_for(Session, 'after_commit')
+@event.listens_for(Session, 'after_rollback')
+def _forget_marked(session):
+    session.info.pop('rollup_days', None)
+
+
+def _minutes(column):
+    return extract('hour', column) * 60 + extract('minute', column)
+
+
+def _scheduled(connection):
+    # Appointments live in `appointments` and, once archived (archive.py), in
+    # `appointments_archive`; the rollups count both. The archive table is
+    # missing while older migrations run.
+    if inspect(connection).has_table(ArchivedAppointment.__tablename__):
+        return (Appointment, ArchivedAppointment)
+    return (Appointment,)
+
+
+def _earlier_visit(model, row):
+    earlier = aliased(model)
+    return exists().where(
+        earlier.patient_id == row.patient_id,
+        or_(earlier.appointment_date < row.appointment_date,
+            and_(earlier.appointment_date == row.appointment_date, earlier.id < row.id)))
+
+
+def appointment_rollup_select(within, models=(Appointment,)):
+    # The day filter goes into each arm of the UNION ALL so both tables are
+    # read through their date indexes.
+    arms = [db.select(model.id, model.patient_id, model.doctor_id, model.appointment_date, model.appointment_time,
+                      model.status).where(within(model.appointment_date)) for model in models]
+    row = (union_all(*arms) if len(arms) > 1 else arms[0]).subquery('scheduled').c
+    first_visit = ~or_(*[_earlier_visit(model, row) for model in models])
+    hour = extract('hour', row.appointment_time)
+    return db.select(
+        row.appointment_date, row.doctor_id, Doctor.department_id, hour, row.status,
+        func.count(row.id), func.sum(case((first_visit, 1), else_=0))
+    ).join(Doctor, Doctor.id == row.doctor_id).group_by(
+        row.appointment_date, row.doctor_id, Doctor.department_id, hour, row.status)
+
+
+def department_rollup_select(where):
+    R = appointment_rollups.c
+    return db.select(R.day, R.department_id, R.hour, R.status, func.sum(R.appointments),
+                     func.sum(R.new_patients)).where(where).group_by(R.day, R.department_id, R.hour, R.status)
+
+
+def availability_rollup_select(where):
+    minutes = _minutes(DoctorAvailability.end_time) - _minutes(DoctorAvailability.start_time)
+    return db.select(
+        DoctorAvailability.date, DoctorAvailability.doctor_id, Doctor.department_id, func.sum(minutes)
+    ).join(Doctor, Doctor.id == DoctorAvailability.doctor_id).where(
+        where, DoctorAvailability.is_available.is_(True)
+    ).group_by(DoctorAvailability.date, DoctorAvailability.doctor_id, Doctor.department_id)
+
+
+def _rebuild(connection, within):
+    # within(date_column) selects the days to rebuild.
+    for table in (appointment_rollups, department_rollups, availability_rollups):
+        connection.execute(table.delete().where(within(table.c.day)))
+    connection.execute(appointment_rollups.insert().from_select(
+        ['day', 'doctor_id', 'department_id', 'hour', 'status', 'appointments', 'new_patients'],
+        appointment_rollup_select(within, _scheduled(connection))))
+    connection.execute(department_rollups.insert().from_select(
+        ['day', 'department_id', 'hour', 'status', 'appointments', 'new_patients'],
+        department_rollup_select(within(appointment_rollups.c.day))))
+    connection.execute(availability_rollups.insert().from_select(
+        ['day', 'doctor_id', 'department_id', 'available_minutes'],
+        availability_rollup_select(within(DoctorAvailability.date))))
+
+
+def rebuild_days(connection, days):
+    days = sorted(days)
+    for offset in range(0, len(days), DAY_CHUNK):
+        chunk = days[offset:offset + DAY_CHUNK]
+        _rebuild(connection, lambda column: column.in_(chunk))
+
+
+def rebuild_range(connection, start_date, end_date):
+    connection.execute(dirty_days.delete().where(dirty_days.c.day.between(start_date, end_date)))
+    _rebuild(connection, lambda column: column.between(start_date, end_date))
+
+
+def refresh(connection):
+    # Marks are cleared before their days are rebuilt (here and in
+    # rebuild_range), so a write committing meanwhile is either seen by the
+    # rebuild or leaves a fresh mark.
+    days = [day for day, in connection.execute(db.select(dirty_days.c.day).distinct())]
+    for offset in range(0, len(days), DAY_CHUNK):
+        connection.execute(dirty_days.delete().where(dirty_days.c.day.in_(days[offset:offset + DAY_CHUNK])))
+    rebuild_days(connection, days)
+    return len(days)
+
+
+def pending_days():
+    return db.session.query(func.count(func.distinct(RollupDirtyDay.day))).scalar() or 0
+
+
+def source_range(connection):
+    days = []
+    for column in [model.appointment_date for model in _scheduled(connection)] + [DoctorAvailability.date]:
+        days.extend(day for day in connection.execute(db.select(func.min(column), func.max(column))).one()
+                    if day is not None)
+    return (min(days), max(days)) if days else (None, None)
+
+
+def backfill(engine, start_date=None, end_date=None, days_per_batch=BACKFILL_DAYS, progress=None):
+    # One transaction per batch of days; re-running simply rebuilds them.
+    with engine.connect() as connection:
+        first, last = source_range(connection)
+    start_date = start_date or first
+    end_date = end_date or last
+    if start_date is None or end_date is None:
+        return 0
+    day = start_date
+    while day <= end_date:
+        batch_end = min(day + timedelta(days=days_per_batch - 1), end_date)
+        with engine.begin() as connection:
+            rebuild_range(connection, day, batch_end)
+        if progress:
+            progress(day, batch_end)
+        day = batch_end + timedelta(days=1)
+    return (end_date - start_date).days + 1
+
+
+# Reading the rollups for the analytics page.
+
+Summary = namedtuple('Summary', 'key appointments completed cancelled booked new_patients available_minutes '
+                                'busiest_hour completion_rate cancellation_rate utilization')
+
+
+def _rate(count, total):
+    return count / total if total else None
+
+
+def _summarize(R, key, start_date, end_date, department_id=None, limit=None):
+    # Totals per R.<key> over [start_date, end_date], biggest first, with the
+    # availability and busiest hour of the groups returned.
+    group_column = getattr(R, key)
+    filters = [R.day.between(start_date, end_date)]
+    if department_id:
+        filters.append(R.department_id == department_id)
+
+    def by_status(status):
+        return func.sum(case((R.status == status, R.appointments), else_=0))
+
+    total = func.sum(R.appointments)
+    query = db.session.query(group_column, total, by_status('Completed'), by_status('Cancelled'),
+                             by_status('Booked'), func.sum(R.new_patients)).filter(*filters).group_by(
+        group_column).order_by(total.desc(), group_column)
+    if limit:
+        query = query.limit(limit)
+    rows = query.all()
+    keys = [row[0] for row in rows]
+    if not keys:
+        return []
+
+    A = AvailabilityRollup
+    availability_column = getattr(A, key)
+    minutes = dict(db.session.query(availability_column, func.sum(A.available_minutes)).filter(
+        availability_column.in_(keys), A.day.between(start_date, end_date)).group_by(availability_column).all())
+
+    busiest = {}
+    hourly = db.session.query(group_column, R.hour, func.sum(R.appointments)).filter(
+        group_column.in_(keys), R.status != 'Cancelled', *filters).group_by(group_column, R.hour)
+    for group, hour, count in hourly:
+        if count > busiest.get(group, (None, 0))[1]:
+            busiest[group] = (hour, count)
+
+    slot_minutes = current_app.config.get('SLOT_MINUTES', 15)
+    summaries = []
+    for group, appointments, completed, cancelled, booked, new_patients in rows:
+        available = minutes.get(group) or 0
+        summaries.append(Summary(
+            group, appointments, completed, cancelled, booked, new_patients, available,
+            busiest.get(group, (None, 0))[0], _rate(completed, appointments), _rate(cancelled, appointments),
+            _rate((completed + booked) * slot_minutes, available)))
+    return summaries
+
+
+def department_summaries(start_date, end_date, department_id=None):
+    return _summarize(DepartmentRollup, 'department_id', start_date, end_date, department_id)
+
+
+def doctor_summaries(start_date, end_date, department_id=None, limit=None):
+    return _summarize(AppointmentRollup, 'doctor_id', start_date, end_date, department_id, limit)
+
+
+def hourly_load(start_date, end_date, department_id=None):
+    R = DepartmentRollup
+    query = db.session.query(R.hour, func.sum(R.appointments)).filter(
+        R.day.between(start_date, end_date), R.status != 'Cancelled')
+    if department_id:
+        query = query.filter(R.department_id == department_id)
+    return query.group_by(R.hour).order_by(R.hour).all()
+
+
+def default_range(today=None):
+    today = today or date.today()
+    return today - timedelta(days=DEFAULT_RANGE_DAYS - 1), today
+
+
+@click.command('analytics-refresh')
+@with_appcontext
+def analytics_refresh_command():
+    """Rebuild the analytics rollups of days changed since the last refresh."""
+    with db.engine.begin() as connection:
+        days = refresh(connection)
+    click.echo(f'{days} day(s) of analytics rollups rebuilt.')
+
+
+@click.command('analytics-backfill')
+@click.option('--from', 'start_date', type=click.DateTime(['%Y-%m-%d']), help='First day (default: earliest data).')
+@click.option('--to', 'end_date', type=click.DateTime(['%Y-%m-%d']), help='Last day (default: latest data).')
+@click.option('--days-per-batch', default=BACKFILL_DAYS, show_default=True, help='Days rebuilt per transaction.')
+@with_appcontext
+def analytics_backfill_command(start_date, end_date, days_per_batch):
+    """Rebuild the analytics rollups for a date range; safe to re-run."""
+    def progress(first, last):
+        click.echo(f'  {first} to {last}')
+    days = backfill(db.engine, start_date and start_date.date(), end_date and end_date.date(), days_per_batch,
+                    progress)
+    click.echo(f'{days} day(s) of analytics rollups rebuilt.')
+
+
+def init_analytics(app):
+    app.cli.add_command(analytics_refresh_command)
+    app.cli.add_command(analytics_backfill_command)
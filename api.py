@@ -0,0 +1,412 @@
+from datetime import date, datetime, time, timedelta
+from functools import wraps
+from urllib.parse import parse_qsl, urlsplit
+from flask import Blueprint, current_app, jsonify, request, url_for
+from flask_login import current_user
+from sqlalchemy import union
+from werkzeug.datastructures import MultiDict
+from werkzeug.exceptions import HTTPException
+from models import (db, Department, Doctor, Patient, Appointment, Treatment, DoctorAvailability, ArchivedAppointment,
+                    ArchivedTreatment)
+from pagination import DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE, keyset_paginate
+from scheduling import next_free_slots
+from search import filter_matching
+
+api_bp = Blueprint('api', __name__, url_prefix='/api/v1')
+
+# Read-only JSON API for the mobile app and kiosk, authenticated by the same
+# session as the HTML views and scoped the same way (patients see their own
+# appointments, doctors their own patients). Every list takes
+#   ?fields=a,b        sparse fieldset; joins only the tables those fields need
+#   ?limit=N&cursor=C  keyset paging; "links.next" carries the next cursor
+# plus its own filters. Rows are selected as plain column tuples and turned
+# straight into JSON objects, never loaded as ORM instances. POST /batch runs
+# up to API_BATCH_LIMIT of these GETs in one round trip. Appointments and
+# treatments moved to the archive (archive.py) are listed with ?archived=1;
+# fetching one by id finds it in either place.
+
+DEFAULT_BATCH_LIMIT = 20
+MAX_AVAILABILITY_DAYS = 31
+
+READERS = {}
+
+
+class ApiError(Exception):
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+        self.message = message
+
+
+class Resource:
+    # fields: name -> column; joins: name -> (model, onclause) needed by it.
+    def __init__(self, name, model, fields, order, joins=None, default_fields=None):
+        self.name = name
+        self.model = model
+        self.fields = fields
+        self.order = order
+        self.joins = joins or {}
+        self.default_fields = default_fields or list(fields)
+
+    def select(self, names):
+        keys = list(dict.fromkeys(names + [column.key for column, _ in self.order]))
+        query = db.session.query(*[self.fields[key].label(key) for key in keys]).select_from(self.model)
+        joins = {}
+        for key in keys:
+            if key in self.joins:
+                model, onclause = self.joins[key]
+                joins.setdefault(model, onclause)
+        for model, onclause in joins.items():
+            query = query.join(model, onclause)
+        return query
+
+
+def _json_value(value):
+    if isinstance(value, (date, datetime, time)):
+        return value.isoformat()
+    return value
+
+
+def serialize(rows, names):
+    return [{name: _json_value(getattr(row, name)) for name in names} for row in rows]
+
+
+def requested_fields(resource, args):
+    value = args.get('fields')
+    if not value:
+        return list(resource.default_fields)
+    names = [name.strip() for name in value.split(',') if name.strip()]
+    unknown = [name for name in names if name not in resource.fields]
+    if unknown:
+        raise ApiError(400, f"Unknown {resource.name} field(s): {', '.join(unknown)}")
+    return names
+
+
+def _limit(args):
+    default = current_app.config.get('PAGE_SIZE', DEFAULT_PAGE_SIZE)
+    limit = args.get('limit', default, type=int)
+    return max(1, min(limit, current_app.config.get('MAX_PAGE_SIZE', MAX_PAGE_SIZE)))
+
+
+def _date_arg(args, name, default=None):
+    value = args.get(name)
+    if not value:
+        return default
+    try:
+        return date.fromisoformat(value)
+    except ValueError:
+        raise ApiError(400, f'{name} must be a YYYY-MM-DD date')
+
+
+def list_rows(resource, query, args, endpoint, view_args):
+    names = requested_fields(resource, args)
+    page = keyset_paginate(query(names), resource.order, cursor=args.get('cursor'), per_page=_limit(args))
+    # Every value of the list's own filters; path variables and url_for's
+    # _external/_anchor/... options are not the client's to set.
+    params = {key: values for key, values in args.to_dict(flat=False).items()
+              if key != 'cursor' and key not in view_args and not key.startswith('_')}
+    links = {
+        'next': url_for(endpoint, **view_args, **params, cursor=page.next_cursor) if page.has_next else None,
+        'prev': url_for(endpoint, **view_args, **params, cursor=page.prev_cursor) if page.has_prev else None,
+    }
+    return {'data': serialize(page.items, names), 'links': links}
+
+
+def get_row(resource, query, args, row_id):
+    names = requested_fields(resource, args)
+    row = query(names).filter(resource.model.id == row_id).first()
+    if row is None:
+        raise ApiError(404, f'{resource.name} {row_id} not found')
+    return {'data': serialize([row], names)[0]}
+
+
+# Scopes: what the signed-in user may read.
+
+def _appointment_scope(query, model=Appointment):
+    if current_user.role == 'doctor':
+        return query.filter(model.doctor_id == current_user.doctor_id)
+    if current_user.role == 'patient':
+        return query.filter(model.patient_id == current_user.patient_id)
+    return query
+
+
+def _patient_scope(query):
+    if current_user.role == 'doctor':
+        # Patients the doctor has seen, including visits since archived.
+        seen = union(*[db.select(model.patient_id).where(model.doctor_id == current_user.doctor_id)
+                       for model in (Appointment, ArchivedAppointment)])
+        return query.filter(Patient.id.in_(seen))
+    if current_user.role == 'patient':
+        return query.filter(Patient.id == current_user.patient_id)
+    return query
+
+
+DOCTORS = Resource('doctor', Doctor, {
+    'id': Doctor.id,
+    'full_name': Doctor.full_name,
+    'specialization': Doctor.specialization,
+    'qualification': Doctor.qualification,
+    'experience_years': Doctor.experience_years,
+    'department_id': Doctor.department_id,
+    'department_name': Department.name,
+}, [(Doctor.id, False)], joins={'department_name': (Department, Department.id == Doctor.department_id)})
+
+AVAILABILITY = Resource('availability', DoctorAvailability, {
+    'id': DoctorAvailability.id,
+    'doctor_id': DoctorAvailability.doctor_id,
+    'date': DoctorAvailability.date,
+    'start_time': DoctorAvailability.start_time,
+    'end_time': DoctorAvailability.end_time,
+}, [(DoctorAvailability.date, False), (DoctorAvailability.start_time, False), (DoctorAvailability.id, False)])
+
+def _appointments(model):
+    return Resource('appointment', model, {
+        'id': model.id,
+        'patient_id': model.patient_id,
+        'patient_name': Patient.full_name,
+        'doctor_id': model.doctor_id,
+        'doctor_name': Doctor.full_name,
+        'appointment_date': model.appointment_date,
+        'appointment_time': model.appointment_time,
+        'status': model.status,
+        'reason': model.reason,
+        'updated_at': model.updated_at,
+    }, [(model.appointment_date, True), (model.appointment_time, True), (model.id, True)], joins={
+        'patient_name': (Patient, Patient.id == model.patient_id),
+        'doctor_name': (Doctor, Doctor.id == model.doctor_id),
+    })
+
+
+def _treatments(model):
+    return Resource('treatment', model, {
+        'id': model.id,
+        'appointment_id': model.appointment_id,
+        'diagnosis': model.diagnosis,
+        'prescription': model.prescription,
+        'notes': model.notes,
+        'created_at': model.created_at,
+        'updated_at': model.updated_at,
+    }, [(model.id, True)])
+
+
+APPOINTMENTS = _appointments(Appointment)
+TREATMENTS = _treatments(Treatment)
+ARCHIVED_APPOINTMENTS = _appointments(ArchivedAppointment)
+ARCHIVED_TREATMENTS = _treatments(ArchivedTreatment)
+
+PATIENTS = Resource('patient', Patient, {
+    'id': Patient.id,
+    'full_name': Patient.full_name,
+    'date_of_birth': Patient.date_of_birth,
+    'gender': Patient.gender,
+    'contact_number': Patient.contact_number,
+    'address': Patient.address,
+    'blood_group': Patient.blood_group,
+    'emergency_contact': Patient.emergency_contact,
+}, [(Patient.id, False)])
+
+
+def _api_login_required(view):
+    @wraps(view)
+    def wrapped(*args, **kwargs):
+        if not current_user.is_authenticated:
+            return jsonify(error='Sign in first.'), 401
+        return view(*args, **kwargs)
+    return wrapped
+
+
+def reader(rule):
+    # Registers a GET endpoint and makes it callable from /batch.
+    def register(fn):
+        endpoint = f'{api_bp.name}.{fn.__name__}'
+        READERS[endpoint] = fn
+
+        @wraps(fn)
+        def view(**view_args):
+            return jsonify(fn(request.args, **view_args))
+
+        api_bp.add_url_rule(rule, fn.__name__, _api_login_required(view), methods=['GET'])
+        return fn
+    return register
+
+
+@reader('/doctors')
+def doctors(args):
+    def query(names):
+        rows = DOCTORS.select(names)
+        if args.getlist('department', type=int):
+            rows = rows.filter(Doctor.department_id.in_(args.getlist('department', type=int)))
+        if args.get('search'):
+            rows = filter_matching(rows, Doctor, args['search'])
+        return rows
+    return list_rows(DOCTORS, query, args, 'api.doctors', {})
+
+
+@reader('/doctors/<int:doctor_id>')
+def doctor(args, doctor_id):
+    return get_row(DOCTORS, DOCTORS.select, args, doctor_id)
+
+
+@reader('/doctors/<int:doctor_id>/availability')
+def doctor_availability(args, doctor_id):
+    start = _date_arg(args, 'from', date.today())
+    end = _date_arg(args, 'to', start + timedelta(days=7))
+    if (end - start).days > MAX_AVAILABILITY_DAYS:
+        raise ApiError(400, f'At most {MAX_AVAILABILITY_DAYS} days at a time')
+
+    def query(names):
+        return AVAILABILITY.select(names).filter(
+            DoctorAvailability.doctor_id == doctor_id,
+            DoctorAvailability.date >= start,
+            DoctorAvailability.date <= end,
+            DoctorAvailability.is_available.is_(True))
+    return list_rows(AVAILABILITY, query, args, 'api.doctor_availability', {'doctor_id': doctor_id})
+
+
+@reader('/doctors/<int:doctor_id>/slots')
+def doctor_slots(args, doctor_id):
+    days = max(1, min(args.get('days', 7, type=int), MAX_AVAILABILITY_DAYS))
+    slots = next_free_slots([doctor_id], days=days, limit=_limit(args))
+    return {'data': [{'date': slot['date'].isoformat(), 'time': slot['time'].strftime('%H:%M')} for slot in slots]}
+
+
+def _archived(args):
+    return args.get('archived', '').lower() in ('1', 'true', 'yes')
+
+
+def _get_hot_or_archived(hot, archived, row_id):
+    try:
+        return hot(row_id)
+    except ApiError as error:
+        if error.status != 404:
+            raise
+        return archived(row_id)
+
+
+@reader('/appointments')
+def appointments(args):
+    resource = ARCHIVED_APPOINTMENTS if _archived(args) else APPOINTMENTS
+    model = resource.model
+    statuses = args.getlist('status')
+    start = _date_arg(args, 'from')
+    end = _date_arg(args, 'to')
+
+    def query(names):
+        rows = _appointment_scope(resource.select(names), model)
+        if statuses:
+            rows = rows.filter(model.status.in_(statuses))
+        if start:
+            rows = rows.filter(model.appointment_date >= start)
+        if end:
+            rows = rows.filter(model.appointment_date <= end)
+        for name, column in (('doctor', model.doctor_id), ('patient', model.patient_id)):
+            if args.getlist(name, type=int):
+                rows = rows.filter(column.in_(args.getlist(name, type=int)))
+        return rows
+    return list_rows(resource, query, args, 'api.appointments', {})
+
+
+@reader('/appointments/<int:appointment_id>')
+def appointment(args, appointment_id):
+    def read(resource):
+        return lambda row_id: get_row(
+            resource, lambda names: _appointment_scope(resource.select(names), resource.model), args, row_id)
+    return _get_hot_or_archived(read(APPOINTMENTS), read(ARCHIVED_APPOINTMENTS), appointment_id)
+
+
+def _treatment_query(resource, appointment, names):
+    rows = resource.select(names)
+    if current_user.role != 'admin':
+        rows = _appointment_scope(rows.join(appointment, appointment.id == resource.model.appointment_id),
+                                  appointment)
+    return rows
+
+
+@reader('/treatments')
+def treatments(args):
+    archived = _archived(args)
+    resource, appointment = (ARCHIVED_TREATMENTS, ArchivedAppointment) if archived else (TREATMENTS, Appointment)
+
+    def query(names):
+        rows = _treatment_query(resource, appointment, names)
+        if args.getlist('appointment', type=int):
+            rows = rows.filter(resource.model.appointment_id.in_(args.getlist('appointment', type=int)))
+        return rows
+    return list_rows(resource, query, args, 'api.treatments', {})
+
+
+@reader('/treatments/<int:treatment_id>')
+def treatment(args, treatment_id):
+    def read(resource, appointment):
+        return lambda row_id: get_row(
+            resource, lambda names: _treatment_query(resource, appointment, names), args, row_id)
+    return _get_hot_or_archived(read(TREATMENTS, Appointment), read(ARCHIVED_TREATMENTS, ArchivedAppointment),
+                                treatment_id)
+
+
+@reader('/patients')
+def patients(args):
+    def query(names):
+        rows = _patient_scope(PATIENTS.select(names))
+        if args.get('search'):
+            rows = filter_matching(rows, Patient, args['search'])
+        return rows
+    return list_rows(PATIENTS, query, args, 'api.patients', {})
+
+
+@reader('/patients/<int:patient_id>')
+def patient(args, patient_id):
+    return get_row(PATIENTS, lambda names: _patient_scope(PATIENTS.select(names)), args, patient_id)
+
+
+def _run_read(path):
+    parts = urlsplit(path)
+    adapter = current_app.url_map.bind('', url_scheme=request.scheme)
+    try:
+        endpoint, view_args = adapter.match(parts.path, method='GET')
+    except HTTPException:
+        raise ApiError(404, f'No API resource at {parts.path}')
+    if endpoint not in READERS:
+        raise ApiError(400, f'{parts.path} cannot be batched')
+    return READERS[endpoint](MultiDict(parse_qsl(parts.query, keep_blank_values=True)), **view_args)
+
+
+@api_bp.route('/batch', methods=['POST'])
+@_api_login_required
+def batch():
+    """{"requests": [{"id": "doctors", "path": "/api/v1/doctors?fields=id,full_name"}, ...]}"""
+    payload = request.get_json(silent=True)
+    if not isinstance(payload, dict):
+        raise ApiError(400, 'Expected a JSON object')
+    items = payload.get('requests')
+    limit = current_app.config.get('API_BATCH_LIMIT', DEFAULT_BATCH_LIMIT)
+    if not isinstance(items, list) or not items:
+        raise ApiError(400, 'Expected {"requests": [{"id": ..., "path": ...}, ...]}')
+    if len(items) > limit:
+        raise ApiError(400, f'At most {limit} requests per batch')
+    responses = {}
+    for number, item in enumerate(items):
+        item_id = str(item.get('id', number)) if isinstance(item, dict) else str(number)
+        path = item.get('path') if isinstance(item, dict) else item
+        try:
+            if not isinstance(path, str):
+                raise ApiError(400, 'Each request needs a path')
+            responses[item_id] = {'status': 200, 'body': _run_read(path)}
+        except ApiError as error:
+            responses[item_id] = {'status': error.status, 'body': {'error': error.message}}
+        except Exception:
+            # One failing read must not sink the rest of the batch.
+            current_app.logger.exception('Batched API read %s failed', path)
+            db.session.rollback()
+            responses[item_id] = {'status': 500, 'body': {'error': 'Internal error'}}
+    return jsonify(responses=responses)
+
+
+@api_bp.errorhandler(ApiError)
+def api_error(error):
+    return jsonify(error=error.message), error.status
+
+
+@api_bp.errorhandler(HTTPException)
+def http_error(error):
+    return jsonify(error=error.description), error.code
@@ -1,98 +1,133 @@
 from flask import Flask, render_template, request, redirect, url_for, flash
 from flask_login import LoginManager, login_user, logout_user, login_required, current_user
-from flask_wtf.csrf import CSRFProtect
-from models import (
-    db,
-    User,
-    Department,
-    Doctor,
-    Patient,
-    Appointment,
-    Treatment,
-    DoctorAvailability
-)
+from flask_wtf.csrf import CSRFProtect, generate_csrf
+from models import db, User, Patient
+from passwords import PasswordHashBusy
+from replicas import replica_binds
 from datetime import datetime
 import os
 
-# Import blueprints
-from admin_routes import admin_bp
-from patient_routes import patient_bp
-from doctor_routes import doctor_bp
 
-
-
-app = Flask(__name__)
-
-app.config['SECRET_KEY'] = os.environ.get(
-    'SESSION_SECRET',
-    'dev-secret-key-change-in-production'
-)
-
-
-basedir = os.path.abspath(os.path.dirname(__file__))
-
-if os.environ.get("DATABASE_URL"):
-    app.config['SQLALCHEMY_DATABASE_URI'] = os.environ.get("DATABASE_URL")
-else:
-    app.config['SQLALCHEMY_DATABASE_URI'] = f"sqlite:///{os.path.join(basedir, 'hospital.db')}"
-
-
-if app.config['SQLALCHEMY_DATABASE_URI'].startswith("postgres://"):
-    app.config['SQLALCHEMY_DATABASE_URI'] = app.config[
-        'SQLALCHEMY_DATABASE_URI'
-    ].replace("postgres://", "postgresql://", 1)
-
-app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
-
-
-db.init_app(app)
-
-csrf = CSRFProtect(app)
+csrf = CSRFProtect()
 
 login_manager = LoginManager()
-login_manager.init_app(app)
 login_manager.login_view = 'login'
 
 
+def create_app(config=None):
+    # Building the app touches no database: schema setup and the admin seed
+    # are the `flask init-db` / `flask seed-admin` commands.
+    app = Flask(__name__)
 
-@login_manager.user_loader
-def load_user(user_id):
-    return User.query.get(int(user_id))
-
-
-@app.context_processor
-def inject_csrf_token():
-    from flask_wtf.csrf import generate_csrf
-    return dict(csrf_token=generate_csrf())
-
+    app.config['SECRET_KEY'] = os.environ.get(
+        'SESSION_SECRET',
+        'dev-secret-key-change-in-production'
+    )
 
-with app.app_context():
-    db.create_all()
+    basedir = os.path.abspath(os.path.dirname(__file__))
 
-    # Create default admin user
-    if not User.query.filter_by(role='admin').first():
-        admin_user = User(
-            username='admin',
-            email='admin@hospital.com',
-            role='admin'
-        )
-        admin_user.set_password('admin123')
-        db.session.add(admin_user)
-        db.session.commit()
-        print("✅ Admin user created (admin / admin123)")
+    if os.environ.get("DATABASE_URL"):
+        app.config['SQLALCHEMY_DATABASE_URI'] = os.environ.get("DATABASE_URL")
     else:
-        print("ℹ️ Admin user already exists")
+        app.config['SQLALCHEMY_DATABASE_URI'] = f"sqlite:///{os.path.join(basedir, 'hospital.db')}"
+
+    if app.config['SQLALCHEMY_DATABASE_URI'].startswith("postgres://"):
+        app.config['SQLALCHEMY_DATABASE_URI'] = app.config[
+            'SQLALCHEMY_DATABASE_URI'
+        ].replace("postgres://", "postgresql://", 1)
+
+    app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+    app.config['SQLALCHEMY_BINDS'] = replica_binds(os.environ.get('DATABASE_REPLICA_URLS', ''))
+    app.config['REPLICA_MAX_LAG_SECONDS'] = float(os.environ.get('REPLICA_MAX_LAG_SECONDS', 10))
+    app.config['REPLICA_LAG_CHECK_SECONDS'] = float(os.environ.get('REPLICA_LAG_CHECK_SECONDS', 5))
+    app.config['REPLICA_READ_YOUR_WRITES_SECONDS'] = float(os.environ.get('REPLICA_READ_YOUR_WRITES_SECONDS', 10))
+    app.config['PAGE_SIZE'] = int(os.environ.get('PAGE_SIZE', 50))
+    app.config['SLOT_MINUTES'] = int(os.environ.get('SLOT_MINUTES', 15))
+    app.config['IDENTITY_CACHE_TTL'] = int(os.environ.get('IDENTITY_CACHE_TTL', 60))
+    app.config['PASSWORD_HASH_METHOD'] = os.environ.get('PASSWORD_HASH_METHOD', 'scrypt')
+    app.config['PASSWORD_HASH_CONCURRENCY'] = int(os.environ.get('PASSWORD_HASH_CONCURRENCY', 0)) or None
+    app.config['CACHE_BACKEND'] = os.environ.get('CACHE_BACKEND', 'memory')
+    app.config['CACHE_TTL'] = int(os.environ.get('CACHE_TTL', 300))
+    app.config['CACHE_PATH'] = os.environ.get('CACHE_PATH')
+    app.config['METRICS_ENABLED'] = os.environ.get('METRICS_ENABLED', 'true').lower() in ('1', 'true', 'yes', 'on')
+    app.config['METRICS_TOKEN'] = os.environ.get('METRICS_TOKEN')
+    app.config['SLOW_QUERY_MS'] = float(os.environ.get('SLOW_QUERY_MS', 200))
+    app.config['API_BATCH_LIMIT'] = int(os.environ.get('API_BATCH_LIMIT', 20))
+    fanout_threads = os.environ.get('QUERY_FANOUT_THREADS')
+    app.config['QUERY_FANOUT_THREADS'] = int(fanout_threads) if fanout_threads else None
+    app.config['QUERY_FANOUT_ASYNC'] = os.environ.get('QUERY_FANOUT_ASYNC', 'true').lower() in ('1', 'true', 'yes', 'on')
+    app.config['ARCHIVE_AFTER_DAYS'] = int(os.environ.get('ARCHIVE_AFTER_DAYS', 365))
+    app.config['ARCHIVE_BATCH_SIZE'] = int(os.environ.get('ARCHIVE_BATCH_SIZE', 1000))
+    if config:
+        app.config.update(config)
+
+    # Imported here so importing this module stays cheap for tools that
+    # only need create_app.
+    from database import configure_engine, init_engine
+    from metrics import init_metrics
+    from replicas import init_replicas
+    from search import init_search
+    from migrations import init_migrations
+    from plan_check import check_plans_command
+    from counters import init_counters
+    from availability import init_availability
+    from analytics import init_analytics
+    from archive import init_archive
+    from timeline import init_timeline
+    from importer import init_importer
+    from exporter import init_exporter
+    from cli import init_cli
+    from identity import init_identity
+    from cache import init_cache
+    from fanout import init_fanout
+    from passwords import init_passwords
+    from admin_routes import admin_bp
+    from patient_routes import patient_bp
+    from doctor_routes import doctor_bp
+    from api import api_bp
+
+    configure_engine(app)
+    db.init_app(app)
+    init_engine(app)
+    init_metrics(app, db)
+    init_replicas(app, db)
+    init_search(app)
+    init_migrations(app)
+    init_counters(app)
+    init_availability(app)
+    init_analytics(app)
+    init_archive(app)
+    init_timeline(app)
+    init_importer(app)
+    init_exporter(app)
+    init_cli(app)
+    app.cli.add_command(check_plans_command)
+
+    csrf.init_app(app)
+    login_manager.init_app(app)
+    init_identity(app, login_manager)
+    init_cache(app)
+    init_fanout(app)
+    init_passwords(app)
+    app.context_processor(inject_csrf_token)
+
+    app.add_url_rule('/', 'index', index)
+    app.add_url_rule('/login', 'login', login, methods=['GET', 'POST'])
+    app.add_url_rule('/register', 'register', register, methods=['GET', 'POST'])
+    app.add_url_rule('/logout', 'logout', logout)
+
+    app.register_blueprint(admin_bp)
+    app.register_blueprint(patient_bp)
+    app.register_blueprint(doctor_bp)
+    app.register_blueprint(api_bp)
+    csrf.exempt(api_bp)  # read-only: its one POST (batch) only runs GETs
+    return app
 
-    print("📊 Database Ready")
-    print(f"Users: {User.query.count()}")
-    print(f"Patients: {Patient.query.count()}")
-    print(f"Doctors: {Doctor.query.count()}")
-    print(f"Departments: {Department.query.count()}")
-    print(f"Appointments: {Appointment.query.count()}")
 
+def inject_csrf_token():
+    return dict(csrf_token=generate_csrf())
 
 
-@app.route('/')
 def index():
     if current_user.is_authenticated:
         if current_user.role == 'admin':
@@ -104,7 +139,6 @@ def index():
     return render_template('index.html')
 
 
-@app.route('/login', methods=['GET', 'POST'])
 def login():
     if current_user.is_authenticated:
         return redirect(url_for('index'))
@@ -115,7 +149,19 @@ def login():
 
         user = User.query.filter_by(username=username).first()
 
-        if user and user.check_password(password) and user.is_active:
+        try:
+            valid = user is not None and user.check_password(password)
+        except PasswordHashBusy:
+            flash('The server is busy signing people in. Please try again in a moment.', 'warning')
+            return render_template('login.html'), 503
+
+        if valid and user.is_active:
+            if user.password_needs_rehash():
+                try:
+                    user.set_password(password)
+                    db.session.commit()
+                except PasswordHashBusy:
+                    pass  # keep the old hash; it is upgraded on a later sign-in
             login_user(user)
             flash(f'Welcome back, {user.username}!', 'success')
             return redirect(url_for('index'))
@@ -125,7 +171,6 @@ def login():
     return render_template('login.html')
 
 
-@app.route('/register', methods=['GET', 'POST'])
 def register():
     if current_user.is_authenticated:
         return redirect(url_for('index'))
@@ -154,7 +199,11 @@ def register():
             email=email,
             role='patient'
         )
-        user.set_password(password)
+        try:
+            user.set_password(password)
+        except PasswordHashBusy:
+            flash('The server is busy right now. Please try registering again in a moment.', 'warning')
+            return redirect(url_for('register'))
         db.session.add(user)
         db.session.flush()
 
@@ -178,7 +227,6 @@ def register():
     return render_template('register.html')
 
 
-@app.route('/logout')
 @login_required
 def logout():
     logout_user()
@@ -187,13 +235,15 @@ def logout():
 
 
 
-app.register_blueprint(admin_bp)
-app.register_blueprint(patient_bp)
-app.register_blueprint(doctor_bp)
+app = create_app()
 
 
 # ------------------------
 # Local Development
 # ------------------------
 if __name__ == '__main__':
+    from cli import init_database, seed_admin
+    with app.app_context():
+        init_database()
+        seed_admin()
     app.run(host='0.0.0.0', port=5000, debug=True)
@@ -0,0 +1,122 @@
+import click
+import time
+from datetime import date, timedelta
+from flask import current_app
+from flask.cli import with_appcontext
+from sqlalchemy import and_, func
+from models import db, Appointment, Treatment, ArchivedAppointment, ArchivedTreatment
+import counters
+
+# Hot/cold archival. Completed and cancelled appointments dated more than
+# ARCHIVE_AFTER_DAYS ago move, with their treatments, from `appointments` and
+# `treatments` into `appointments_archive` and `treatments_archive`, keeping
+# their ids, so the tables every booking, dashboard and week view query
+# reads stay the size of the live schedule. `flask archive-appointments`
+# (run from cron) moves ARCHIVE_BATCH_SIZE appointments per transaction:
+# copy with INSERT ... SELECT, then delete, so a failed batch leaves its rows
+# where they were. The history pages read the patient timeline (timeline.py),
+# which keeps archived visits.
+#
+# Archived rows stay in the dashboard counters and analytics rollups, which
+# count appointments ever made. The statements bypass the mapper events, so
+# the batch bumps the reference_changed stamp itself: moving rows does not
+# always change the count or newest updated_at the page validators see.
+#
+# On Postgres both archive tables are range partitioned by appointment_date,
+# one partition per year, created as batches reach into a new year; old
+# years can be detached or dropped as a unit.
+
+STATUSES = ('Completed', 'Cancelled')
+
+appointments = Appointment.__table__
+treatments = Treatment.__table__
+appointments_archive = ArchivedAppointment.__table__
+treatments_archive = ArchivedTreatment.__table__
+
+APPOINTMENT_COLUMNS = ['id', 'appointment_date', 'patient_id', 'doctor_id', 'appointment_time', 'status', 'reason',
+                       'created_at', 'updated_at']
+TREATMENT_COLUMNS = ['id', 'appointment_id', 'diagnosis', 'prescription', 'notes', 'created_at', 'updated_at']
+
+
+def cutoff_date(days=None, today=None):
+    days = current_app.config.get('ARCHIVE_AFTER_DAYS', 365) if days is None else days
+    return (today or date.today()) - timedelta(days=days)
+
+
+def ensure_partitions(connection, first_day, last_day):
+    if connection.dialect.name != 'postgresql':
+        return
+    for year in range(first_day.year, last_day.year + 1):
+        for table in (appointments_archive, treatments_archive):
+            connection.exec_driver_sql(
+                f'CREATE TABLE IF NOT EXISTS {table.name}_{year} PARTITION OF {table.name} '
+                f"FOR VALUES FROM ('{year}-01-01') TO ('{year + 1}-01-01')")
+
+
+def _eligible(cutoff):
+    return and_(Appointment.status.in_(STATUSES), Appointment.appointment_date < cutoff)
+
+
+def archive_batch(connection, cutoff, batch_size):
+    # SQLite hands out max(rowid) + 1 as the next id, so archiving the newest
+    # appointment or treatment would let a later row reuse its id; those
+    # stay hot until something newer exists.
+    newest_appointment = db.select(func.max(Appointment.id)).scalar_subquery()
+    newest_treatment_owner = db.select(Treatment.appointment_id).where(
+        Treatment.id == db.select(func.max(Treatment.id)).scalar_subquery()).scalar_subquery()
+    rows = connection.execute(
+        db.select(Appointment.id, Appointment.appointment_date).where(
+            _eligible(cutoff), Appointment.id < newest_appointment,
+            Appointment.id != func.coalesce(newest_treatment_owner, 0)
+        ).limit(batch_size).with_for_update(skip_locked=True)).all()
+    if not rows:
+        return 0
+    ids = [row.id for row in rows]
+    ensure_partitions(connection, min(row.appointment_date for row in rows),
+                      max(row.appointment_date for row in rows))
+    # The eligibility test is repeated so a row changed since it was picked
+    # stays hot.
+    moving = and_(Appointment.id.in_(ids), _eligible(cutoff))
+    connection.execute(appointments_archive.insert().from_select(
+        APPOINTMENT_COLUMNS, db.select(*[appointments.c[name] for name in APPOINTMENT_COLUMNS]).where(moving)))
+    connection.execute(treatments_archive.insert().from_select(
+        TREATMENT_COLUMNS + ['appointment_date'],
+        db.select(*[treatments.c[name] for name in TREATMENT_COLUMNS], Appointment.appointment_date).join(
+            Appointment, Appointment.id == Treatment.appointment_id).where(moving)))
+    connection.execute(treatments.delete().where(
+        Treatment.appointment_id.in_(db.select(Appointment.id).where(moving))))
+    moved = connection.execute(appointments.delete().where(moving)).rowcount
+    counters.stamp(connection, counters.REFERENCE_CHANGED, int(time.time()))
+    return moved
+
+
+def archive(engine, cutoff, batch_size, progress=None):
+    # One transaction per batch; stops at the first empty one.
+    total = 0
+    while True:
+        with engine.begin() as connection:
+            moved = archive_batch(connection, cutoff, batch_size)
+        if not moved:
+            return total
+        total += moved
+        if progress:
+            progress(total)
+
+
+@click.command('archive-appointments')
+@click.option('--older-than', 'days', type=int, help='Age in days (default: ARCHIVE_AFTER_DAYS).')
+@click.option('--batch-size', type=int, help='Appointments per transaction (default: ARCHIVE_BATCH_SIZE).')
+@with_appcontext
+def archive_appointments_command(days, batch_size):
+    """Move old completed and cancelled appointments to the archive tables."""
+    cutoff = cutoff_date(days)
+    batch_size = batch_size or current_app.config.get('ARCHIVE_BATCH_SIZE', 1000)
+
+    def progress(total):
+        click.echo(f'  {total} moved')
+    moved = archive(db.engine, cutoff, batch_size, progress)
+    click.echo(f'{moved} appointment(s) dated before {cutoff} archived.')
+
+
+def init_archive(app):
+    app.cli.add_command(archive_appointments_command)
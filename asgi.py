@@ -0,0 +1,41 @@
+import asyncio
+from asgiref.sync import sync_to_async
+from asgiref.wsgi import WsgiToAsgi, WsgiToAsgiInstance
+from app import app
+from fanout import EVENT_LOOP, init_async_fanout
+
+# ASGI entry point next to the WSGI `app`: `uvicorn asgi:application`.
+# Each request runs the Flask app on a worker thread of the server's event
+# loop (asgiref's default would run every request on one shared thread), and
+# the loop is handed to the request in the WSGI environ so fanout.gather()
+# can run dashboard queries on it with async sessions.
+
+
+class _Request(WsgiToAsgiInstance):
+    # The same WSGI call, rewrapped so requests run in parallel.
+    run_wsgi_app = sync_to_async(vars(WsgiToAsgiInstance)['run_wsgi_app'].func, thread_sensitive=False)
+
+    async def __call__(self, scope, receive, send):
+        self.loop = asyncio.get_running_loop()
+        await super().__call__(scope, receive, send)
+
+    def build_environ(self, scope, body):
+        environ = super().build_environ(scope, body)
+        environ[EVENT_LOOP] = self.loop
+        return environ
+
+
+class FlaskAsgi(WsgiToAsgi):
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'lifespan':
+            # Nothing to start or stop; acknowledge so servers don't warn.
+            while True:
+                message = await receive()
+                await send({'type': message['type'] + '.complete'})
+                if message['type'] == 'lifespan.shutdown':
+                    return
+        await _Request(self.wsgi_application, self.duplicate_header_limit)(scope, receive, send)
+
+
+init_async_fanout(app)
+application = FlaskAsgi(app)
@@ -0,0 +1,132 @@
+import click
+from flask.cli import with_appcontext
+from sqlalchemy import func
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.orm import aliased
+from models import db, Doctor, DoctorAvailability, AvailabilityRule
+from analytics import mark_days
+from datetime import date, timedelta
+
+# SQLite caps bound parameters per statement; five columns per window keeps
+# each multi-row INSERT well below the limit.
+INSERT_CHUNK = 1000
+
+
+def upcoming_availability(doctor_ids, days=7, per_doctor=None):
+    # Open availability windows for the next `days` days for every doctor in
+    # doctor_ids, fetched in a single query and grouped by doctor id. With
+    # per_doctor set, only the earliest N windows of each doctor are returned.
+    doctor_ids = list(doctor_ids)
+    slots = {doctor_id: [] for doctor_id in doctor_ids}
+    if not doctor_ids:
+        return slots
+    today = date.today()
+    window_end = today + timedelta(days=days)
+    filters = (
+        DoctorAvailability.doctor_id.in_(doctor_ids),
+        DoctorAvailability.date >= today,
+        DoctorAvailability.date <= window_end,
+        DoctorAvailability.is_available == True
+    )
+    if per_doctor:
+        rank = func.row_number().over(
+            partition_by=DoctorAvailability.doctor_id,
+            order_by=(DoctorAvailability.date, DoctorAvailability.start_time)
+        ).label('rank')
+        ranked = db.select(DoctorAvailability, rank).filter(*filters).subquery()
+        slot = aliased(DoctorAvailability, ranked)
+        query = db.session.query(slot).filter(ranked.c.rank <= per_doctor).order_by(
+            slot.doctor_id, slot.date, slot.start_time)
+    else:
+        query = DoctorAvailability.query.filter(*filters).order_by(
+            DoctorAvailability.doctor_id, DoctorAvailability.date, DoctorAvailability.start_time)
+    for availability in query:
+        slots[availability.doctor_id].append(availability)
+    return slots
+
+
+def quarter_range(label):
+    # "2026-Q4" -> (date(2026, 10, 1), date(2026, 12, 31))
+    year, quarter = label.upper().split('-Q')
+    year, quarter = int(year), int(quarter)
+    if quarter not in (1, 2, 3, 4):
+        raise ValueError(f'Invalid quarter: {label}')
+    start = date(year, 3 * quarter - 2, 1)
+    end = date(year + 1, 1, 1) if quarter == 4 else date(year, 3 * quarter + 1, 1)
+    return start, end - timedelta(days=1)
+
+
+def quarter_label(day):
+    return f'{day.year}-Q{(day.month - 1) // 3 + 1}'
+
+
+def expand_rules(rules, start_date, end_date):
+    # One availability window per rule occurrence inside [start_date, end_date].
+    windows = []
+    for rule in rules:
+        first = max(start_date, rule.valid_from)
+        last = min(end_date, rule.valid_until)
+        if first > last:
+            continue
+        skipped = rule.exception_dates
+        day = first + timedelta(days=(rule.weekday - first.weekday()) % 7)
+        while day <= last:
+            if day not in skipped:
+                windows.append({
+                    'doctor_id': rule.doctor_id,
+                    'date': day,
+                    'start_time': rule.start_time,
+                    'end_time': rule.end_time,
+                    'is_available': True,
+                })
+            day += timedelta(days=7)
+    return windows
+
+
+def insert_windows(windows):
+    # Multi-row INSERT that skips windows already present under
+    # _doctor_date_time_uc. Returns the number of rows written.
+    if not windows:
+        return 0
+    dialect = db.session.get_bind().dialect.name
+    insert = postgresql.insert if dialect == 'postgresql' else sqlite.insert
+    table = DoctorAvailability.__table__
+    written = 0
+    for offset in range(0, len(windows), INSERT_CHUNK):
+        statement = insert(table).values(windows[offset:offset + INSERT_CHUNK]).on_conflict_do_nothing(
+            index_elements=['doctor_id', 'date', 'start_time'])
+        written += db.session.execute(statement).rowcount
+    if written:
+        mark_days(db.session, {window['date'] for window in windows})
+    return written
+
+
+def generate_from_rules(start_date, end_date, doctor_ids=None, department_id=None):
+    query = AvailabilityRule.query.filter(
+        AvailabilityRule.valid_from <= end_date,
+        AvailabilityRule.valid_until >= start_date
+    )
+    if doctor_ids is not None:
+        query = query.filter(AvailabilityRule.doctor_id.in_(doctor_ids))
+    if department_id is not None:
+        query = query.join(Doctor).filter(Doctor.department_id == department_id)
+    windows = expand_rules(query.all(), start_date, end_date)
+    written = insert_windows(windows)
+    db.session.commit()
+    return len(windows), written
+
+
+@click.command('availability-generate')
+@click.option('--quarter', help='Quarter to generate, e.g. 2026-Q4 (defaults to the current quarter).')
+@click.option('--department', 'department_id', type=int, help='Only doctors of this department.')
+@with_appcontext
+def availability_generate_command(quarter, department_id):
+    """Materialize doctor availability from recurring rules."""
+    start_date, end_date = quarter_range(quarter or quarter_label(date.today()))
+    planned, written = generate_from_rules(start_date, end_date, department_id=department_id)
+    click.echo(f'{written} availability windows created ({planned - written} already present) '
+               f'for {start_date} to {end_date}.')
+
+
+def init_availability(app):
+    app.cli.add_command(availability_generate_command)
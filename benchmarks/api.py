@@ -0,0 +1,120 @@
+"""JSON API against the HTML views that show the same rows.
+
+Usage: python -m benchmarks.api [--requests 50] [--warmup 3] [--scale small]
+
+Signs in as an admin, a doctor and a patient (the fixtures `flask
+db-check-plans` uses) and times each /api/v1 list next to the page a client
+would otherwise scrape for it: median latency, SQL statements and response
+bytes per request, full rows and with a sparse fieldset. Also compares three
+API reads made one by one with the same reads sent as one POST /batch.
+Uses DATABASE_URL if set, otherwise a throwaway SQLite database seeded by
+benchmarks.seed at --scale.
+"""
+import argparse
+import os
+import statistics
+import tempfile
+import time
+
+
+def parse_args():
+    from benchmarks.seed import SCALES
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--requests', type=int, default=50, help='timed requests per URL')
+    parser.add_argument('--warmup', type=int, default=3)
+    parser.add_argument('--scale', choices=sorted(SCALES), default='small',
+                        help='dataset to seed when DATABASE_URL is not set')
+    return parser.parse_args()
+
+
+def timed(send, args, statements):
+    for _ in range(args.warmup):
+        send().close()
+    samples = []
+    size = 0
+    statements.clear()
+    for _ in range(args.requests):
+        start = time.perf_counter()
+        response = send()
+        size = len(response.get_data())
+        samples.append(time.perf_counter() - start)
+        response.close()
+    return statistics.median(samples) * 1000, len(statements) / args.requests, size
+
+
+def pairs(role):
+    from flask import url_for
+    appointment_fields = 'id,appointment_date,appointment_time,status,'
+    if role == 'admin':
+        yield url_for('admin.admin_appointments'), url_for('api.appointments'), appointment_fields + 'reason'
+        yield url_for('admin.admin_patients'), url_for('api.patients'), 'id,full_name,contact_number'
+        yield url_for('admin.admin_doctors'), url_for('api.doctors'), 'id,full_name,department_name'
+    elif role == 'doctor':
+        yield url_for('doctor.doctor_appointments'), url_for('api.appointments'), appointment_fields + 'patient_name'
+    else:
+        yield url_for('patient.patient_doctors'), url_for('api.doctors'), 'id,full_name,specialization'
+        yield url_for('patient.patient_appointments'), url_for('api.appointments'), appointment_fields + 'doctor_name'
+        yield url_for('patient.patient_history'), url_for('api.treatments'), 'id,appointment_id,diagnosis'
+
+
+def batch_paths(role):
+    from flask import url_for
+    paths = [url_for('api.appointments', status='Booked', limit=10),
+             url_for('api.appointments', status='Completed', limit=10)]
+    paths.append(url_for('api.doctors', limit=10) if role == 'patient' else url_for('api.patients', limit=10))
+    return paths
+
+
+def main():
+    args = parse_args()
+    seeded = not os.environ.get('DATABASE_URL')
+    if seeded:
+        path = os.path.join(tempfile.mkdtemp(prefix='hms-api-bench-'), 'bench.db')
+        os.environ['DATABASE_URL'] = f'sqlite:///{path}'
+    from sqlalchemy import event
+    from sqlalchemy.engine import Engine
+    from app import app
+    from cli import init_database, seed_admin
+    from models import db, User, Department, Doctor, Patient, DoctorAvailability, Appointment, Treatment
+    from plan_check import role_fixtures, sign_in
+    from benchmarks.seed import seed, rebuild_derived, volumes
+
+    with app.app_context():
+        init_database()
+        seed_admin()
+        if seeded:
+            seed(db, (User, Department, Doctor, Patient, DoctorAvailability, Appointment, Treatment),
+                 volumes(args.scale))
+            rebuild_derived(db)
+    with app.test_request_context():
+        fixtures = role_fixtures()
+        urls = {role: (list(pairs(role)), batch_paths(role)) for role in fixtures}
+
+    statements = []
+
+    def count(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    event.listen(Engine, 'before_cursor_execute', count)
+    print(f"{'role':<9}{'request':<62}{'ms':>8}{'queries':>9}{'bytes':>10}")
+    try:
+        for role, (user, _) in fixtures.items():
+            client = app.test_client()
+            sign_in(client, user)
+            pages, paths = urls[role]
+            for html_url, api_url, fields in pages:
+                for url in (html_url, api_url, f'{api_url}?fields={fields}'):
+                    ms, queries, size = timed(lambda: client.get(url), args, statements)
+                    print(f'{role:<9}{url:<62}{ms:>8.2f}{queries:>9.1f}{size:>10}')
+            separate = [timed(lambda: client.get(path), args, statements) for path in paths]
+            print(f"{role:<9}{f'{len(paths)} separate API reads':<62}{sum(r[0] for r in separate):>8.2f}"
+                  f"{sum(r[1] for r in separate):>9.1f}{sum(r[2] for r in separate):>10}")
+            body = {'requests': [{'id': str(number), 'path': path} for number, path in enumerate(paths)]}
+            ms, queries, size = timed(lambda: client.post('/api/v1/batch', json=body), args, statements)
+            print(f"{role:<9}{f'POST /api/v1/batch ({len(paths)} reads)':<62}{ms:>8.2f}{queries:>9.1f}{size:>10}")
+    finally:
+        event.remove(Engine, 'before_cursor_execute', count)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,142 @@
+"""Multi-threaded booking stress test: throughput and double-booking check.
+
+Usage: python -m benchmarks.booking [--threads 16] [--attempts 2000] [--doctors 20]
+
+Creates doctors with one availability window each for tomorrow, then has
+--threads workers race to claim random 15-minute slots through
+booking.claim_slot. Reports bookings/sec and verifies that no slot ended up
+with more than one active appointment.
+"""
+import argparse
+import os
+import random
+import tempfile
+import threading
+import time
+from datetime import date, datetime, timedelta
+
+SLOT_MINUTES = 15
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--threads', type=int, default=16)
+    parser.add_argument('--attempts', type=int, default=2000, help='total booking attempts across threads')
+    parser.add_argument('--doctors', type=int, default=20)
+    parser.add_argument('--patients', type=int, default=200)
+    parser.add_argument('--cancel-rate', type=float, default=0.1,
+                        help='fraction of successful bookings cancelled again, freeing the slot')
+    return parser.parse_args()
+
+
+def setup(db, models, args, day):
+    User, Department, Doctor, Patient, DoctorAvailability = models
+    department = Department(name=f'Benchmark {time.time_ns()}')
+    db.session.add(department)
+    db.session.flush()
+    doctor_ids, patient_ids = [], []
+    for i in range(args.doctors):
+        user = User(username=f'bench-doc-{department.id}-{i}', email=f'bench-doc-{department.id}-{i}@example.com',
+                    password_hash='!', role='doctor')
+        db.session.add(user)
+        db.session.flush()
+        doctor = Doctor(user_id=user.id, full_name=f'Bench Doctor {i}', department_id=department.id,
+                        specialization='General')
+        db.session.add(doctor)
+        db.session.flush()
+        db.session.add(DoctorAvailability(doctor_id=doctor.id, date=day,
+                                          start_time=datetime.strptime('09:00', '%H:%M').time(),
+                                          end_time=datetime.strptime('17:00', '%H:%M').time()))
+        doctor_ids.append(doctor.id)
+    for i in range(args.patients):
+        user = User(username=f'bench-pat-{department.id}-{i}', email=f'bench-pat-{department.id}-{i}@example.com',
+                    password_hash='!', role='patient')
+        db.session.add(user)
+        db.session.flush()
+        patient = Patient(user_id=user.id, full_name=f'Bench Patient {i}')
+        db.session.add(patient)
+        db.session.flush()
+        patient_ids.append(patient.id)
+    db.session.commit()
+    return doctor_ids, patient_ids
+
+
+def slot_times():
+    start = datetime.combine(date.today(), datetime.strptime('09:00', '%H:%M').time())
+    return [(start + timedelta(minutes=SLOT_MINUTES * i)).time() for i in range(8 * 60 // SLOT_MINUTES)]
+
+
+def main():
+    args = parse_args()
+    if not os.environ.get('DATABASE_URL'):
+        path = os.path.join(tempfile.mkdtemp(prefix='hms-booking-bench-'), 'bench.db')
+        os.environ['DATABASE_URL'] = f'sqlite:///{path}'
+    from app import app
+    from cli import init_database
+    from models import db, User, Department, Doctor, Patient, Appointment, DoctorAvailability
+    from booking import claim_slot, SlotTaken
+    from sqlalchemy import func
+
+    day = date.today() + timedelta(days=1)
+    with app.app_context():
+        init_database()
+        doctor_ids, patient_ids = setup(db, (User, Department, Doctor, Patient, DoctorAvailability), args, day)
+    times = slot_times()
+    per_thread = args.attempts // args.threads
+    stats = {'booked': 0, 'taken': 0, 'errors': 0}
+    lock = threading.Lock()
+    barrier = threading.Barrier(args.threads)
+
+    def worker(seed):
+        rng = random.Random(seed)
+        booked = taken = errors = 0
+        with app.app_context():
+            barrier.wait()
+            for _ in range(per_thread):
+                try:
+                    appointment = claim_slot(rng.choice(patient_ids), rng.choice(doctor_ids), day, rng.choice(times))
+                    booked += 1
+                    if rng.random() < args.cancel_rate:
+                        appointment.status = 'Cancelled'
+                        db.session.commit()
+                except SlotTaken:
+                    taken += 1
+                except Exception:
+                    db.session.rollback()
+                    errors += 1
+        with lock:
+            stats['booked'] += booked
+            stats['taken'] += taken
+            stats['errors'] += errors
+
+    threads = [threading.Thread(target=worker, args=(i,)) for i in range(args.threads)]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+
+    with app.app_context():
+        doubles = db.session.query(
+            Appointment.doctor_id, Appointment.appointment_date, Appointment.appointment_time
+        ).filter(
+            Appointment.doctor_id.in_(doctor_ids), Appointment.status != 'Cancelled'
+        ).group_by(
+            Appointment.doctor_id, Appointment.appointment_date, Appointment.appointment_time
+        ).having(func.count(Appointment.id) > 1).count()
+
+    attempts = per_thread * args.threads
+    print(f"Database:        {app.config['SQLALCHEMY_DATABASE_URI'].split('://')[0]}")
+    print(f'Threads:         {args.threads}')
+    print(f'Attempts:        {attempts} in {elapsed:.2f}s ({attempts / elapsed:.0f} attempts/sec)')
+    print(f"Booked:          {stats['booked']} ({stats['booked'] / elapsed:.0f} bookings/sec)")
+    print(f"Slot conflicts:  {stats['taken']}")
+    print(f"Errors:          {stats['errors']}")
+    print(f'Double bookings: {doubles}')
+    if doubles:
+        raise SystemExit(1)
+
+
+if __name__ == '__main__':
+    main()
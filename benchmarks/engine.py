@@ -0,0 +1,140 @@
+"""Concurrent read/write throughput for each SQLite engine setting.
+
+Usage: python -m benchmarks.engine [--writers 4] [--readers 8] [--seconds 5]
+
+For every setting a fresh SQLite database is built; writer threads book
+appointments (each a transaction that also bumps the dashboard counters)
+while reader threads load the dashboard counters and a page of
+appointments. Reports writes/s, reads/s and "database is locked" errors.
+"""
+import argparse
+import itertools
+import os
+import tempfile
+import threading
+import time
+from datetime import date, time as clock, timedelta
+
+SETTINGS = [
+    ('rollback journal, no busy wait', {'SQLITE_JOURNAL_MODE': 'delete', 'SQLITE_SYNCHRONOUS': 'full',
+                                        'SQLITE_BUSY_TIMEOUT_MS': 0, 'SQLITE_MMAP_SIZE': 0,
+                                        'SQLITE_CACHE_SIZE': -2000}),
+    ('rollback journal (old default)', {'SQLITE_JOURNAL_MODE': 'delete', 'SQLITE_SYNCHRONOUS': 'full',
+                                        'SQLITE_BUSY_TIMEOUT_MS': 5000, 'SQLITE_MMAP_SIZE': 0,
+                                        'SQLITE_CACHE_SIZE': -2000}),
+    ('wal, synchronous=full', {'SQLITE_JOURNAL_MODE': 'wal', 'SQLITE_SYNCHRONOUS': 'full',
+                               'SQLITE_MMAP_SIZE': 0, 'SQLITE_CACHE_SIZE': -2000}),
+    ('wal, synchronous=normal', {'SQLITE_JOURNAL_MODE': 'wal', 'SQLITE_SYNCHRONOUS': 'normal',
+                                 'SQLITE_MMAP_SIZE': 0, 'SQLITE_CACHE_SIZE': -2000}),
+    ('wal, normal, mmap + cache (default)', {}),
+]
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--writers', type=int, default=4)
+    parser.add_argument('--readers', type=int, default=8)
+    parser.add_argument('--seconds', type=float, default=5.0)
+    parser.add_argument('--doctors', type=int, default=20)
+    return parser.parse_args()
+
+
+def setup(app, doctors):
+    from cli import init_database
+    from models import db, User, Department, Doctor, Patient
+    with app.app_context():
+        init_database()
+        db.session.add(Department(id=1, name='Bench'))
+        db.session.execute(db.insert(User), [
+            {'id': 1000 + i, 'username': f'engine{i}', 'email': f'engine{i}@example.com', 'password_hash': '!',
+             'role': 'doctor' if i < doctors else 'patient'} for i in range(doctors + 1)])
+        db.session.execute(db.insert(Doctor), [
+            {'id': i + 1, 'user_id': 1000 + i, 'full_name': f'Doctor {i}', 'department_id': 1,
+             'specialization': 'General'} for i in range(doctors)])
+        db.session.add(Patient(id=1, user_id=1000 + doctors, full_name='Bench Patient'))
+        db.session.commit()
+
+
+def run(app, args):
+    from sqlalchemy.exc import OperationalError
+    from models import db, Appointment
+    from counters import dashboard_counts
+    import queries
+
+    slots = itertools.count()
+    slot_lock = threading.Lock()
+    stop = time.perf_counter() + args.seconds
+    totals = {'writes': 0, 'reads': 0, 'locked': 0}
+    totals_lock = threading.Lock()
+
+    def next_slot():
+        with slot_lock:
+            number = next(slots)
+        minutes = number // args.doctors
+        day = date.today() + timedelta(days=1 + minutes // (24 * 60))
+        return number % args.doctors + 1, day, clock(minutes % (24 * 60) // 60, minutes % 60)
+
+    def writer():
+        writes = locked = 0
+        with app.app_context():
+            while time.perf_counter() < stop:
+                doctor_id, day, slot_time = next_slot()
+                db.session.add(Appointment(patient_id=1, doctor_id=doctor_id, appointment_date=day,
+                                           appointment_time=slot_time, status='Booked'))
+                try:
+                    db.session.commit()
+                    writes += 1
+                except OperationalError:
+                    db.session.rollback()
+                    locked += 1
+        with totals_lock:
+            totals['writes'] += writes
+            totals['locked'] += locked
+
+    def reader():
+        reads = locked = 0
+        with app.app_context():
+            while time.perf_counter() < stop:
+                try:
+                    dashboard_counts()
+                    queries.appointments_with_parties().order_by(Appointment.id.desc()).limit(50).all()
+                    reads += 1
+                except OperationalError:
+                    locked += 1
+                db.session.rollback()
+        with totals_lock:
+            totals['reads'] += reads
+            totals['locked'] += locked
+
+    threads = [threading.Thread(target=writer) for _ in range(args.writers)] + \
+              [threading.Thread(target=reader) for _ in range(args.readers)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return totals
+
+
+def main():
+    args = parse_args()
+    directory = tempfile.mkdtemp(prefix='hms-engine-bench-')
+    os.environ['DATABASE_URL'] = f'sqlite:///{os.path.join(directory, "unused.db")}'
+    from app import create_app
+
+    print(f"{'setting':<38}{'writes/s':>10}{'reads/s':>10}{'locked':>8}")
+    for number, (name, overrides) in enumerate(SETTINGS):
+        config = {'SQLALCHEMY_DATABASE_URI': f'sqlite:///{os.path.join(directory, f"bench{number}.db")}',
+                  'DB_POOL_SIZE': args.writers + args.readers}
+        config.update(overrides)
+        app = create_app(config)
+        setup(app, args.doctors)
+        totals = run(app, args)
+        with app.app_context():
+            from models import db
+            db.engine.dispose()
+        print(f"{name:<38}{totals['writes'] / args.seconds:>10.0f}{totals['reads'] / args.seconds:>10.0f}"
+              f"{totals['locked']:>8}")
+
+
+if __name__ == '__main__':
+    main()
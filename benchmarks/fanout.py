@@ -0,0 +1,162 @@
+"""Dashboard latency with and without query fan-out over a slow network.
+
+Usage: python -m benchmarks.fanout [--requests 30] [--delays 0,2,5,10] [--threads 4] [--scale small]
+
+Stands in for a database across the network by holding every statement
+for --delays milliseconds before it reaches the (local) database, the way a
+latency-injecting proxy in front of Postgres would. On the sync engines the
+wait releases the GIL like a driver blocked on its socket; on the async
+engines it yields to the event loop like an async driver awaiting one. For
+each delay it times the admin, doctor and patient dashboards three ways and
+prints the median latencies side by side:
+
+  in order   WSGI, QUERY_FANOUT_THREADS=0
+  threads    WSGI, QUERY_FANOUT_THREADS=--threads (the sync server fallback)
+  async      the ASGI entry point (asgi.py), async sessions on its loop
+
+Uses DATABASE_URL if set, otherwise a throwaway SQLite database seeded by
+benchmarks.seed at --scale.
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import tempfile
+import threading
+import time
+
+DASHBOARDS = {'admin': 'admin.admin_dashboard', 'doctor': 'doctor.doctor_dashboard',
+              'patient': 'patient.patient_dashboard'}
+
+
+def parse_args():
+    from benchmarks.seed import SCALES
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--requests', type=int, default=30, help='timed requests per dashboard and setting')
+    parser.add_argument('--warmup', type=int, default=3)
+    parser.add_argument('--delays', default='0,2,5,10', help='simulated per-statement latency in ms')
+    parser.add_argument('--threads', type=int, default=4, help='QUERY_FANOUT_THREADS to compare against 0')
+    parser.add_argument('--scale', choices=sorted(SCALES), default='small',
+                        help='dataset to seed when DATABASE_URL is not set')
+    return parser.parse_args()
+
+
+def median_ms(get, args):
+    for _ in range(args.warmup):
+        get()
+    samples = []
+    for _ in range(args.requests):
+        start = time.perf_counter()
+        get()
+        samples.append(time.perf_counter() - start)
+    return statistics.median(samples) * 1000
+
+
+def wsgi_get(client, url):
+    def get():
+        response = client.get(url)
+        response.get_data()
+        response.close()
+        assert response.status_code == 200, response.status_code
+    return get
+
+
+def asgi_get(application, loop, url, cookie):
+    # One GET through the ASGI app, driven on `loop` like a server would.
+    path, _, query = url.partition('?')
+    scope = {'type': 'http', 'http_version': '1.1', 'method': 'GET', 'scheme': 'http', 'path': path,
+             'root_path': '', 'query_string': query.encode(), 'server': ('localhost', 80),
+             'client': ('127.0.0.1', 0), 'headers': [(b'host', b'localhost'), (b'cookie', cookie.encode())]}
+
+    async def call():
+        sent = []
+
+        async def receive():
+            return {'type': 'http.request', 'body': b'', 'more_body': False}
+
+        async def send(message):
+            sent.append(message)
+        await application(scope, receive, send)
+        return sent
+
+    def get():
+        sent = asyncio.run_coroutine_threadsafe(call(), loop).result()
+        assert sent[0]['status'] == 200, sent[0]['status']
+    return get
+
+
+def main():
+    args = parse_args()
+    seeded = not os.environ.get('DATABASE_URL')
+    if seeded:
+        path = os.path.join(tempfile.mkdtemp(prefix='hms-fanout-bench-'), 'bench.db')
+        os.environ['DATABASE_URL'] = f'sqlite:///{path}'
+    from flask import url_for
+    from sqlalchemy import event
+    from sqlalchemy.engine import Engine
+    from sqlalchemy.util import await_only
+    from app import app
+    from asgi import application
+    from cli import init_database, seed_admin
+    from fanout import init_fanout, shutdown_fanout
+    from models import db, User, Department, Doctor, Patient, DoctorAvailability, Appointment, Treatment
+    from plan_check import role_fixtures, sign_in
+    from benchmarks.seed import seed, rebuild_derived, volumes
+
+    with app.app_context():
+        init_database()
+        seed_admin()
+        if seeded:
+            seed(db, (User, Department, Doctor, Patient, DoctorAvailability, Appointment, Treatment),
+                 volumes(args.scale))
+            rebuild_derived(db)
+    with app.test_request_context():
+        fixtures = role_fixtures()
+        urls = {role: url_for(DASHBOARDS[role]) for role in fixtures}
+    loop = asyncio.new_event_loop()
+    threading.Thread(target=loop.run_forever, daemon=True).start()
+    requests = {}
+    for role, (user, _) in fixtures.items():
+        client = app.test_client()
+        sign_in(client, user)
+        cookie = f"{app.config['SESSION_COOKIE_NAME']}={client.get_cookie(app.config['SESSION_COOKIE_NAME']).value}"
+        requests[role] = (wsgi_get(client, urls[role]), asgi_get(application, loop, urls[role], cookie))
+
+    delay = 0.0
+
+    def network(conn, cursor, statement, parameters, context, executemany):
+        if not delay:
+            return
+        if conn.dialect.is_async:
+            await_only(asyncio.sleep(delay))
+        else:
+            time.sleep(delay)
+
+    event.listen(Engine, 'before_cursor_execute', network)
+    print(f"{'delay ms':>9}  {'dashboard':<20}{'in order':>10}{f'{args.threads} threads':>12}{'change':>9}"
+          f"{'async':>10}{'change':>9}")
+    try:
+        for delay_ms in [float(value) for value in args.delays.split(',')]:
+            delay = delay_ms / 1000
+            for role, url in urls.items():
+                wsgi, asgi = requests[role]
+                timings = []
+                for threads in (0, args.threads):
+                    app.config['QUERY_FANOUT_THREADS'] = threads
+                    init_fanout(app)
+                    timings.append(median_ms(wsgi, args))
+                app.config['QUERY_FANOUT_THREADS'] = 0
+                init_fanout(app)
+                timings.append(median_ms(asgi, args))
+                serial, threaded, concurrent = timings
+                print(f'{delay_ms:>9.1f}  {url:<20}{serial:>10.2f}{threaded:>12.2f}'
+                      f'{(threaded - serial) / serial * 100:>+8.0f}%{concurrent:>10.2f}'
+                      f'{(concurrent - serial) / serial * 100:>+8.0f}%')
+    finally:
+        event.remove(Engine, 'before_cursor_execute', network)
+        shutdown_fanout(app)
+        loop.call_soon_threadsafe(loop.stop)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,94 @@
+"""Measure bulk import throughput for a large patient file.
+
+Usage: python -m benchmarks.importer [--rows 500000] [--format csv] [--chunk 1000]
+
+Writes a synthetic patient file (about 1% of rows deliberately invalid) into a
+temporary directory, imports it into a throwaway SQLite database (or
+DATABASE_URL if set) and reports rows/sec. Rows carry a precomputed
+password_hash, as an export from another system would; pass
+--hash-passwords to hash a plain password per row instead, which is the
+dominant cost and best measured with far fewer rows.
+"""
+import argparse
+import csv
+import json
+import os
+import random
+import tempfile
+import time
+
+FIRST_NAMES = ['James', 'Mary', 'Robert', 'Patricia', 'John', 'Jennifer', 'Rahul', 'Priya', 'Wei', 'Omar']
+LAST_NAMES = ['Smith', 'Johnson', 'Garcia', 'Sharma', 'Patel', 'Singh', 'Chen', 'Khan', 'Nguyen', 'Kim']
+INVALID = [('username', 'import0'), ('date_of_birth', '31/12/1999'), ('full_name', '')]
+FIELDS = ['username', 'email', 'password', 'password_hash', 'full_name', 'date_of_birth', 'gender',
+          'contact_number', 'blood_group']
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--rows', type=int, default=500_000)
+    parser.add_argument('--format', choices=['csv', 'ndjson'], default='csv')
+    parser.add_argument('--chunk', type=int, default=1000)
+    parser.add_argument('--hash-passwords', action='store_true')
+    return parser.parse_args()
+
+
+def records(count, hash_passwords):
+    from werkzeug.security import generate_password_hash
+    rng = random.Random(7)
+    shared_hash = generate_password_hash('import-bench')
+    for i in range(count):
+        record = {
+            'username': f'import{i}',
+            'email': f'import{i}@example.com',
+            'password': 'import-bench' if hash_passwords else '',
+            'password_hash': '' if hash_passwords else shared_hash,
+            'full_name': f'{rng.choice(FIRST_NAMES)} {rng.choice(LAST_NAMES)}',
+            'date_of_birth': f'{rng.randint(1940, 2020)}-{rng.randint(1, 12):02d}-{rng.randint(1, 28):02d}',
+            'gender': rng.choice(['Male', 'Female']),
+            'contact_number': f'{rng.randrange(10**9, 10**10)}',
+            'blood_group': rng.choice(['A+', 'B+', 'O+', 'AB-']),
+        }
+        if i % 100 == 99:
+            # Invalid rows: duplicate username, bad date or missing name.
+            field, value = rng.choice(INVALID)
+            record[field] = value
+        yield record
+
+
+def write_file(path, fmt, count, hash_passwords):
+    with open(path, 'w', newline='') as stream:
+        if fmt == 'csv':
+            writer = csv.DictWriter(stream, fieldnames=FIELDS)
+            writer.writeheader()
+            writer.writerows(records(count, hash_passwords))
+        else:
+            for record in records(count, hash_passwords):
+                stream.write(json.dumps(record) + '\n')
+
+
+def main():
+    args = parse_args()
+    directory = tempfile.mkdtemp(prefix='hms-import-bench-')
+    if not os.environ.get('DATABASE_URL'):
+        os.environ['DATABASE_URL'] = f'sqlite:///{os.path.join(directory, "bench.db")}'
+    path = os.path.join(directory, f'patients.{args.format}')
+    start = time.perf_counter()
+    write_file(path, args.format, args.rows, args.hash_passwords)
+    print(f'Wrote {args.rows} rows to {path} in {time.perf_counter() - start:.1f}s '
+          f'({os.path.getsize(path) / 2**20:.0f} MiB)')
+
+    from app import app
+    from cli import init_database
+    from importer import import_stream
+
+    with app.app_context():
+        init_database()
+        with open(path, newline='') as stream, open(path + '.rejects.csv', 'w', newline='') as rejects:
+            result = import_stream('patients', stream, args.format, rejects, chunk_size=args.chunk)
+    print(f'Imported {result.imported} of {result.read} rows, {result.rejected} rejected, '
+          f'in {result.elapsed:.1f}s: {result.rows_per_second:,.0f} rows/s')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,97 @@
+"""Login throughput per core for each password hashing setting.
+
+Usage: python -m benchmarks.login [--logins 20] [--methods scrypt pbkdf2:sha256:600000 ...]
+                                  [--rehash-from pbkdf2:sha256:260000]
+
+For every method, sets it as the policy and signs in repeatedly through
+POST /login on one thread (one core), reporting logins/sec and the bare hash
+verification rate for two runs:
+
+  current  one user whose hash already matches the policy, signed in
+           --logins times: a verify per login.
+  rehash   --logins users hashed under --rehash-from, each signed in once:
+           a verify under the old method plus a new hash and a commit, the
+           cost every user pays once after the policy changes.
+
+The rehash run is skipped when the policy already is --rehash-from.
+"""
+import argparse
+import os
+import statistics
+import tempfile
+import time
+
+METHODS = ['scrypt:32768:8:1', 'scrypt:16384:8:1', 'pbkdf2:sha256:600000', 'pbkdf2:sha256:260000']
+REHASH_FROM = 'pbkdf2:sha256:260000'
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--logins', type=int, default=20)
+    parser.add_argument('--methods', nargs='+', default=METHODS)
+    parser.add_argument('--rehash-from', default=REHASH_FROM)
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    if not os.environ.get('DATABASE_URL'):
+        path = os.path.join(tempfile.mkdtemp(prefix='hms-login-bench-'), 'bench.db')
+        os.environ['DATABASE_URL'] = f'sqlite:///{path}'
+    from app import app
+    from cli import init_database
+    from models import db, User
+    from passwords import method_parameters
+    from werkzeug.security import generate_password_hash, check_password_hash
+
+    app.config['WTF_CSRF_ENABLED'] = False
+    with app.app_context():
+        init_database()
+
+    def add_users(prefix, count, stored_method):
+        # Hashed once and shared: only the stored method matters here.
+        password_hash = generate_password_hash('secret', method=stored_method)
+        usernames = [f'{prefix}-{n}' for n in range(count)]
+        with app.app_context():
+            db.session.add_all(User(username=name, email=f'{name}@example.com', role='admin',
+                                    password_hash=password_hash) for name in usernames)
+            db.session.commit()
+        return usernames, password_hash
+
+    def sign_in(usernames):
+        samples = []
+        for username in usernames:
+            client = app.test_client()
+            start = time.perf_counter()
+            response = client.post('/login', data={'username': username, 'password': 'secret'})
+            samples.append(time.perf_counter() - start)
+            assert response.status_code == 302, response.status_code
+        return statistics.median(samples)
+
+    def verify_rate(password_hash):
+        start = time.perf_counter()
+        for _ in range(args.logins):
+            check_password_hash(password_hash, 'secret')
+        return args.logins / (time.perf_counter() - start)
+
+    def report(method, run, median, rate):
+        print(f'{method:<24}{run:<9}{1 / median:>10.1f}{rate:>10.1f}{median * 1000:>10.1f}')
+
+    print(f"{'method':<24}{'run':<9}{'logins/s':>10}{'verify/s':>10}{'login ms':>10}")
+    for number, method in enumerate(args.methods):
+        app.config['PASSWORD_HASH_METHOD'] = method
+        usernames, stored = add_users(f'login-bench-{number}', 1, method)
+        report(method, 'current', sign_in(usernames * args.logins), verify_rate(stored))
+
+        if method_parameters(method) == method_parameters(args.rehash_from):
+            continue
+        usernames, stored = add_users(f'login-bench-{number}-rehash', args.logins, args.rehash_from)
+        median = sign_in(usernames)
+        with app.app_context():
+            rehashed = User.query.filter(User.username.in_(usernames), User.password_hash != stored).count()
+        assert rehashed == len(usernames), f'{rehashed} of {len(usernames)} rehashed'
+        report(method, 'rehash', median, verify_rate(stored))
+
+
+if __name__ == '__main__':
+    main()
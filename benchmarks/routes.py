@@ -0,0 +1,159 @@
+"""Per-route latency, query count and peak memory for every blueprint view.
+
+Usage: python -m benchmarks.routes [--requests 50] [--warmup 3] [--scale small]
+                                   [--output routes.json] [--compare baseline.json]
+
+Signs in as an admin, a doctor and a patient (the fixtures `flask
+db-check-plans` uses) and requests every GET view of their blueprint, with
+and without search arguments, through the test client. Reports p50/p95/p99
+latency, SQL statements per request and peak Python memory per route and
+saves them as JSON; --compare prints the change against an earlier run.
+Uses DATABASE_URL if set, otherwise a throwaway SQLite database seeded by
+benchmarks.seed at --scale. Streaming exports are skipped: they read every
+row by design.
+"""
+import argparse
+import json
+import os
+import platform
+import statistics
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime
+
+
+def parse_args():
+    from benchmarks.seed import SCALES
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--requests', type=int, default=50, help='timed requests per route')
+    parser.add_argument('--warmup', type=int, default=3)
+    parser.add_argument('--scale', choices=sorted(SCALES), default='small',
+                        help='dataset to seed when DATABASE_URL is not set')
+    parser.add_argument('--output', default='routes.json')
+    parser.add_argument('--compare', help='earlier --output file to diff against')
+    return parser.parse_args()
+
+
+def percentiles(samples):
+    cuts = statistics.quantiles(samples, n=100, method='inclusive')
+    return cuts[49], cuts[94], cuts[98]
+
+
+def table_counts(db, models):
+    return {model.__tablename__: db.session.query(db.func.count(model.id)).scalar() for model in models}
+
+
+def measure(client, url, args, statements):
+    for _ in range(args.warmup):
+        response = client.get(url)
+        response.get_data()
+        response.close()
+    samples = []
+    statements.clear()
+    for _ in range(args.requests):
+        start = time.perf_counter()
+        response = client.get(url)
+        response.get_data()
+        samples.append(time.perf_counter() - start)
+        response.close()
+    queries = len(statements) / args.requests
+
+    # One more request under tracemalloc, which slows everything down and so
+    # stays out of the timings.
+    tracemalloc.start()
+    baseline = tracemalloc.get_traced_memory()[0]
+    response = client.get(url)
+    response.get_data()
+    response.close()
+    peak = tracemalloc.get_traced_memory()[1] - baseline
+    tracemalloc.stop()
+
+    p50, p95, p99 = percentiles(samples) if len(samples) > 1 else samples * 3
+    return {'status': response.status_code, 'requests': args.requests, 'p50_ms': p50 * 1000,
+            'p95_ms': p95 * 1000, 'p99_ms': p99 * 1000, 'mean_ms': statistics.fmean(samples) * 1000,
+            'queries': queries, 'peak_kib': peak / 1024}
+
+
+def compare(results, path):
+    with open(path) as handle:
+        baseline = json.load(handle)['routes']
+    print(f"\nChange against {path}")
+    print(f"{'route':<58}{'p50':>10}{'p95':>10}{'queries':>10}")
+    for key, current in results.items():
+        before = baseline.get(key)
+        if not before:
+            print(f'{key:<58}{"new":>10}')
+            continue
+        p50 = (current['p50_ms'] - before['p50_ms']) / before['p50_ms'] * 100 if before['p50_ms'] else 0
+        p95 = (current['p95_ms'] - before['p95_ms']) / before['p95_ms'] * 100 if before['p95_ms'] else 0
+        print(f"{key:<58}{p50:>+9.0f}%{p95:>+9.0f}%{current['queries'] - before['queries']:>+10.1f}")
+    for key in baseline.keys() - results.keys():
+        print(f'{key:<58}{"gone":>10}')
+
+
+def main():
+    args = parse_args()
+    seeded = not os.environ.get('DATABASE_URL')
+    if seeded:
+        path = os.path.join(tempfile.mkdtemp(prefix='hms-routes-bench-'), 'bench.db')
+        os.environ['DATABASE_URL'] = f'sqlite:///{path}'
+    from sqlalchemy import event
+    from sqlalchemy.engine import Engine
+    from app import app
+    from cli import init_database, seed_admin
+    from models import db, User, Department, Doctor, Patient, DoctorAvailability, Appointment, Treatment
+    from plan_check import FULL_EXPORT_ENDPOINTS, role_fixtures, view_urls, sign_in
+    from benchmarks.seed import seed, rebuild_derived, volumes
+
+    with app.app_context():
+        init_database()
+        seed_admin()
+        if seeded:
+            seed(db, (User, Department, Doctor, Patient, DoctorAvailability, Appointment, Treatment),
+                 volumes(args.scale))
+            rebuild_derived(db)
+        counts = table_counts(db, (Department, Doctor, Patient, Appointment, Treatment))
+    with app.test_request_context():
+        fixtures = role_fixtures()
+        views = {role: [(endpoint, url) for endpoint, url in view_urls(app, role, ids)
+                        if endpoint not in FULL_EXPORT_ENDPOINTS]
+                 for role, (user, ids) in fixtures.items()}
+
+    statements = []
+
+    def count(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    event.listen(Engine, 'before_cursor_execute', count)
+    results = {}
+    print(f"{'route':<58}{'status':>7}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}{'queries':>9}{'peak KiB':>10}")
+    try:
+        for role, (user, _) in fixtures.items():
+            client = app.test_client()
+            sign_in(client, user)
+            for endpoint, url in views[role]:
+                key = f'{role} {url}'
+                results[key] = dict(measure(client, url, args, statements), endpoint=endpoint)
+                row = results[key]
+                print(f"{key:<58}{row['status']:>7}{row['p50_ms']:>9.1f}{row['p95_ms']:>9.1f}{row['p99_ms']:>9.1f}"
+                      f"{row['queries']:>9.1f}{row['peak_kib']:>10.0f}")
+    finally:
+        event.remove(Engine, 'before_cursor_execute', count)
+
+    report = {
+        'created': datetime.now().isoformat(timespec='seconds'),
+        'database': app.config['SQLALCHEMY_DATABASE_URI'].split('://')[0],
+        'python': platform.python_version(),
+        'rows': counts,
+        'routes': results,
+    }
+    with open(args.output, 'w') as handle:
+        json.dump(report, handle, indent=2)
+    print(f'\nSaved {len(results)} routes to {args.output}')
+    if args.compare:
+        compare(results, args.compare)
+
+
+if __name__ == '__main__':
+    main()
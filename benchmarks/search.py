@@ -0,0 +1,98 @@
+"""Compare indexed patient search against the old leading-wildcard ILIKE scan.
+
+Usage: python -m benchmarks.search [--patients 1000000] [--repeat 20]
+
+Builds a throwaway SQLite database (or uses DATABASE_URL if set), bulk loads
+synthetic patients, rebuilds the search index and times both backends on a
+fixed set of search terms.
+"""
+import argparse
+import os
+import random
+import statistics
+import tempfile
+import time
+
+FIRST_NAMES = ['James', 'Mary', 'Robert', 'Patricia', 'John', 'Jennifer', 'Michael', 'Linda',
+               'David', 'Elizabeth', 'Rahul', 'Priya', 'Arjun', 'Ananya', 'Wei', 'Mei', 'Omar', 'Fatima']
+LAST_NAMES = ['Smith', 'Johnson', 'Williams', 'Brown', 'Jones', 'Garcia', 'Miller', 'Davis',
+              'Sharma', 'Patel', 'Singh', 'Kumar', 'Chen', 'Wang', 'Khan', 'Ali', 'Nguyen', 'Kim']
+TERMS = ['Rahul', 'pat', 'smi', 'Priya Sharma', 'Nguyen', '98765', 'zzzz']
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--patients', type=int, default=1_000_000)
+    parser.add_argument('--repeat', type=int, default=20)
+    parser.add_argument('--chunk', type=int, default=50_000)
+    return parser.parse_args()
+
+
+def seed(db, User, Patient, count, chunk):
+    rng = random.Random(42)
+    base = db.session.query(db.func.coalesce(db.func.max(User.id), 0)).scalar() + 1
+    start = time.perf_counter()
+    for offset in range(0, count, chunk):
+        size = min(chunk, count - offset)
+        users = [{'id': base + offset + i, 'username': f'bench{offset + i}', 'email': f'bench{offset + i}@example.com',
+                  'password_hash': '!', 'role': 'patient', 'is_active': True} for i in range(size)]
+        patients = [{'id': offset + i + 1, 'user_id': base + offset + i,
+                     'full_name': f'{rng.choice(FIRST_NAMES)} {rng.choice(LAST_NAMES)}',
+                     'contact_number': f'{rng.randrange(10**9, 10**10)}'} for i in range(size)]
+        db.session.execute(db.insert(User), users)
+        db.session.execute(db.insert(Patient), patients)
+        db.session.commit()
+    return time.perf_counter() - start
+
+
+def time_backend(db, backend, Patient, repeat):
+    import search
+    results = {}
+    for term in TERMS:
+        samples = []
+        matched = 0
+        for _ in range(repeat):
+            start = time.perf_counter()
+            rows = search.ranked_matching(db.session.query(Patient.id), Patient, term, backend=backend).limit(50).all()
+            samples.append(time.perf_counter() - start)
+            matched = len(rows)
+        results[term] = (statistics.median(samples), matched)
+    return results
+
+
+def main():
+    args = parse_args()
+    if not os.environ.get('DATABASE_URL'):
+        path = os.path.join(tempfile.mkdtemp(prefix='hms-search-bench-'), 'bench.db')
+        os.environ['DATABASE_URL'] = f'sqlite:///{path}'
+    from app import app
+    from cli import init_database
+    from models import db, User, Patient
+    import search
+
+    with app.app_context():
+        init_database()
+        if Patient.query.count() < args.patients:
+            db.session.query(Patient).delete()
+            db.session.query(User).filter(User.role == 'patient').delete()
+            db.session.commit()
+            elapsed = seed(db, User, Patient, args.patients, args.chunk)
+            print(f'Seeded {args.patients} patients in {elapsed:.1f}s')
+        backend = search.get_backend()
+        start = time.perf_counter()
+        backend.rebuild()
+        print(f'Rebuilt {backend.name} index in {time.perf_counter() - start:.1f}s')
+
+        indexed = time_backend(db, backend, Patient, args.repeat)
+        like = time_backend(db, search.LikeSearch(), Patient, args.repeat)
+
+    print(f"\n{'term':<16}{'ILIKE ms':>12}{backend.name + ' ms':>18}{'speedup':>10}")
+    for term in TERMS:
+        like_time, _ = like[term]
+        indexed_time, matched = indexed[term]
+        speedup = like_time / indexed_time if indexed_time else float('inf')
+        print(f'{term:<16}{like_time * 1000:>12.2f}{indexed_time * 1000:>18.2f}{speedup:>9.1f}x  ({matched} rows)')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,245 @@
+"""Generate a synthetic hospital dataset at realistic volumes.
+
+Usage: python -m benchmarks.seed [--scale small|medium|large] [--doctors N] [--patients N]
+                                 [--appointments N] [--chunk 50000] [--seed 42]
+
+Bulk loads departments, doctors and patients (with their users), weekday
+availability windows, a year of past and two months of upcoming
+appointments, and a treatment for every completed appointment into
+DATABASE_URL (a throwaway SQLite database if unset). The bulk INSERTs skip
+the mapper events, so the dashboard counters and the search index are
+rebuilt at the end. Every seeded user signs in with the password "bench".
+The same --seed gives the same data.
+"""
+import argparse
+import itertools
+import math
+import os
+import random
+import tempfile
+import time
+from datetime import date, datetime, timedelta
+
+SCALES = {
+    'small': {'departments': 10, 'doctors': 100, 'patients': 2_000, 'appointments': 20_000},
+    'medium': {'departments': 25, 'doctors': 1_000, 'patients': 50_000, 'appointments': 500_000},
+    'large': {'departments': 40, 'doctors': 10_000, 'patients': 500_000, 'appointments': 5_000_000},
+}
+
+PASSWORD = 'bench'
+SLOT_MINUTES = 15
+DAY_START = 9 * 60  # minutes after midnight
+SLOTS_PER_DAY = 8 * 60 // SLOT_MINUTES
+DAYS_BACK = 365
+DAYS_AHEAD = 60
+AVAILABILITY_DAYS = 28
+
+DEPARTMENTS = ['Cardiology', 'Neurology', 'Orthopedics', 'Pediatrics', 'Dermatology', 'Oncology',
+               'Radiology', 'Psychiatry', 'Gastroenterology', 'Endocrinology', 'Nephrology', 'Urology',
+               'Pulmonology', 'Rheumatology', 'Ophthalmology', 'ENT', 'Gynecology', 'General Medicine']
+SPECIALIZATIONS = ['Consultant', 'Surgeon', 'Physician', 'Specialist', 'Resident']
+QUALIFICATIONS = ['MBBS', 'MBBS, MD', 'MBBS, MS', 'MBBS, DNB', 'MD, DM']
+FIRST_NAMES = ['James', 'Mary', 'Robert', 'Patricia', 'John', 'Jennifer', 'Michael', 'Linda',
+               'David', 'Elizabeth', 'Rahul', 'Priya', 'Arjun', 'Ananya', 'Wei', 'Mei', 'Omar', 'Fatima']
+LAST_NAMES = ['Smith', 'Johnson', 'Williams', 'Brown', 'Jones', 'Garcia', 'Miller', 'Davis',
+              'Sharma', 'Patel', 'Singh', 'Kumar', 'Chen', 'Wang', 'Khan', 'Ali', 'Nguyen', 'Kim']
+BLOOD_GROUPS = ['A+', 'A-', 'B+', 'B-', 'AB+', 'AB-', 'O+', 'O-']
+REASONS = ['Follow-up', 'Chest pain', 'Headache', 'Routine check-up', 'Back pain', 'Fever', 'Skin rash',
+           'Blood pressure review', 'Joint pain', 'Shortness of breath', None]
+DIAGNOSES = ['Hypertension', 'Migraine', 'Type 2 diabetes', 'Viral infection', 'Lumbar strain',
+             'Eczema', 'Asthma', 'Osteoarthritis', 'Anxiety', 'Gastritis']
+PRESCRIPTIONS = ['Paracetamol 500mg', 'Amlodipine 5mg', 'Metformin 500mg', 'Ibuprofen 400mg',
+                 'Cetirizine 10mg', 'Salbutamol inhaler', None]
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--scale', choices=sorted(SCALES), default='small')
+    for name in ('departments', 'doctors', 'patients', 'appointments'):
+        parser.add_argument(f'--{name}', type=int, help=f'override the scale preset ({name})')
+    parser.add_argument('--chunk', type=int, default=50_000)
+    parser.add_argument('--seed', type=int, default=42)
+    return parser.parse_args()
+
+
+def volumes(scale='small', **overrides):
+    counts = dict(SCALES[scale])
+    counts.update({name: value for name, value in overrides.items() if value is not None})
+    return counts
+
+
+def _next_id(db, model):
+    return db.session.query(db.func.coalesce(db.func.max(model.id), 0)).scalar() + 1
+
+
+def _insert(db, table, rows, chunk):
+    inserted = 0
+    rows = iter(rows)
+    while True:
+        batch = list(itertools.islice(rows, chunk))
+        if not batch:
+            return inserted
+        db.session.execute(table.insert(), batch)
+        db.session.commit()
+        inserted += len(batch)
+
+
+def _coprime_step(total):
+    # Walking slot numbers by a step coprime with the total visits every
+    # slot once, spreading a doctor's appointments across the whole range.
+    step = int(total * 0.618) | 1
+    while math.gcd(step, total) != 1:
+        step += 2
+    return step
+
+
+def _slot(start_day, slot):
+    day, index = divmod(slot, SLOTS_PER_DAY)
+    minutes = DAY_START + index * SLOT_MINUTES
+    return start_day + timedelta(days=day), datetime.min.replace(hour=minutes // 60, minute=minutes % 60).time()
+
+
+def seed(db, models, counts, chunk=50_000, rng_seed=42, today=None):
+    User, Department, Doctor, Patient, DoctorAvailability, Appointment, Treatment = models
+    from passwords import hash_password
+
+    rng = random.Random(rng_seed)
+    today = today or date.today()
+    start_day = today - timedelta(days=DAYS_BACK)
+    total_slots = (DAYS_BACK + DAYS_AHEAD) * SLOTS_PER_DAY
+    if counts['appointments'] > counts['doctors'] * total_slots:
+        raise SystemExit(f"{counts['appointments']} appointments do not fit {counts['doctors']} doctors "
+                         f'({total_slots} slots each)')
+    password_hash = hash_password(PASSWORD)
+    now = datetime.utcnow()
+    user_base = _next_id(db, User)
+    department_base = _next_id(db, Department)
+    doctor_base = _next_id(db, Doctor)
+    patient_base = _next_id(db, Patient)
+    appointment_base = _next_id(db, Appointment)
+    treatment_base = _next_id(db, Treatment)
+    doctors, patients = counts['doctors'], counts['patients']
+    timings = {}
+
+    def timed(name, table, rows):
+        started = time.perf_counter()
+        inserted = _insert(db, table, rows, chunk)
+        timings[name] = (inserted, time.perf_counter() - started)
+
+    def person():
+        return f'{rng.choice(FIRST_NAMES)} {rng.choice(LAST_NAMES)}'
+
+    timed('departments', Department.__table__, (
+        {'id': department_base + i, 'name': f'{DEPARTMENTS[i % len(DEPARTMENTS)]} {department_base + i}',
+         'description': f'Synthetic {DEPARTMENTS[i % len(DEPARTMENTS)].lower()} department', 'created_at': now}
+        for i in range(counts['departments'])))
+
+    timed('users', User.__table__, (
+        {'id': user_base + i, 'username': f'seed{user_base + i}', 'email': f'seed{user_base + i}@example.com',
+         'password_hash': password_hash, 'role': 'doctor' if i < doctors else 'patient', 'is_active': True,
+         'created_at': now}
+        for i in range(doctors + patients)))
+
+    timed('doctors', Doctor.__table__, (
+        {'id': doctor_base + i, 'user_id': user_base + i, 'full_name': f'Dr. {person()}',
+         'department_id': department_base + i % counts['departments'],
+         'specialization': rng.choice(SPECIALIZATIONS), 'qualification': rng.choice(QUALIFICATIONS),
+         'experience_years': rng.randint(1, 35), 'contact_number': f'{rng.randrange(10**9, 10**10)}',
+         'created_at': now}
+        for i in range(doctors)))
+
+    timed('patients', Patient.__table__, (
+        {'id': patient_base + i, 'user_id': user_base + doctors + i, 'full_name': person(),
+         'date_of_birth': today - timedelta(days=rng.randint(365, 90 * 365)),
+         'gender': rng.choice(['Male', 'Female', 'Other']), 'contact_number': f'{rng.randrange(10**9, 10**10)}',
+         'blood_group': rng.choice(BLOOD_GROUPS), 'created_at': now}
+        for i in range(patients)))
+
+    nine, five = datetime.min.replace(hour=9).time(), datetime.min.replace(hour=17).time()
+    timed('availability', DoctorAvailability.__table__, (
+        {'doctor_id': doctor_base + i, 'date': day, 'start_time': nine, 'end_time': five, 'is_available': True}
+        for i in range(doctors)
+        for day in (today + timedelta(days=offset) for offset in range(AVAILABILITY_DAYS))
+        if day.weekday() < 5))
+
+    step = _coprime_step(total_slots)
+
+    def appointment(number):
+        doctor, visit = number % doctors, number // doctors
+        day, slot_time = _slot(start_day, (visit * step + doctor * 97) % total_slots)
+        roll = rng.random()
+        if day < today:
+            status = 'Completed' if roll < 0.85 else 'Cancelled'
+        else:
+            status = 'Booked' if roll < 0.88 else 'Cancelled'
+        booked_at = datetime.combine(day - timedelta(days=rng.randint(1, 30)), slot_time)
+        return {'id': appointment_base + number, 'patient_id': patient_base + rng.randrange(patients),
+                'doctor_id': doctor_base + doctor, 'appointment_date': day, 'appointment_time': slot_time,
+                'status': status, 'reason': rng.choice(REASONS), 'created_at': booked_at, 'updated_at': booked_at}
+
+    # Treatments are written chunk by chunk alongside their appointments so
+    # millions of completed visits never sit in memory at once.
+    started = time.perf_counter()
+    treatment_id = treatment_base
+    treatments = 0
+    for offset in range(0, counts['appointments'], chunk):
+        batch = [appointment(number) for number in range(offset, min(offset + chunk, counts['appointments']))]
+        db.session.execute(Appointment.__table__.insert(), batch)
+        seen = [row for row in batch if row['status'] == 'Completed']
+        if seen:
+            db.session.execute(Treatment.__table__.insert(), [
+                {'id': treatment_id + i, 'appointment_id': row['id'], 'diagnosis': rng.choice(DIAGNOSES),
+                 'prescription': rng.choice(PRESCRIPTIONS), 'notes': None,
+                 'created_at': datetime.combine(row['appointment_date'], row['appointment_time']),
+                 'updated_at': datetime.combine(row['appointment_date'], row['appointment_time'])}
+                for i, row in enumerate(seen)])
+            treatment_id += len(seen)
+            treatments += len(seen)
+        db.session.commit()
+    elapsed = time.perf_counter() - started
+    timings['appointments + treatments'] = (counts['appointments'] + treatments, elapsed)
+    return timings
+
+
+def rebuild_derived(db):
+    import analytics
+    import counters
+    import search
+    import timeline
+    with db.engine.begin() as connection:
+        counters.reconcile(connection)
+        timeline.rebuild(connection)
+    search.get_backend().rebuild()
+    analytics.backfill(db.engine)
+
+
+def main():
+    args = parse_args()
+    if not os.environ.get('DATABASE_URL'):
+        path = os.path.join(tempfile.mkdtemp(prefix='hms-seed-'), 'bench.db')
+        os.environ['DATABASE_URL'] = f'sqlite:///{path}'
+    from app import app
+    from cli import init_database, seed_admin
+    from models import db, User, Department, Doctor, Patient, DoctorAvailability, Appointment, Treatment
+
+    counts = volumes(args.scale, departments=args.departments, doctors=args.doctors,
+                     patients=args.patients, appointments=args.appointments)
+    with app.app_context():
+        init_database()
+        seed_admin()
+        started = time.perf_counter()
+        timings = seed(db, (User, Department, Doctor, Patient, DoctorAvailability, Appointment, Treatment),
+                       counts, args.chunk, args.seed)
+        derived = time.perf_counter()
+        rebuild_derived(db)
+        finished = time.perf_counter()
+
+    print(f"Database: {os.environ['DATABASE_URL']}")
+    print(f"{'table':<26}{'rows':>12}{'seconds':>10}{'rows/s':>12}")
+    for name, (rows, seconds) in timings.items():
+        print(f'{name:<26}{rows:>12}{seconds:>10.1f}{rows / seconds if seconds else 0:>12.0f}')
+    print(f'Counters, search index and analytics rollups rebuilt in {finished - derived:.1f}s; total {finished - started:.1f}s')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,63 @@
+"""Measure worker startup: interpreter start to first served request.
+
+Usage: python -m benchmarks.startup [--runs 10] [--path /login]
+
+Each run starts a fresh interpreter (as a new gunicorn worker would),
+imports app, and serves one request through the test client. Runs against
+a throwaway SQLite database prepared with `flask init-db` semantics, or
+DATABASE_URL if set.
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+
+PROBE = '''
+import json, time
+start = time.perf_counter()
+from app import app
+imported = time.perf_counter()
+response = app.test_client().get({path!r})
+served = time.perf_counter()
+print(json.dumps({{'import': imported - start, 'first_request': served - imported,
+                  'total': served - start, 'status': response.status_code}}))
+'''
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--runs', type=int, default=10)
+    parser.add_argument('--path', default='/login')
+    return parser.parse_args()
+
+
+def prepare(env):
+    code = 'from app import app\nfrom cli import init_database, seed_admin\n' \
+           'with app.app_context():\n    init_database()\n    seed_admin()\n'
+    subprocess.run([sys.executable, '-c', code], env=env, check=True, capture_output=True)
+
+
+def main():
+    args = parse_args()
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    env = dict(os.environ, PYTHONPATH=root)
+    if not env.get('DATABASE_URL'):
+        path = os.path.join(tempfile.mkdtemp(prefix='hms-startup-bench-'), 'bench.db')
+        env['DATABASE_URL'] = f'sqlite:///{path}'
+    prepare(env)
+    samples = []
+    for _ in range(args.runs):
+        output = subprocess.run([sys.executable, '-c', PROBE.format(path=args.path)], env=env, cwd=root,
+                                check=True, capture_output=True, text=True).stdout
+        samples.append(json.loads(output.strip().splitlines()[-1]))
+    print(f'{args.runs} cold starts, GET {args.path} -> {samples[0]["status"]}')
+    for key in ('import', 'first_request', 'total'):
+        values = [sample[key] * 1000 for sample in samples]
+        print(f'{key:<14} median {statistics.median(values):8.1f} ms   max {max(values):8.1f} ms')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,88 @@
+import time
+from datetime import date
+from sqlalchemy.exc import IntegrityError, OperationalError
+from models import db, Appointment, DoctorAvailability
+from scheduling import slot_minutes, is_slot_start, slot_index, window_mask
+
+# Appointment booking. The claim is a single INSERT guarded by the partial
+# unique index uq_appointments_doctor_slot_active (doctor, date, time over
+# non-cancelled rows), so two concurrent requests for the same slot cannot
+# both succeed and no read-then-write window exists. Transient lock errors
+# ("database is locked" on SQLite, serialization failures and deadlocks on
+# Postgres) are retried with a short backoff.
+
+CLAIM_RETRIES = 5
+RETRY_BACKOFF = 0.02
+
+SLOT_INDEX = 'uq_appointments_doctor_slot_active'
+SLOT_COLUMNS = ('doctor_id', 'appointment_date', 'appointment_time')
+UNIQUE_VIOLATION = '23505'
+
+
+class BookingError(Exception):
+    pass
+
+
+class SlotUnavailable(BookingError):
+    pass
+
+
+class SlotTaken(BookingError):
+    pass
+
+
+def is_slot_conflict(error):
+    # Only a violation of the slot index means someone else got there first;
+    # foreign key, NOT NULL and other unique violations are real errors.
+    original = error.orig
+    diag = getattr(original, 'diag', None)
+    if diag is not None:
+        state = getattr(original, 'pgcode', None) or getattr(original, 'sqlstate', None)
+        return state == UNIQUE_VIOLATION and diag.constraint_name == SLOT_INDEX
+    # SQLite names the index's columns rather than the index.
+    columns = ', '.join(f'{Appointment.__tablename__}.{column}' for column in SLOT_COLUMNS)
+    return str(original) == f'UNIQUE constraint failed: {columns}'
+
+
+def slot_is_offered(doctor_id, appointment_date, appointment_time):
+    minutes = slot_minutes()
+    if not is_slot_start(appointment_time, minutes):
+        return False
+    windows = db.session.query(DoctorAvailability.start_time, DoctorAvailability.end_time).filter(
+        DoctorAvailability.doctor_id == doctor_id,
+        DoctorAvailability.date == appointment_date,
+        DoctorAvailability.is_available == True
+    )
+    index = slot_index(appointment_time, minutes)
+    return any(window_mask(start_time, end_time, minutes) >> index & 1 for start_time, end_time in windows)
+
+
+def claim_slot(patient_id, doctor_id, appointment_date, appointment_time, reason=None,
+               retries=CLAIM_RETRIES):
+    if appointment_date < date.today():
+        raise SlotUnavailable('Appointments cannot be booked in the past.')
+    if not slot_is_offered(doctor_id, appointment_date, appointment_time):
+        raise SlotUnavailable('The doctor is not available at this time. Please pick one of the listed slots.')
+    for attempt in range(retries):
+        appointment = Appointment(
+            patient_id=patient_id,
+            doctor_id=doctor_id,
+            appointment_date=appointment_date,
+            appointment_time=appointment_time,
+            reason=reason,
+            status='Booked'
+        )
+        db.session.add(appointment)
+        try:
+            db.session.commit()
+            return appointment
+        except IntegrityError as error:
+            db.session.rollback()
+            if not is_slot_conflict(error):
+                raise
+            raise SlotTaken('This time slot is already booked. Please choose another time.')
+        except OperationalError:
+            db.session.rollback()
+            if attempt == retries - 1:
+                raise
+            time.sleep(RETRY_BACKOFF * (2 ** attempt))
@@ -0,0 +1,216 @@
+import os
+import pickle
+import random
+import sqlite3
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from flask import current_app, g, has_app_context, has_request_context
+from markupsafe import Markup
+from sqlalchemy import event
+from sqlalchemy.orm import Session, object_session
+from models import Department, Doctor
+
+# Cache for reference data and rendered fragments. Entries carry tags
+# ("departments", "doctors"); each tag has a version token stored in the
+# cache itself and folded into the keys of the entries tagged with it, so
+# invalidating a tag is one write that orphans every entry under it.
+# Inserts, updates and deletes of departments and doctors invalidate their
+# tag when the session commits; bulk imports mark the session themselves.
+#
+# CACHE_BACKEND picks the store: "memory" (per worker LRU with TTL; other
+# workers see an invalidation only when their copy expires after CACHE_TTL
+# seconds), "sqlite" (a file under the instance folder shared by every
+# worker on the host, so invalidations are immediate) or "none".
+
+DEFAULT_TTL = 300
+DEFAULT_SIZE = 2048
+MISSING = object()
+
+DEPARTMENTS = 'departments'
+DOCTORS = 'doctors'
+MODEL_TAGS = {Department: (DEPARTMENTS,), Doctor: (DOCTORS,)}
+
+
+class MemoryBackend:
+    def __init__(self, size=DEFAULT_SIZE):
+        self.size = size
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                return MISSING
+            expires, value = entry
+            if expires is not None and expires < time.monotonic():
+                del self.entries[key]
+                return MISSING
+            self.entries.move_to_end(key)
+            return value
+
+    def set(self, key, value, ttl=None):
+        with self.lock:
+            self.entries[key] = (time.monotonic() + ttl if ttl else None, value)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.size:
+                self.entries.popitem(last=False)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+
+class SQLiteBackend:
+    # One connection per thread; values are pickled.
+    PURGE_CHANCE = 0.01
+
+    def __init__(self, path):
+        self.path = path
+        self.local = threading.local()
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        with self._connection() as connection:
+            connection.execute('CREATE TABLE IF NOT EXISTS cache_entries '
+                               '(key TEXT PRIMARY KEY, value BLOB NOT NULL, expires REAL)')
+
+    def _connection(self):
+        connection = getattr(self.local, 'connection', None)
+        if connection is None:
+            connection = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            connection.execute('PRAGMA journal_mode=wal')
+            connection.execute('PRAGMA synchronous=normal')
+            self.local.connection = connection
+        return connection
+
+    def get(self, key):
+        row = self._connection().execute(
+            'SELECT value, expires FROM cache_entries WHERE key = ?', (key,)).fetchone()
+        if row is None or (row[1] is not None and row[1] < time.time()):
+            return MISSING
+        return pickle.loads(row[0])
+
+    def set(self, key, value, ttl=None):
+        connection = self._connection()
+        connection.execute('INSERT OR REPLACE INTO cache_entries (key, value, expires) VALUES (?, ?, ?)',
+                           (key, pickle.dumps(value, pickle.HIGHEST_PROTOCOL), time.time() + ttl if ttl else None))
+        if random.random() < self.PURGE_CHANCE:
+            connection.execute('DELETE FROM cache_entries WHERE expires < ?', (time.time(),))
+
+    def clear(self):
+        self._connection().execute('DELETE FROM cache_entries')
+
+
+class NullBackend:
+    def get(self, key):
+        return MISSING
+
+    def set(self, key, value, ttl=None):
+        pass
+
+    def clear(self):
+        pass
+
+
+class Cache:
+    def __init__(self, backend, ttl=DEFAULT_TTL):
+        self.backend = backend
+        self.ttl = ttl
+
+    def _version(self, tag):
+        # Versions are looked up once per request.
+        versions = g.setdefault('cache_versions', {}) if has_request_context() else {}
+        version = versions.get(tag)
+        if version is None:
+            version = self.backend.get(f'tag:{tag}')
+            if version is MISSING:
+                version = uuid.uuid4().hex[:8]
+                self.backend.set(f'tag:{tag}', version)
+            versions[tag] = version
+        return version
+
+    def key(self, name, tags=()):
+        return '|'.join([name] + [f'{tag}:{self._version(tag)}' for tag in tags])
+
+    def get_or_set(self, name, creator, tags=(), ttl=None):
+        key = self.key(name, tags)
+        value = self.backend.get(key)
+        if value is MISSING:
+            value = creator()
+            self.backend.set(key, value, ttl or self.ttl)
+        return value
+
+    def invalidate(self, *tags):
+        versions = g.get('cache_versions', {}) if has_request_context() else {}
+        for tag in tags:
+            self.backend.set(f'tag:{tag}', uuid.uuid4().hex[:8])
+            versions.pop(tag, None)
+
+    def clear(self):
+        self.backend.clear()
+
+
+def _cache():
+    return current_app.extensions.get('cache') if has_app_context() else None
+
+
+def cached(name, creator, tags=(), ttl=None):
+    cache = _cache()
+    return cache.get_or_set(name, creator, tags, ttl) if cache else creator()
+
+
+def invalidate(*tags):
+    cache = _cache()
+    if cache is not None:
+        cache.invalidate(*tags)
+
+
+def mark_stale(session, *tags):
+    # For writes that bypass the mapper events (bulk INSERTs).
+    session.info.setdefault('cache_tags', set()).update(tags)
+
+
+def cache_fragment(name, *parts, tags=(), ttl=None, caller=None):
+    """Template helper: {% call cache_fragment('card', doctor.id, tags=('doctors',)) %}...{% endcall %}"""
+    key = ':'.join(['fragment', name] + [str(part) for part in parts])
+    return Markup(cached(key, lambda: str(caller()), tags, ttl))
+
+
+def _mark_changed(mapper, connection, target):
+    session = object_session(target)
+    if session is not None:
+        mark_stale(session, *MODEL_TAGS[mapper.class_])
+
+
+for _model in MODEL_TAGS:
+    for _name in ('after_insert', 'after_update', 'after_delete'):
+        event.listen(_model, _name, _mark_changed)
+
+
+@event.listens_for(Session, 'after_commit')
+def _invalidate_committed(session):
+    tags = session.info.pop('cache_tags', None)
+    if tags:
+        invalidate(*tags)
+
+
+@event.listens_for(Session, 'after_rollback')
+def _forget_rolled_back(session):
+    session.info.pop('cache_tags', None)
+
+
+def create_backend(app):
+    name = app.config.get('CACHE_BACKEND', 'memory')
+    if name == 'memory':
+        return MemoryBackend(app.config.get('CACHE_SIZE', DEFAULT_SIZE))
+    if name == 'sqlite':
+        return SQLiteBackend(app.config.get('CACHE_PATH') or os.path.join(app.instance_path, 'cache.sqlite3'))
+    if name == 'none':
+        return NullBackend()
+    raise ValueError(f'Unknown CACHE_BACKEND: {name}')
+
+
+def init_cache(app):
+    app.extensions['cache'] = Cache(create_backend(app), app.config.get('CACHE_TTL', DEFAULT_TTL))
+    app.jinja_env.globals['cache_fragment'] = cache_fragment
@@ -0,0 +1,77 @@
+import click
+import os
+from flask.cli import with_appcontext
+from models import db, User, Department, Doctor, Patient, Appointment
+from migrations import upgrade_database
+from search import install_search
+
+# Deployment commands. Schema setup and seeding used to run at import time in
+# every worker; they are explicit steps now, run once per release
+# (see Procfile) or by `python app.py` for local development.
+
+DEFAULT_ADMIN = {
+    'username': 'admin',
+    'email': 'admin@hospital.com',
+    'password': 'admin123',
+}
+
+
+def init_database():
+    applied = upgrade_database()
+    install_search()
+    return applied
+
+
+def seed_admin(username=None, email=None, password=None):
+    if User.query.filter_by(role='admin').first():
+        return None
+    admin_user = User(
+        username=username or DEFAULT_ADMIN['username'],
+        email=email or DEFAULT_ADMIN['email'],
+        role='admin'
+    )
+    admin_user.set_password(password or DEFAULT_ADMIN['password'])
+    db.session.add(admin_user)
+    db.session.commit()
+    return admin_user
+
+
+@click.command('init-db')
+@with_appcontext
+def init_db_command():
+    """Create or migrate the schema and install the search index."""
+    for version, description in init_database():
+        click.echo(f'Applied {version:04d}: {description}')
+    click.echo('📊 Database Ready')
+
+
+@click.command('seed-admin')
+@click.option('--username', default=DEFAULT_ADMIN['username'], show_default=True)
+@click.option('--email', default=DEFAULT_ADMIN['email'], show_default=True)
+@click.option('--password', default=lambda: os.environ.get('ADMIN_PASSWORD', DEFAULT_ADMIN['password']),
+              help='Defaults to $ADMIN_PASSWORD, then admin123.')
+@with_appcontext
+def seed_admin_command(username, email, password):
+    """Create the admin user unless one exists."""
+    admin_user = seed_admin(username, email, password)
+    if admin_user:
+        click.echo(f'✅ Admin user created ({admin_user.username})')
+    else:
+        click.echo('ℹ️ Admin user already exists')
+
+
+@click.command('db-stats')
+@with_appcontext
+def db_stats_command():
+    """Print row counts of the main tables."""
+    click.echo(f'Users: {User.query.count()}')
+    click.echo(f'Patients: {Patient.query.count()}')
+    click.echo(f'Doctors: {Doctor.query.count()}')
+    click.echo(f'Departments: {Department.query.count()}')
+    click.echo(f'Appointments: {Appointment.query.count()}')
+
+
+def init_cli(app):
+    app.cli.add_command(init_db_command)
+    app.cli.add_command(seed_admin_command)
+    app.cli.add_command(db_stats_command)
@@ -0,0 +1,114 @@
+import hashlib
+import os
+import time
+from datetime import date, datetime, timezone
+from functools import wraps
+from flask import current_app, make_response, request, session
+from flask_login import current_user
+from sqlalchemy import event, func
+from models import db, Department, Doctor, Patient, Appointment, Treatment
+import counters
+
+# Conditional GET for list and dashboard pages. A view decorated with
+# @conditional(state) first calls state(), a few indexed aggregates over the
+# rows the page shows (count and newest updated_at of the appointments in
+# scope), and answers If-None-Match / If-Modified-Since with 304 before its
+# own queries and template run. The validators also fold in:
+#   - the signed-in user, URL and query string;
+#   - the reference_changed stamp, moved by any edit or delete of a
+#     department, doctor or patient (names shown on the pages; deleting one
+#     also deletes its appointments);
+#   - the newest template file, so a deploy changes every validator;
+#   - the CSRF token period, so a reused page never carries an expired token.
+# Saving a treatment touches its appointment's updated_at. Pages with pending
+# flash messages are always rendered.
+
+APPOINTMENTS = Appointment.__table__
+
+
+def _epoch(value):
+    return value.replace(tzinfo=timezone.utc).timestamp() if value else 0
+
+
+def appointment_state(*criteria):
+    if criteria:
+        count, updated = db.session.query(func.count(Appointment.id), func.max(Appointment.updated_at)).filter(
+            *criteria).one()
+    else:
+        # Every appointment: the maintained total instead of a COUNT scan.
+        count = counters.total(counters.APPOINTMENTS)
+        updated = db.session.query(func.max(Appointment.updated_at)).scalar()
+    return count, max(_epoch(updated), counters.latest(counters.REFERENCE_CHANGED))
+
+
+def today_state(*criteria):
+    # Dashboards also change at midnight ("upcoming" moves on).
+    count, changed = appointment_state(*criteria)
+    midnight = datetime.combine(date.today(), datetime.min.time())
+    return count, max(changed, midnight.timestamp())
+
+
+def _csrf_period_start():
+    limit = current_app.config.get('WTF_CSRF_TIME_LIMIT', 3600)
+    if not limit:
+        return 0
+    period = limit / 2
+    return int(time.time() // period * period)
+
+
+def _template_stamp(app):
+    stamp = app.extensions.get('template_stamp')
+    if stamp is None:
+        stamp = 0
+        for root, _, files in os.walk(os.path.join(app.root_path, app.template_folder)):
+            stamp = max([stamp] + [int(os.stat(os.path.join(root, name)).st_mtime) for name in files])
+        app.extensions['template_stamp'] = stamp
+    return stamp
+
+
+def conditional(state):
+    def decorator(view):
+        @wraps(view)
+        def wrapped(*args, **kwargs):
+            if request.method not in ('GET', 'HEAD') or session.get('_flashes'):
+                return view(*args, **kwargs)
+            count, changed = state(*args, **kwargs)
+            modified = max(changed, _csrf_period_start(), _template_stamp(current_app._get_current_object()))
+            last_modified = datetime.fromtimestamp(int(modified), timezone.utc)
+            etag = hashlib.blake2b(repr((
+                current_user.get_id(), request.full_path, count, modified
+            )).encode(), digest_size=12).hexdigest()
+            if request.if_none_match:
+                fresh = request.if_none_match.contains_weak(etag)
+            else:
+                fresh = request.if_modified_since is not None and last_modified <= request.if_modified_since
+            if fresh:
+                response = current_app.response_class(status=304)
+            else:
+                response = make_response(view(*args, **kwargs))
+                if response.status_code != 200:
+                    return response
+            response.set_etag(etag, weak=True)
+            response.last_modified = last_modified
+            response.cache_control.private = True
+            response.cache_control.no_cache = True
+            response.vary.add('Cookie')
+            return response
+        return wrapped
+    return decorator
+
+
+def _reference_changed(mapper, connection, target):
+    counters.stamp(connection, counters.REFERENCE_CHANGED, int(time.time()))
+
+
+for _model in (Department, Doctor, Patient):
+    event.listen(_model, 'after_update', _reference_changed)
+    event.listen(_model, 'after_delete', _reference_changed)
+
+
+@event.listens_for(Treatment, 'after_insert')
+@event.listens_for(Treatment, 'after_update')
+def _touch_appointment(mapper, connection, target):
+    connection.execute(APPOINTMENTS.update().where(APPOINTMENTS.c.id == target.appointment_id).values(
+        updated_at=datetime.utcnow()))
@@ -0,0 +1,166 @@
+import click
+from datetime import date
+from flask.cli import with_appcontext
+from sqlalchemy import and_, event, func, inspect, or_
+from models import db, Doctor, Patient, Appointment, ArchivedAppointment, StatCounter
+
+# Dashboard totals kept in stat_counters and adjusted inside the same flush
+# that inserts, updates or deletes the counted rows, so they commit or roll
+# back with the change itself. A counter is the SUM of its rows: concurrent
+# first writers may each insert a row for the same name, which is harmless.
+#   doctors, patients, appointments      table totals
+#   appointments:<status>                appointments per status
+#   booked_on (day=appointment_date)     Booked appointments per day, so the
+#                                        upcoming count is a short range sum
+# Stamps are single rows holding epoch seconds, written with stamp() and read
+# with latest() rather than summed:
+#   reference_changed                    last edit or delete of a department,
+#                                        doctor or patient, or archival batch
+#                                        (conditional GET)
+
+DOCTORS = 'doctors'
+PATIENTS = 'patients'
+APPOINTMENTS = 'appointments'
+BOOKED_ON = 'booked_on'
+REFERENCE_CHANGED = 'reference_changed'
+
+counters = StatCounter.__table__
+
+
+def status_counter(status):
+    return f'{APPOINTMENTS}:{status}'
+
+
+def bump(connection, name, delta, day=None):
+    if not delta:
+        return
+    day_clause = counters.c.day.is_(None) if day is None else counters.c.day == day
+    result = connection.execute(
+        counters.update().where(counters.c.name == name, day_clause).values(value=counters.c.value + delta))
+    if result.rowcount == 0:
+        connection.execute(counters.insert().values(name=name, day=day, value=delta))
+
+
+def stamp(connection, name, value):
+    result = connection.execute(
+        counters.update().where(counters.c.name == name, counters.c.day.is_(None)).values(value=value))
+    if result.rowcount == 0:
+        connection.execute(counters.insert().values(name=name, day=None, value=value))
+
+
+def total(name):
+    return db.session.query(func.sum(StatCounter.value)).filter(
+        StatCounter.name == name, StatCounter.day.is_(None)).scalar() or 0
+
+
+def latest(name):
+    return db.session.query(func.max(StatCounter.value)).filter(
+        StatCounter.name == name, StatCounter.day.is_(None)).scalar() or 0
+
+
+def _appointment_delta(connection, status, appointment_date, sign):
+    bump(connection, APPOINTMENTS, sign)
+    bump(connection, status_counter(status), sign)
+    if status == 'Booked':
+        bump(connection, BOOKED_ON, sign, day=appointment_date)
+
+
+@event.listens_for(Doctor, 'after_insert')
+def _doctor_inserted(mapper, connection, target):
+    bump(connection, DOCTORS, 1)
+
+
+@event.listens_for(Doctor, 'after_delete')
+def _doctor_deleted(mapper, connection, target):
+    bump(connection, DOCTORS, -1)
+
+
+@event.listens_for(Patient, 'after_insert')
+def _patient_inserted(mapper, connection, target):
+    bump(connection, PATIENTS, 1)
+
+
+@event.listens_for(Patient, 'after_delete')
+def _patient_deleted(mapper, connection, target):
+    bump(connection, PATIENTS, -1)
+
+
+@event.listens_for(Appointment, 'after_insert')
+def _appointment_inserted(mapper, connection, target):
+    _appointment_delta(connection, target.status or 'Booked', target.appointment_date, 1)
+
+
+@event.listens_for(Appointment, 'after_delete')
+def _appointment_deleted(mapper, connection, target):
+    _appointment_delta(connection, target.status, target.appointment_date, -1)
+
+
+@event.listens_for(Appointment, 'after_update')
+def _appointment_updated(mapper, connection, target):
+    state = inspect(target)
+    status = state.attrs.status.history
+    appointment_date = state.attrs.appointment_date.history
+    if not status.has_changes() and not appointment_date.has_changes():
+        return
+    old_status = status.deleted[0] if status.deleted else target.status
+    old_date = appointment_date.deleted[0] if appointment_date.deleted else target.appointment_date
+    _appointment_delta(connection, old_status, old_date, -1)
+    _appointment_delta(connection, target.status, target.appointment_date, 1)
+
+
+def reconcile(connection):
+    # Rebuild every counter from the base tables; stamps are kept.
+    connection.execute(counters.delete().where(counters.c.name != REFERENCE_CHANGED))
+    rows = [
+        {'name': DOCTORS, 'day': None, 'value': connection.execute(db.select(func.count(Doctor.id))).scalar()},
+        {'name': PATIENTS, 'day': None, 'value': connection.execute(db.select(func.count(Patient.id))).scalar()},
+    ]
+    # Archived appointments (archive.py) still count towards the totals; the
+    # table is missing while older migrations run.
+    models = [Appointment]
+    if inspect(connection).has_table(ArchivedAppointment.__tablename__):
+        models.append(ArchivedAppointment)
+    totals = {}
+    for model in models:
+        for status, count in connection.execute(
+                db.select(model.status, func.count(model.id)).group_by(model.status)):
+            totals[status] = totals.get(status, 0) + count
+    rows.append({'name': APPOINTMENTS, 'day': None, 'value': sum(totals.values())})
+    for status, count in totals.items():
+        rows.append({'name': status_counter(status), 'day': None, 'value': count})
+    for day, count in connection.execute(
+            db.select(Appointment.appointment_date, func.count(Appointment.id))
+            .where(Appointment.status == 'Booked').group_by(Appointment.appointment_date)):
+        rows.append({'name': BOOKED_ON, 'day': day, 'value': count})
+    connection.execute(counters.insert(), rows)
+
+
+def dashboard_counts(today=None):
+    today = today or date.today()
+    rows = db.session.query(StatCounter.name, func.sum(StatCounter.value)).filter(or_(
+        StatCounter.day.is_(None),
+        and_(StatCounter.name == BOOKED_ON, StatCounter.day >= today)
+    )).group_by(StatCounter.name).all()
+    totals = {name: int(value or 0) for name, value in rows}
+    return {
+        'total_doctors': totals.get(DOCTORS, 0),
+        'total_patients': totals.get(PATIENTS, 0),
+        'total_appointments': totals.get(APPOINTMENTS, 0),
+        'upcoming_appointments': totals.get(BOOKED_ON, 0),
+        'appointments_by_status': {
+            name.split(':', 1)[1]: value for name, value in totals.items() if name.startswith(APPOINTMENTS + ':')
+        },
+    }
+
+
+@click.command('counters-reconcile')
+@with_appcontext
+def counters_reconcile_command():
+    """Rebuild the dashboard counters from the base tables."""
+    with db.engine.begin() as connection:
+        reconcile(connection)
+    click.echo('Dashboard counters rebuilt.')
+
+
+def init_counters(app):
+    app.cli.add_command(counters_reconcile_command)
@@ -0,0 +1,130 @@
+import os
+from sqlalchemy import event
+from models import db
+
+# Engine configuration. Pool settings apply to any server database; Postgres
+# connections also get a statement timeout, and every new SQLite connection
+# is switched to WAL (readers no longer block the writer and vice versa) with
+# a busy timeout, so a writer waits for the lock instead of failing with
+# "database is locked". Each setting can be overridden in the app config or
+# by an environment variable of the same name. async_engine() builds an
+# asyncio twin of an engine with the same settings for fanout.py.
+
+ENGINE_DEFAULTS = {
+    'DB_POOL_SIZE': 5,
+    'DB_MAX_OVERFLOW': 10,
+    'DB_POOL_TIMEOUT': 30,
+    'DB_POOL_RECYCLE': 1800,
+    'DB_POOL_PRE_PING': True,
+    'DB_STATEMENT_TIMEOUT_MS': 30000,
+    'SQLITE_JOURNAL_MODE': 'wal',
+    'SQLITE_SYNCHRONOUS': 'normal',
+    'SQLITE_BUSY_TIMEOUT_MS': 5000,
+    'SQLITE_MMAP_SIZE': 256 * 1024 * 1024,
+    'SQLITE_CACHE_SIZE': -64000,  # negative: KiB, so 64 MB
+}
+
+# Async drivers by backend, for async_engine().
+ASYNC_DRIVERS = {'sqlite': 'sqlite+aiosqlite', 'postgresql': 'postgresql+asyncpg'}
+
+SQLITE_JOURNAL_MODES = {'delete', 'truncate', 'persist', 'memory', 'wal', 'off'}
+SQLITE_SYNCHRONOUS = {'off', 'normal', 'full', 'extra'}
+
+
+def _from_env(key, default):
+    value = os.environ.get(key)
+    if value is None:
+        return default
+    if isinstance(default, bool):
+        return value.lower() in ('1', 'true', 'yes', 'on')
+    if isinstance(default, int):
+        return int(value)
+    return value
+
+
+def _is_sqlite_memory(uri):
+    return uri in ('sqlite://', 'sqlite:///:memory:') or 'mode=memory' in uri
+
+
+def engine_options(config):
+    uri = config['SQLALCHEMY_DATABASE_URI']
+    options = dict(config.get('SQLALCHEMY_ENGINE_OPTIONS') or {})
+    if _is_sqlite_memory(uri):
+        return options
+    options.setdefault('pool_size', config['DB_POOL_SIZE'])
+    options.setdefault('max_overflow', config['DB_MAX_OVERFLOW'])
+    options.setdefault('pool_timeout', config['DB_POOL_TIMEOUT'])
+    options.setdefault('pool_recycle', config['DB_POOL_RECYCLE'])
+    options.setdefault('pool_pre_ping', config['DB_POOL_PRE_PING'])
+    if uri.startswith('postgresql') and config['DB_STATEMENT_TIMEOUT_MS']:
+        connect_args = dict(options.get('connect_args') or {})
+        connect_args.setdefault('options', f"-c statement_timeout={int(config['DB_STATEMENT_TIMEOUT_MS'])}")
+        options['connect_args'] = connect_args
+    return options
+
+
+def sqlite_pragmas(config):
+    journal_mode = str(config['SQLITE_JOURNAL_MODE']).lower()
+    synchronous = str(config['SQLITE_SYNCHRONOUS']).lower()
+    if journal_mode not in SQLITE_JOURNAL_MODES:
+        raise ValueError(f'Invalid SQLITE_JOURNAL_MODE: {journal_mode}')
+    if synchronous not in SQLITE_SYNCHRONOUS:
+        raise ValueError(f'Invalid SQLITE_SYNCHRONOUS: {synchronous}')
+    return [
+        f'PRAGMA busy_timeout={int(config["SQLITE_BUSY_TIMEOUT_MS"])}',
+        f'PRAGMA journal_mode={journal_mode}',
+        f'PRAGMA synchronous={synchronous}',
+        f'PRAGMA mmap_size={int(config["SQLITE_MMAP_SIZE"])}',
+        f'PRAGMA cache_size={int(config["SQLITE_CACHE_SIZE"])}',
+    ]
+
+
+def configure_engine(app):
+    # Called before db.init_app so the options reach create_engine.
+    for key, default in ENGINE_DEFAULTS.items():
+        app.config.setdefault(key, _from_env(key, default))
+    app.config['SQLALCHEMY_ENGINE_OPTIONS'] = engine_options(app.config)
+
+
+def _pragma_listener(config):
+    pragmas = sqlite_pragmas(config)
+
+    def apply_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        try:
+            for pragma in pragmas:
+                cursor.execute(pragma)
+        finally:
+            cursor.close()
+    return apply_pragmas
+
+
+def init_engine(app):
+    # Called after db.init_app, once the engine exists.
+    with app.app_context():
+        engines = [engine for engine in db.engines.values() if engine.dialect.name == 'sqlite']
+    if not engines:
+        return
+    apply_pragmas = _pragma_listener(app.config)
+    for engine in engines:
+        event.listen(engine, 'connect', apply_pragmas)
+
+
+def async_engine(config, engine):
+    # An asyncio engine on the same database as `engine` (fanout.py's async
+    # mode) with the same pool settings, statement timeout and pragmas.
+    # Needs the drivers in ASYNC_DRIVERS; in-memory SQLite has none, since
+    # a second engine would open a different, empty database.
+    from sqlalchemy.ext.asyncio import create_async_engine
+
+    backend = engine.url.get_backend_name()
+    if backend not in ASYNC_DRIVERS or _is_sqlite_memory(str(engine.url)):
+        return None
+    options = {key: value for key, value in engine_options(config).items() if key != 'connect_args'}
+    if backend == 'postgresql' and config['DB_STATEMENT_TIMEOUT_MS']:
+        options['connect_args'] = {
+            'server_settings': {'statement_timeout': str(int(config['DB_STATEMENT_TIMEOUT_MS']))}}
+    twin = create_async_engine(engine.url.set(drivername=ASYNC_DRIVERS[backend]), **options)
+    if backend == 'sqlite':
+        event.listen(twin.sync_engine, 'connect', _pragma_listener(config))
+    return twin
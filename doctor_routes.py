@@ -1,11 +1,20 @@
 from flask import Blueprint, render_template, request, redirect, url_for, flash
 from flask_login import login_required, current_user
-from models import db, Doctor, Patient, Appointment, Treatment, DoctorAvailability
+from models import (db, Patient, Appointment, Treatment, DoctorAvailability, AvailabilityRule,
+                    PatientTimelineEntry)
 from datetime import datetime, date, timedelta
 from functools import wraps
+import queries
+from pagination import paginate
+from availability import insert_windows, expand_rules
+from conditional import conditional, appointment_state, today_state
+from fanout import gather
 
 doctor_bp = Blueprint('doctor', __name__, url_prefix='/doctor')
 
+WEEKDAYS = ['Monday', 'Tuesday', 'Wednesday', 'Thursday', 'Friday', 'Saturday', 'Sunday']
+MAX_RULE_DAYS = 366
+
 # Decorator for doctor role checking
 
 def doctor_required(f):
@@ -17,43 +26,52 @@ def doctor_required(f):
         return f(*args, **kwargs)
     return decorated_function
 
+def doctor_scope():
+    return appointment_state(Appointment.doctor_id == current_user.doctor_id)
+
+
+def doctor_today_scope():
+    return today_state(Appointment.doctor_id == current_user.doctor_id)
+
 @doctor_bp.route('/dashboard')
 @login_required
 @doctor_required
+@conditional(doctor_today_scope)
 def doctor_dashboard():
-    doctor = Doctor.query.filter_by(user_id=current_user.id).first()
+    doctor_id = current_user.doctor_id
     today = date.today()
     week_end = today + timedelta(days=7)
-    upcoming_appointments = Appointment.query.filter(
-        Appointment.doctor_id == doctor.id,
-        Appointment.appointment_date >= today,
-        Appointment.appointment_date <= week_end,
-        Appointment.status == 'Booked'
-    ).order_by(Appointment.appointment_date, Appointment.appointment_time).all()
-    unique_patients = db.session.query(Patient).join(Appointment).filter(
-        Appointment.doctor_id == doctor.id).distinct().all()
-    return render_template('doctor/dashboard.html', doctor=doctor,
-                          upcoming_appointments=upcoming_appointments,
-                          patients=unique_patients)
+    results = gather(
+        upcoming=lambda: queries.appointments_for_doctor().filter(
+            Appointment.doctor_id == doctor_id,
+            Appointment.appointment_date >= today,
+            Appointment.appointment_date <= week_end,
+            Appointment.status == 'Booked'
+        ).order_by(Appointment.appointment_date, Appointment.appointment_time).all(),
+        patients=lambda: db.session.query(Patient).join(Appointment).filter(
+            Appointment.doctor_id == doctor_id).distinct().all(),
+    )
+    return render_template('doctor/dashboard.html',
+                          upcoming_appointments=results['upcoming'],
+                          patients=results['patients'])
 
 @doctor_bp.route('/appointments')
 @login_required
 @doctor_required
+@conditional(doctor_scope)
 def doctor_appointments():
-    doctor = Doctor.query.filter_by(user_id=current_user.id).first()
-    appointments = Appointment.query.filter_by(doctor_id=doctor.id).order_by(
-        Appointment.appointment_date.desc(),
-        Appointment.appointment_time.desc()
-    ).all()
+    doctor_id = current_user.doctor_id
+    appointments = paginate(queries.appointments_for_doctor().filter_by(doctor_id=doctor_id),
+                            queries.APPOINTMENT_ORDER)
     return render_template('doctor/appointments.html', appointments=appointments)
 
 @doctor_bp.route('/appointment/<int:appointment_id>/complete', methods=['GET', 'POST'])
 @login_required
 @doctor_required
 def doctor_complete_appointment(appointment_id):
-    doctor = Doctor.query.filter_by(user_id=current_user.id).first()
-    appointment = Appointment.query.get_or_404(appointment_id)
-    if appointment.doctor_id != doctor.id:
+    doctor_id = current_user.doctor_id
+    appointment = queries.appointment_detail(appointment_id)
+    if appointment.doctor_id != doctor_id:
         flash('Unauthorized access.', 'danger')
         return redirect(url_for('doctor.doctor_dashboard'))
     if request.method == 'POST':
@@ -82,9 +100,9 @@ def doctor_complete_appointment(appointment_id):
 @login_required
 @doctor_required
 def doctor_cancel_appointment(appointment_id):
-    doctor = Doctor.query.filter_by(user_id=current_user.id).first()
+    doctor_id = current_user.doctor_id
     appointment = Appointment.query.get_or_404(appointment_id)
-    if appointment.doctor_id != doctor.id:
+    if appointment.doctor_id != doctor_id:
         flash('Unauthorized access.', 'danger')
         return redirect(url_for('doctor.doctor_dashboard'))
     appointment.status = 'Cancelled'
@@ -96,20 +114,17 @@ def doctor_cancel_appointment(appointment_id):
 @login_required
 @doctor_required
 def doctor_patient_history(patient_id):
-    doctor = Doctor.query.filter_by(user_id=current_user.id).first()
+    doctor_id = current_user.doctor_id
     patient = Patient.query.get_or_404(patient_id)
-    appointments = Appointment.query.filter_by(
-        patient_id=patient_id,
-        doctor_id=doctor.id,
-        status='Completed'
-    ).order_by(Appointment.appointment_date.desc()).all()
-    return render_template('doctor/patient_history.html', patient=patient, appointments=appointments)
+    visits = paginate(queries.patient_timeline(patient_id).filter(PatientTimelineEntry.doctor_id == doctor_id),
+                      queries.TIMELINE_ORDER)
+    return render_template('doctor/patient_history.html', patient=patient, visits=visits)
 
 @doctor_bp.route('/availability', methods=['GET','POST'])
 @login_required
 @doctor_required
 def doctor_availability():
-    doctor = Doctor.query.filter_by(user_id=current_user.id).first()
+    doctor_id = current_user.doctor_id
     if request.method == 'POST':
         date_str = request.form.get('date')
         start_time_str = request.form.get('start_time')
@@ -117,29 +132,79 @@ def doctor_availability():
         avail_date = datetime.strptime(date_str, '%Y-%m-%d').date()
         start_time_obj = datetime.strptime(start_time_str, '%H:%M').time()
         end_time_obj = datetime.strptime(end_time_str, '%H:%M').time()
-        existing = DoctorAvailability.query.filter_by(
-            doctor_id=doctor.id,
-            date=avail_date,
-            start_time=start_time_obj
-        ).first()
-        if existing:
-            flash('Availability already exists for this time slot.', 'warning')
-        else:
-            availability = DoctorAvailability(
-                doctor_id=doctor.id,
-                date=avail_date,
-                start_time=start_time_obj,
-                end_time=end_time_obj
-            )
-            db.session.add(availability)
-            db.session.commit()
+        written = insert_windows([{
+            'doctor_id': doctor_id,
+            'date': avail_date,
+            'start_time': start_time_obj,
+            'end_time': end_time_obj,
+            'is_available': True
+        }])
+        db.session.commit()
+        if written:
             flash('Availability added successfully!', 'success')
+        else:
+            flash('Availability already exists for this time slot.', 'warning')
         return redirect(url_for('doctor.doctor_availability'))
     today = date.today()
     week_end = today + timedelta(days=7)
     availabilities = DoctorAvailability.query.filter(
-        DoctorAvailability.doctor_id == doctor.id,
+        DoctorAvailability.doctor_id == doctor_id,
         DoctorAvailability.date >= today,
         DoctorAvailability.date <= week_end
     ).order_by(DoctorAvailability.date, DoctorAvailability.start_time).all()
-    return render_template('doctor/availability.html', availabilities=availabilities)
+    rules = AvailabilityRule.query.filter_by(doctor_id=doctor_id).order_by(
+        AvailabilityRule.weekday, AvailabilityRule.start_time).all()
+    return render_template('doctor/availability.html', availabilities=availabilities, rules=rules,
+                           weekdays=WEEKDAYS)
+
+@doctor_bp.route('/availability/rules', methods=['POST'])
+@login_required
+@doctor_required
+def doctor_add_availability_rule():
+    doctor_id = current_user.doctor_id
+    weekdays = request.form.getlist('weekday', type=int)
+    start_time_obj = datetime.strptime(request.form.get('start_time'), '%H:%M').time()
+    end_time_obj = datetime.strptime(request.form.get('end_time'), '%H:%M').time()
+    valid_from = datetime.strptime(request.form.get('valid_from'), '%Y-%m-%d').date()
+    valid_until = datetime.strptime(request.form.get('valid_until'), '%Y-%m-%d').date()
+    try:
+        skipped = {datetime.strptime(value.strip(), '%Y-%m-%d').date()
+                   for value in request.form.get('exceptions', '').split(',') if value.strip()}
+    except ValueError:
+        flash('Exception dates must be in YYYY-MM-DD format, separated by commas.', 'danger')
+        return redirect(url_for('doctor.doctor_availability'))
+    exceptions = ','.join(sorted(day.isoformat() for day in skipped))
+    if not weekdays or end_time_obj <= start_time_obj or valid_until < valid_from:
+        flash('Choose at least one weekday, an end time after the start time and a valid date range.', 'danger')
+        return redirect(url_for('doctor.doctor_availability'))
+    if valid_until > valid_from + timedelta(days=MAX_RULE_DAYS):
+        flash(f'A weekly schedule can cover at most {MAX_RULE_DAYS} days.', 'danger')
+        return redirect(url_for('doctor.doctor_availability'))
+    rules = [AvailabilityRule(
+        doctor_id=doctor_id,
+        weekday=weekday,
+        start_time=start_time_obj,
+        end_time=end_time_obj,
+        valid_from=valid_from,
+        valid_until=valid_until,
+        exceptions=exceptions or None
+    ) for weekday in weekdays if 0 <= weekday <= 6]
+    db.session.add_all(rules)
+    written = insert_windows(expand_rules(rules, valid_from, valid_until))
+    db.session.commit()
+    flash(f'Weekly schedule saved; {written} availability slot(s) added.', 'success')
+    return redirect(url_for('doctor.doctor_availability'))
+
+@doctor_bp.route('/availability/rule/<int:rule_id>/delete', methods=['POST'])
+@login_required
+@doctor_required
+def doctor_delete_availability_rule(rule_id):
+    doctor_id = current_user.doctor_id
+    rule = AvailabilityRule.query.get_or_404(rule_id)
+    if rule.doctor_id != doctor_id:
+        flash('Unauthorized access.', 'danger')
+        return redirect(url_for('doctor.doctor_availability'))
+    db.session.delete(rule)
+    db.session.commit()
+    flash('Weekly schedule removed. Existing availability slots were kept.', 'info')
+    return redirect(url_for('doctor.doctor_availability'))
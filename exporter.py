@@ -0,0 +1,231 @@
+import click
+import csv
+import io
+import json
+import sys
+import zlib
+from datetime import date, datetime, time
+from flask.cli import with_appcontext
+from sqlalchemy import union_all
+from models import (db, Appointment, Patient, Doctor, Department, Treatment, ArchivedAppointment,
+                    ArchivedTreatment)
+
+# Streaming export of appointments, hot and archived, joined with patient,
+# doctor, department and treatment. Rows are read EXPORT_BATCH at a time through a server-side
+# cursor (stream_results + yield_per) and every batch is encoded and handed
+# on before the next one is fetched, so memory stays flat however many rows
+# match. Output is CSV, NDJSON or, when pyarrow is installed, Parquet with
+# one row group per batch; CSV and NDJSON can be gzipped on the fly.
+
+EXPORT_BATCH = 5000
+
+def export_columns(appointment=Appointment, treatment=Treatment):
+    return [
+        ('appointment_id', appointment.id),
+        ('appointment_date', appointment.appointment_date),
+        ('appointment_time', appointment.appointment_time),
+        ('status', appointment.status),
+        ('reason', appointment.reason),
+        ('booked_at', appointment.created_at),
+        ('patient_id', Patient.id),
+        ('patient_name', Patient.full_name),
+        ('patient_contact', Patient.contact_number),
+        ('doctor_id', Doctor.id),
+        ('doctor_name', Doctor.full_name),
+        ('department', Department.name),
+        ('specialization', Doctor.specialization),
+        ('treatment_id', treatment.id),
+        ('diagnosis', treatment.diagnosis),
+        ('prescription', treatment.prescription),
+        ('treatment_notes', treatment.notes),
+    ]
+
+
+EXPORT_COLUMNS = export_columns()
+
+# Hot and archived (archive.py) appointments; the export covers both.
+SOURCES = ((Appointment, Treatment), (ArchivedAppointment, ArchivedTreatment))
+
+EXPORT_FORMATS = {
+    'csv': 'text/csv',
+    'ndjson': 'application/x-ndjson',
+    'parquet': 'application/vnd.apache.parquet',
+}
+
+
+def available_formats():
+    try:
+        import pyarrow  # noqa: F401
+    except ImportError:
+        return [fmt for fmt in EXPORT_FORMATS if fmt != 'parquet']
+    return list(EXPORT_FORMATS)
+
+
+def export_query(start_date=None, end_date=None, statuses=None):
+    # One arm per source, each filtered on its own date index; the ORDER BY
+    # on the UNION ALL merges the arms' ordered scans rather than sorting.
+    arms = []
+    for appointment, treatment in SOURCES:
+        arm = db.select(*[column.label(name) for name, column in export_columns(appointment, treatment)]) \
+            .select_from(appointment) \
+            .join(Patient, Patient.id == appointment.patient_id) \
+            .join(Doctor, Doctor.id == appointment.doctor_id) \
+            .join(Department, Department.id == Doctor.department_id) \
+            .outerjoin(treatment, treatment.appointment_id == appointment.id)
+        if start_date:
+            arm = arm.where(appointment.appointment_date >= start_date)
+        if end_date:
+            arm = arm.where(appointment.appointment_date <= end_date)
+        if statuses:
+            arm = arm.where(appointment.status.in_(statuses))
+        arms.append(arm)
+    return union_all(*arms).order_by('appointment_date', 'appointment_time', 'appointment_id')
+
+
+def export_batches(query, batch=EXPORT_BATCH):
+    result = db.session.execute(query.execution_options(stream_results=True, yield_per=batch))
+    try:
+        for partition in result.partitions():
+            yield partition
+    finally:
+        result.close()
+
+
+def _json_value(value):
+    if isinstance(value, (date, datetime, time)):
+        return value.isoformat()
+    raise TypeError(f'Cannot serialise {type(value).__name__}')
+
+
+def _csv_chunks(batches):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow([name for name, _ in EXPORT_COLUMNS])
+    for rows in batches:
+        writer.writerows(rows)
+        yield buffer.getvalue().encode('utf-8')
+        buffer.seek(0)
+        buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue().encode('utf-8')
+
+
+def _ndjson_chunks(batches):
+    names = [name for name, _ in EXPORT_COLUMNS]
+    for rows in batches:
+        yield ''.join(json.dumps(dict(zip(names, row)), default=_json_value) + '\n'
+                      for row in rows).encode('utf-8')
+
+
+class _Spool:
+    # Write-only file handed to pyarrow; whatever it has written so far is
+    # taken out with drain() after each row group.
+    closed = False
+
+    def __init__(self):
+        self.parts = []
+        self.position = 0
+
+    def write(self, data):
+        self.parts.append(bytes(data))
+        self.position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self.position
+
+    def flush(self):
+        pass
+
+    def close(self):
+        self.closed = True
+
+    def drain(self):
+        data = b''.join(self.parts)
+        self.parts = []
+        return data
+
+
+def _parquet_chunks(batches, compression='snappy'):
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+    types = {
+        'appointment_id': pa.int64(), 'patient_id': pa.int64(), 'doctor_id': pa.int64(),
+        'treatment_id': pa.int64(), 'appointment_date': pa.date32(), 'appointment_time': pa.time64('us'),
+        'booked_at': pa.timestamp('us'),
+    }
+    schema = pa.schema([(name, types.get(name, pa.string())) for name, _ in EXPORT_COLUMNS])
+    spool = _Spool()
+    writer = pq.ParquetWriter(spool, schema, compression=compression)
+    try:
+        for rows in batches:
+            columns = list(zip(*rows)) if rows else [[] for _ in EXPORT_COLUMNS]
+            writer.write_table(pa.Table.from_arrays(
+                [pa.array(values, type=field.type) for values, field in zip(columns, schema)], schema=schema))
+            yield spool.drain()
+    finally:
+        writer.close()
+    yield spool.drain()
+
+
+def _gzipped(chunks):
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    for chunk in chunks:
+        data = compressor.compress(chunk)
+        if data:
+            yield data
+    yield compressor.flush()
+
+
+def stream_export(fmt, start_date=None, end_date=None, statuses=None, compress=False, batch=EXPORT_BATCH):
+    if fmt not in available_formats():
+        raise ValueError(f'Unsupported export format: {fmt}')
+    batches = export_batches(export_query(start_date, end_date, statuses), batch)
+    if fmt == 'parquet':
+        # Parquet compresses its own column chunks.
+        return _parquet_chunks(batches, compression='gzip' if compress else 'snappy')
+    chunks = _csv_chunks(batches) if fmt == 'csv' else _ndjson_chunks(batches)
+    return _gzipped(chunks) if compress else chunks
+
+
+def export_filename(fmt, compress=False):
+    name = f'appointments-{date.today():%Y%m%d}.{fmt}'
+    return name + '.gz' if compress and fmt != 'parquet' else name
+
+
+def _format_from_path(path):
+    name = path[:-3] if path.endswith('.gz') else path
+    for fmt in EXPORT_FORMATS:
+        if name.endswith('.' + fmt):
+            return fmt
+    return 'csv'
+
+
+@click.command('export-appointments')
+@click.argument('output', type=click.Path(dir_okay=False, allow_dash=True))
+@click.option('--format', 'fmt', type=click.Choice(list(EXPORT_FORMATS)), help='Defaults to the file extension.')
+@click.option('--from', 'start_date', type=click.DateTime(['%Y-%m-%d']), help='First appointment date.')
+@click.option('--to', 'end_date', type=click.DateTime(['%Y-%m-%d']), help='Last appointment date.')
+@click.option('--status', 'statuses', multiple=True, help='Only these statuses (repeatable).')
+@click.option('--gzip', 'compress', is_flag=True, help='Gzip the output (implied by a .gz OUTPUT).')
+@with_appcontext
+def export_appointments_command(output, fmt, start_date, end_date, statuses, compress):
+    """Stream appointments with patient, doctor and treatment to a file."""
+    fmt = fmt or _format_from_path(output)
+    compress = compress or output.endswith('.gz')
+    try:
+        chunks = stream_export(fmt, start_date.date() if start_date else None, end_date.date() if end_date else None,
+                               list(statuses), compress)
+    except ValueError as error:
+        raise click.ClickException(f'{error} (is pyarrow installed?)' if fmt == 'parquet' else str(error))
+    target = sys.stdout.buffer if output == '-' else open(output, 'wb')
+    try:
+        for chunk in chunks:
+            target.write(chunk)
+    finally:
+        if target is not sys.stdout.buffer:
+            target.close()
+
+
+def init_exporter(app):
+    app.cli.add_command(export_appointments_command)
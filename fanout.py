@@ -0,0 +1,145 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from flask import current_app, g, has_request_context, request
+from models import db
+
+# Runs a view's independent queries side by side instead of one after
+# another, so on a networked database the round trips overlap rather than
+# add up. Loaders return rows that are fully loaded (eager options, .all()):
+# each runs in its own app context with its own session, which is closed
+# when the loader finishes, so nothing can be lazy loaded from the results
+# later. Loaders must not touch the request (current_user, request.args);
+# read those in the view and close over the values. The request's replica
+# choice and SQL timing carry over to them.
+#
+# Two ways to run them:
+#   * async: under the ASGI entry point (asgi.py) every loader gets an
+#     AsyncSession on an asyncio twin of the engine (database.async_engine)
+#     and they run as tasks on the server's event loop. The loader's sync
+#     code runs through AsyncSession.run_sync, with db.session (and so
+#     Model.query) bound to that session, and yields to the loop while the
+#     driver waits on the network. QUERY_FANOUT_ASYNC=false turns it off.
+#   * threads: the fallback for the sync server (gunicorn, flask run).
+#     Loaders run on a per-process pool of QUERY_FANOUT_THREADS threads,
+#     each in an app context whose db.session is its own. The default is
+#     DEFAULT_THREADS for server databases and 0 (in order, in the request's
+#     own session) for SQLite, where there is no round trip to overlap.
+#
+# Every busy loader holds a pool connection, so keep DB_POOL_SIZE +
+# DB_MAX_OVERFLOW above server threads + QUERY_FANOUT_THREADS; the async
+# engines have pools of that size of their own.
+
+CARRIED = ('db_route', 'db_replica')
+DEFAULT_THREADS = 4
+
+# WSGI environ key under which asgi.py passes the server's event loop.
+EVENT_LOOP = 'hms.event_loop'
+
+
+def _carry(carried, timing):
+    for key, value in carried.items():
+        setattr(g, key, value)
+    if timing is not None:
+        g.request_timing = timing
+
+
+def _run(app, loader, carried, timing):
+    with app.app_context():
+        _carry(carried, timing)
+        return loader()
+
+
+def _load(session, loader):
+    # The scoped db.session is keyed by app context, so inside this loader's
+    # context it hands out the AsyncSession's sync session.
+    db.session.registry.set(session)
+    try:
+        return loader()
+    finally:
+        db.session.registry.clear()
+
+
+async def _run_async(app, engine, loader, carried, timing):
+    from sqlalchemy.ext.asyncio import AsyncSession
+
+    with app.app_context():
+        _carry(carried, timing)
+        async with AsyncSession(engine) as session:
+            return await session.run_sync(_load, loader)
+
+
+async def _gather_async(app, engine, loaders, carried, branches):
+    results = await asyncio.gather(*[_run_async(app, engine, loader, carried, branches[name])
+                                     for name, loader in loaders.items()])
+    return dict(zip(loaders, results))
+
+
+def _async_target():
+    # The server's event loop and the async engine for this request: the
+    # twin of the replica it already reads from, if any, else the primary's.
+    engines = current_app.extensions.get('fanout_async')
+    if not engines or not has_request_context():
+        return None, None
+    loop = request.environ.get(EVENT_LOOP)
+    engine = engines.get(g.get('db_replica') or db.engine)
+    return (loop, engine) if loop is not None and engine is not None else (None, None)
+
+
+def gather(**loaders):
+    """gather(upcoming=lambda: query.all(), past=...) -> {'upcoming': [...], 'past': [...]}"""
+    executor = current_app.extensions.get('fanout')
+    loop, engine = _async_target()
+    if (executor is None and loop is None) or len(loaders) < 2:
+        return {name: loader() for name, loader in loaders.items()}
+    app = current_app._get_current_object()
+    carried = {key: g.get(key) for key in CARRIED if key in g}
+    timing = g.get('request_timing')
+    branches = {name: timing.branch() if timing is not None else None for name in loaders}
+    if loop is not None:
+        # The view runs on one of the server's worker threads and waits here
+        # while the loaders run on the event loop.
+        results = asyncio.run_coroutine_threadsafe(
+            _gather_async(app, engine, loaders, carried, branches), loop).result()
+    else:
+        futures = {name: executor.submit(_run, app, loader, carried, branches[name])
+                   for name, loader in loaders.items()}
+        results = {name: future.result() for name, future in futures.items()}
+    if timing is not None:
+        for branch in branches.values():
+            timing.join(branch)
+    return results
+
+
+def shutdown_fanout(app):
+    executor = app.extensions.pop('fanout', None)
+    if executor is not None:
+        executor.shutdown(wait=True)
+
+
+def init_fanout(app):
+    # Re-initialising (e.g. a benchmark changing the thread count) first
+    # stops the previous pool's threads.
+    shutdown_fanout(app)
+    threads = app.config.get('QUERY_FANOUT_THREADS')
+    if threads is None:
+        threads = 0 if app.config['SQLALCHEMY_DATABASE_URI'].startswith('sqlite') else DEFAULT_THREADS
+    app.extensions['fanout'] = ThreadPoolExecutor(threads, thread_name_prefix='fanout') if threads else None
+
+
+def init_async_fanout(app):
+    # Called by asgi.py: one async engine per configured engine (primary and
+    # replicas), keyed by it. Engines without an async driver are left out,
+    # and views on them fall back to the thread pool.
+    from database import async_engine
+    from metrics import watch_engine
+
+    if not app.config.get('QUERY_FANOUT_ASYNC', True):
+        return
+    with app.app_context():
+        engines = list(db.engines.values())
+    twins = {engine: async_engine(app.config, engine) for engine in engines}
+    twins = {engine: twin for engine, twin in twins.items() if twin is not None}
+    if 'metrics' in app.extensions:
+        for twin in twins.values():
+            watch_engine(twin.sync_engine)
+    app.extensions['fanout_async'] = twins
@@ -0,0 +1,143 @@
+import threading
+import time
+from collections import OrderedDict
+from flask import current_app
+from sqlalchemy import event
+from sqlalchemy.orm import Session, object_session
+from models import db, User, Doctor, Patient
+
+# Per-worker cache of the signed-in user. Flask-Login reloads the user on
+# every request and the role views then looked up their Doctor/Patient row by
+# user_id; an Identity carries everything those need (role, active flag,
+# linked doctor/patient id, display name) and is cached by user id with a TTL
+# and LRU bound. Changes to users, doctors and patients drop the affected
+# entry when the session commits. Other workers keep their copy until the
+# TTL runs out, so keep IDENTITY_CACHE_TTL short.
+
+DEFAULT_TTL = 60
+DEFAULT_SIZE = 10000
+
+
+class Identity:
+    __slots__ = ('id', 'username', 'role', 'active', 'doctor_id', 'patient_id', 'full_name')
+
+    def __init__(self, id, username, role, active, doctor_id=None, patient_id=None, full_name=None):
+        self.id = id
+        self.username = username
+        self.role = role
+        self.active = active
+        self.doctor_id = doctor_id
+        self.patient_id = patient_id
+        self.full_name = full_name
+
+    @property
+    def is_authenticated(self):
+        return True
+
+    @property
+    def is_active(self):
+        return self.active
+
+    @property
+    def is_anonymous(self):
+        return False
+
+    def get_id(self):
+        return str(self.id)
+
+    def __repr__(self):
+        return f'<Identity {self.username} ({self.role})>'
+
+
+class IdentityCache:
+    def __init__(self, ttl=DEFAULT_TTL, size=DEFAULT_SIZE):
+        self.ttl = ttl
+        self.size = size
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, user_id):
+        with self.lock:
+            entry = self.entries.get(user_id)
+            if entry is None:
+                return None
+            expires, identity = entry
+            if expires < time.monotonic():
+                del self.entries[user_id]
+                return None
+            self.entries.move_to_end(user_id)
+            return identity
+
+    def put(self, identity):
+        with self.lock:
+            self.entries[identity.id] = (time.monotonic() + self.ttl, identity)
+            self.entries.move_to_end(identity.id)
+            while len(self.entries) > self.size:
+                self.entries.popitem(last=False)
+
+    def invalidate(self, user_id):
+        with self.lock:
+            self.entries.pop(user_id, None)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+
+def fetch_identity(user_id):
+    row = db.session.query(
+        User.id, User.username, User.role, User.is_active, Doctor.id, Patient.id,
+        db.func.coalesce(Doctor.full_name, Patient.full_name)
+    ).outerjoin(Doctor, Doctor.user_id == User.id).outerjoin(Patient, Patient.user_id == User.id).filter(
+        User.id == user_id
+    ).first()
+    return Identity(*row) if row else None
+
+
+def load_identity(user_id):
+    # Inactive (blacklisted) users are signed out on their next request.
+    cache = current_app.extensions['identity_cache']
+    identity = cache.get(user_id)
+    if identity is None:
+        identity = fetch_identity(user_id)
+        if identity is None:
+            return None
+        cache.put(identity)
+    return identity if identity.active else None
+
+
+def invalidate_identity(user_id):
+    cache = current_app.extensions.get('identity_cache')
+    if cache is not None:
+        cache.invalidate(user_id)
+
+
+def _mark_changed(mapper, connection, target):
+    session = object_session(target)
+    user_id = target.id if isinstance(target, User) else target.user_id
+    if session is not None and user_id is not None:
+        session.info.setdefault('identity_changed', set()).add(user_id)
+
+
+for _model in (User, Doctor, Patient):
+    event.listen(_model, 'after_update', _mark_changed)
+    event.listen(_model, 'after_delete', _mark_changed)
+
+
+@event.listens_for(Session, 'after_commit')
+def _invalidate_committed(session):
+    for user_id in session.info.pop('identity_changed', ()):
+        invalidate_identity(user_id)
+
+
+@event.listens_for(Session, 'after_rollback')
+def _forget_rolled_back(session):
+    session.info.pop('identity_changed', None)
+
+
+def init_identity(app, login_manager):
+    app.extensions['identity_cache'] = IdentityCache(
+        ttl=app.config.get('IDENTITY_CACHE_TTL', DEFAULT_TTL),
+        size=app.config.get('IDENTITY_CACHE_SIZE', DEFAULT_SIZE),
+    )
+    login_manager.user_loader(lambda user_id: load_identity(int(user_id)))
@@ -0,0 +1,313 @@
+import click
+import csv
+import io
+import json
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from datetime import datetime
+from flask.cli import with_appcontext
+from sqlalchemy import insert
+from sqlalchemy.exc import IntegrityError
+from passwords import hash_password, password_method
+from models import db, User, Department, Doctor, Patient
+from cache import DEPARTMENTS, DOCTORS, mark_stale
+import counters
+import search
+
+# Bulk import of departments, doctors and patients from CSV or NDJSON. The
+# file is read as a stream and handled IMPORT_CHUNK rows at a time: every row
+# is validated against preloaded lookups (department names, existing
+# usernames and emails) instead of per-row queries, valid rows are written
+# with one multi-row INSERT per table and committed, and invalid ones go to a
+# rejected-rows report with their line number and reason. Bulk INSERTs skip
+# the mapper events, so the search index and dashboard counters are updated
+# per chunk here.
+
+IMPORT_CHUNK = 1000
+HASH_WORKERS = min(8, os.cpu_count() or 1)
+
+KINDS = ('departments', 'doctors', 'patients')
+FORMATS = ('csv', 'ndjson')
+
+REQUIRED_FIELDS = {
+    'departments': ('name',),
+    'doctors': ('username', 'email', 'full_name', 'department', 'specialization'),
+    'patients': ('username', 'email', 'full_name'),
+}
+
+PROFILE_FIELDS = {
+    'doctors': ('full_name', 'specialization', 'qualification', 'experience_years', 'contact_number'),
+    'patients': ('full_name', 'date_of_birth', 'gender', 'contact_number', 'address', 'blood_group',
+                 'emergency_contact'),
+}
+
+REDACTED_FIELDS = ('password', 'password_hash')
+
+PROFILE_MODELS = {'doctors': Doctor, 'patients': Patient}
+PROFILE_COUNTERS = {'doctors': counters.DOCTORS, 'patients': counters.PATIENTS}
+
+
+class RowError(ValueError):
+    pass
+
+
+class ImportResult:
+    def __init__(self, kind):
+        self.kind = kind
+        self.read = 0
+        self.imported = 0
+        self.rejected = 0
+        self.elapsed = 0.0
+
+    @property
+    def rows_per_second(self):
+        return self.read / self.elapsed if self.elapsed else 0.0
+
+
+def detect_format(filename):
+    extension = os.path.splitext(filename or '')[1].lower()
+    if extension == '.csv':
+        return 'csv'
+    if extension in ('.ndjson', '.jsonl', '.json'):
+        return 'ndjson'
+    raise ValueError(f'Cannot tell the format of {filename!r}; expected .csv or .ndjson')
+
+
+def read_records(stream, fmt):
+    # Yields (line number, record). NDJSON lines that do not parse are passed
+    # through as the raw string so they are rejected like any other bad row.
+    if fmt == 'csv':
+        reader = csv.DictReader(stream)
+        for row in reader:
+            yield reader.line_num, {key.strip(): (value or '').strip()
+                                    for key, value in row.items() if key}
+        return
+    for number, line in enumerate(stream, 1):
+        if not line.strip():
+            continue
+        try:
+            record = json.loads(line)
+        except ValueError:
+            record = line.rstrip('\n')
+        if isinstance(record, dict):
+            record = {str(key).strip(): '' if value is None else str(value).strip()
+                      for key, value in record.items()}
+        yield number, record
+
+
+def _chunks(records, size):
+    chunk = []
+    for record in records:
+        chunk.append(record)
+        if len(chunk) >= size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def _limited(model, field, value):
+    length = getattr(model.__table__.c[field].type, 'length', None)
+    if value and length and len(value) > length:
+        raise RowError(f'{field} is longer than {length} characters')
+    return value or None
+
+
+class Importer:
+    def __init__(self, kind, chunk_size=IMPORT_CHUNK, rejects=None):
+        if kind not in KINDS:
+            raise ValueError(f'Unknown import kind: {kind}')
+        self.kind = kind
+        self.chunk_size = chunk_size
+        self.rejects = rejects
+        self.result = ImportResult(kind)
+        self.departments = {name.casefold(): department_id
+                            for department_id, name in db.session.query(Department.id, Department.name)}
+        self.usernames = set()
+        self.emails = set()
+        if kind in PROFILE_MODELS:
+            for username, email in db.session.query(User.username, User.email):
+                self.usernames.add(username)
+                self.emails.add(email)
+
+    def run(self, records):
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=HASH_WORKERS) as pool:
+            self.pool = pool
+            for chunk in _chunks(records, self.chunk_size):
+                valid = []
+                for number, record in chunk:
+                    self.result.read += 1
+                    try:
+                        valid.append((number, record, self.validate(record)))
+                    except RowError as error:
+                        self.reject(number, record, str(error))
+                self.write(valid)
+        self.result.elapsed = time.perf_counter() - start
+        return self.result
+
+    def reject(self, number, record, reason):
+        self.result.rejected += 1
+        if self.rejects is not None:
+            if isinstance(record, dict):
+                record = json.dumps({key: '***' if key in REDACTED_FIELDS and value else value
+                                     for key, value in record.items()}, sort_keys=True)
+            self.rejects.writerow([number, reason, record])
+
+    def validate(self, record):
+        if not isinstance(record, dict):
+            raise RowError('not a JSON object')
+        missing = [field for field in REQUIRED_FIELDS[self.kind] if not record.get(field)]
+        if missing:
+            raise RowError(f'missing {", ".join(missing)}')
+        if self.kind == 'departments':
+            return self._department(record)
+        return self._person(record)
+
+    def _department(self, record):
+        name = _limited(Department, 'name', record['name'])
+        if name.casefold() in self.departments:
+            raise RowError(f'department {name!r} already exists')
+        self.departments[name.casefold()] = None
+        return {'name': name, 'description': record.get('description') or None}
+
+    def _person(self, record):
+        username = _limited(User, 'username', record['username'])
+        email = _limited(User, 'email', record['email'])
+        if '@' not in email:
+            raise RowError('email is not a valid address')
+        password, password_hash = record.get('password'), record.get('password_hash')
+        if password_hash and password_hash.count('$') != 2:
+            raise RowError('password_hash is not a werkzeug password hash')
+        if not password and not password_hash:
+            raise RowError('missing password or password_hash')
+        profile = {field: _limited(PROFILE_MODELS[self.kind], field, record.get(field))
+                   for field in PROFILE_FIELDS[self.kind]}
+        if self.kind == 'doctors':
+            department_id = self.departments.get(record['department'].casefold())
+            if department_id is None:
+                raise RowError(f'unknown department {record["department"]!r}')
+            profile['department_id'] = department_id
+            if profile['experience_years']:
+                try:
+                    profile['experience_years'] = int(profile['experience_years'])
+                except ValueError:
+                    raise RowError('experience_years is not a number')
+                if profile['experience_years'] < 0:
+                    raise RowError('experience_years is negative')
+        else:
+            if profile['date_of_birth']:
+                try:
+                    profile['date_of_birth'] = datetime.strptime(profile['date_of_birth'], '%Y-%m-%d').date()
+                except ValueError:
+                    raise RowError('date_of_birth is not a YYYY-MM-DD date')
+        # Checked last so a row rejected for another reason does not reserve
+        # its username and email.
+        if username in self.usernames:
+            raise RowError(f'username {username!r} already exists')
+        if email in self.emails:
+            raise RowError(f'email {email!r} already registered')
+        self.usernames.add(username)
+        self.emails.add(email)
+        user = {'username': username, 'email': email, 'role': self.kind[:-1],
+                'password_hash': password_hash, 'password': password}
+        return user, profile
+
+    def write(self, valid):
+        if not valid:
+            return
+        if self.kind in PROFILE_MODELS:
+            self._hash_passwords([row for _, _, row in valid])
+        try:
+            self._insert([row for _, _, row in valid])
+            db.session.commit()
+            self.result.imported += len(valid)
+        except IntegrityError:
+            # Someone registered one of these users while the chunk was
+            # being prepared: retry row by row to single the conflict out.
+            db.session.rollback()
+            for number, record, row in valid:
+                try:
+                    self._insert([row])
+                    db.session.commit()
+                    self.result.imported += 1
+                except IntegrityError:
+                    db.session.rollback()
+                    self.reject(number, record, 'conflicts with an existing record')
+
+    def _hash_passwords(self, rows):
+        pending = [user for user, _ in rows if not user['password_hash']]
+        # Pool threads have no app context: resolve the policy here.
+        hashes = self.pool.map(partial(hash_password, method=password_method()),
+                               [user['password'] for user in pending])
+        for user, password_hash in zip(pending, hashes):
+            user['password_hash'] = password_hash
+
+    def _insert(self, rows):
+        if self.kind == 'departments':
+            ids = db.session.execute(
+                insert(Department).returning(Department.id, sort_by_parameter_order=True), rows
+            ).scalars().all()
+            for row, department_id in zip(rows, ids):
+                self.departments[row['name'].casefold()] = department_id
+            mark_stale(db.session, DEPARTMENTS)
+            return
+        model = PROFILE_MODELS[self.kind]
+        users = [{key: value for key, value in user.items() if key != 'password'} for user, _ in rows]
+        user_ids = db.session.execute(
+            insert(User).returning(User.id, sort_by_parameter_order=True), users
+        ).scalars().all()
+        profiles = [dict(profile, user_id=user_id) for (_, profile), user_id in zip(rows, user_ids)]
+        profile_ids = db.session.execute(
+            insert(model).returning(model.id, sort_by_parameter_order=True), profiles
+        ).scalars().all()
+        for profile, profile_id in zip(profiles, profile_ids):
+            profile['id'] = profile_id
+        connection = db.session.connection()
+        search.index_rows(connection, model, profiles)
+        counters.bump(connection, PROFILE_COUNTERS[self.kind], len(profiles))
+        if self.kind == 'doctors':
+            mark_stale(db.session, DOCTORS)
+
+
+def import_stream(kind, stream, fmt, rejects=None, chunk_size=IMPORT_CHUNK):
+    writer = None
+    if rejects is not None:
+        writer = csv.writer(rejects)
+        writer.writerow(['line', 'reason', 'record'])
+    return Importer(kind, chunk_size=chunk_size, rejects=writer).run(read_records(stream, fmt))
+
+
+def import_upload(kind, upload, rejects, fmt=None):
+    fmt = fmt or detect_format(upload.filename)
+    stream = io.TextIOWrapper(upload.stream, encoding='utf-8-sig', newline='')
+    return import_stream(kind, stream, fmt, rejects)
+
+
+@click.command('import-records')
+@click.argument('kind', type=click.Choice(KINDS))
+@click.argument('path', type=click.Path(exists=True, dir_okay=False))
+@click.option('--format', 'fmt', type=click.Choice(FORMATS), help='Defaults to the file extension.')
+@click.option('--rejects', type=click.Path(dir_okay=False),
+              help='Rejected-rows report, defaults to <path>.rejects.csv.')
+@click.option('--chunk', type=int, default=IMPORT_CHUNK, show_default=True)
+@with_appcontext
+def import_records_command(kind, path, fmt, rejects, chunk):
+    """Bulk import departments, doctors or patients from CSV or NDJSON."""
+    fmt = fmt or detect_format(path)
+    rejects = rejects or f'{path}.rejects.csv'
+    with open(path, encoding='utf-8-sig', newline='') as stream, \
+            open(rejects, 'w', newline='') as report:
+        result = import_stream(kind, stream, fmt, report, chunk_size=chunk)
+    click.echo(f'Imported {result.imported} of {result.read} {kind} in {result.elapsed:.1f}s '
+               f'({result.rows_per_second:,.0f} rows/s).')
+    if result.rejected:
+        click.echo(f'{result.rejected} rows rejected, see {rejects}.')
+    else:
+        os.remove(rejects)
+
+
+def init_importer(app):
+    app.cli.add_command(import_records_command)
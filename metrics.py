@@ -0,0 +1,231 @@
+import hmac
+import threading
+import time
+from bisect import bisect_left
+from flask import Response, abort, before_render_template, current_app, g, has_app_context, request, \
+    template_rendered
+from flask_login import current_user
+from sqlalchemy import event
+
+# Per-request instrumentation. Each request counts its SQL statements and
+# their time (cursor events on every engine), the time spent rendering
+# templates, and its total latency. The numbers go out as a Server-Timing
+# header and into per-endpoint histograms served in Prometheus text format
+# on /metrics, to admins or to a scraper presenting METRICS_TOKEN. Statements
+# slower than SLOW_QUERY_MS are logged with the view that issued them.
+# Histograms are per worker process. With METRICS_ENABLED off none of the
+# hooks are installed.
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100)
+UNMATCHED = '<unmatched>'
+
+
+class Histogram:
+    def __init__(self, name, help, buckets, labels=('endpoint',)):
+        self.name = name
+        self.help = help
+        self.buckets = buckets
+        self.labels = labels
+        self.series = {}
+        self.lock = threading.Lock()
+
+    def observe(self, value, *label_values):
+        with self.lock:
+            series = self.series.get(label_values)
+            if series is None:
+                series = self.series[label_values] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            series[0][bisect_left(self.buckets, value)] += 1
+            series[1] += value
+            series[2] += 1
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.help}', f'# TYPE {self.name} histogram']
+        with self.lock:
+            items = sorted((key, (list(counts), total, count)) for key, (counts, total, count) in self.series.items())
+        for label_values, (counts, total, count) in items:
+            labels = _labels(self.labels, label_values)
+            cumulative = 0
+            for bound, bucket in zip(self.buckets, counts):
+                cumulative += bucket
+                lines.append(f'{self.name}_bucket{{{labels},le="{bound}"}} {cumulative}')
+            lines.append(f'{self.name}_bucket{{{labels},le="+Inf"}} {count}')
+            lines.append(f'{self.name}_sum{{{labels}}} {total}')
+            lines.append(f'{self.name}_count{{{labels}}} {count}')
+        return lines
+
+
+class Counter:
+    def __init__(self, name, help, labels=('endpoint',)):
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self.values = {}
+        self.lock = threading.Lock()
+
+    def inc(self, *label_values):
+        with self.lock:
+            self.values[label_values] = self.values.get(label_values, 0) + 1
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.help}', f'# TYPE {self.name} counter']
+        with self.lock:
+            items = sorted(self.values.items())
+        for label_values, value in items:
+            lines.append(f'{self.name}{{{_labels(self.labels, label_values)}}} {value}')
+        return lines
+
+
+def _labels(names, values):
+    escaped = (str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for value in values)
+    return ','.join(f'{name}="{value}"' for name, value in zip(names, escaped))
+
+
+class Metrics:
+    def __init__(self):
+        self.requests = Counter('hms_requests_total', 'Requests served.', ('endpoint', 'method', 'status'))
+        self.latency = Histogram('hms_request_duration_seconds', 'Time to produce the response.', LATENCY_BUCKETS)
+        self.sql_time = Histogram('hms_request_sql_seconds', 'Time spent in SQL per request.', LATENCY_BUCKETS)
+        self.sql_count = Histogram('hms_request_sql_queries', 'SQL statements per request.', QUERY_BUCKETS)
+        self.render_time = Histogram('hms_request_render_seconds', 'Template rendering time per request.',
+                                     LATENCY_BUCKETS)
+        self.slow_queries = Counter('hms_slow_queries_total', 'Statements slower than SLOW_QUERY_MS.')
+
+    def render(self):
+        lines = []
+        for metric in (self.requests, self.latency, self.sql_time, self.sql_count, self.render_time,
+                       self.slow_queries):
+            lines.extend(metric.render())
+        return '\n'.join(lines) + '\n'
+
+
+class RequestTiming:
+    __slots__ = ('started', 'endpoint', 'description', 'queries', 'sql', 'render', 'rendering', 'render_started')
+
+    def __init__(self, endpoint, description):
+        self.started = time.perf_counter()
+        self.endpoint = endpoint
+        self.description = description
+        self.queries = 0
+        self.sql = 0.0
+        self.render = 0.0
+        self.rendering = 0
+        self.render_started = 0.0
+
+    def branch(self):
+        # Counts the statements a worker thread runs for this request
+        # (fanout.py); folded back in with join() once the worker is done.
+        return RequestTiming(self.endpoint, self.description)
+
+    def join(self, branch):
+        self.queries += branch.queries
+        self.sql += branch.sql
+
+
+def _timing():
+    return g.get('request_timing') if has_app_context() else None
+
+
+def _endpoint():
+    return request.endpoint or UNMATCHED
+
+
+def _start_request():
+    g.request_timing = RequestTiming(_endpoint(), f'{request.method} {request.path}')
+
+
+def _finish_request(response):
+    timing = g.pop('request_timing', None)
+    if timing is None:
+        return response
+    elapsed = time.perf_counter() - timing.started
+    endpoint = _endpoint()
+    metrics = current_app.extensions['metrics']
+    metrics.requests.inc(endpoint, request.method, response.status_code)
+    metrics.latency.observe(elapsed, endpoint)
+    metrics.sql_time.observe(timing.sql, endpoint)
+    metrics.sql_count.observe(timing.queries, endpoint)
+    metrics.render_time.observe(timing.render, endpoint)
+    response.headers.add('Server-Timing', f'db;dur={timing.sql * 1000:.1f};desc="{timing.queries} queries"')
+    response.headers.add('Server-Timing', f'render;dur={timing.render * 1000:.1f}')
+    response.headers.add('Server-Timing', f'total;dur={elapsed * 1000:.1f}')
+    return response
+
+
+def _before_render(sender, template, context, **extra):
+    timing = _timing()
+    if timing is not None:
+        # Only the outermost render counts; templates rendered from inside
+        # another one are already part of its time.
+        if not timing.rendering:
+            timing.render_started = time.perf_counter()
+        timing.rendering += 1
+
+
+def _rendered(sender, template, context, **extra):
+    timing = _timing()
+    if timing is not None and timing.rendering:
+        timing.rendering -= 1
+        if not timing.rendering:
+            timing.render += time.perf_counter() - timing.render_started
+
+
+def _before_cursor(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault('query_started', []).append(time.perf_counter())
+
+
+def _after_cursor(conn, cursor, statement, parameters, context, executemany):
+    elapsed = time.perf_counter() - conn.info['query_started'].pop()
+    timing = _timing()
+    if timing is None:
+        return
+    timing.queries += 1
+    timing.sql += elapsed
+    slow_ms = current_app.config['SLOW_QUERY_MS']
+    if slow_ms and elapsed * 1000 >= slow_ms:
+        current_app.extensions['metrics'].slow_queries.inc(timing.endpoint)
+        current_app.logger.warning('Slow query (%.0f ms) in %s [%s]: %s', elapsed * 1000, timing.description,
+                                   timing.endpoint, ' '.join(statement.split()))
+
+
+def _cursor_failed(context):
+    started = context.connection.info.get('query_started') if context.connection is not None else None
+    if started:
+        started.pop()
+
+
+def _can_read_metrics():
+    token = current_app.config.get('METRICS_TOKEN')
+    header = request.headers.get('Authorization', '')
+    if token and hmac.compare_digest(header.encode(), f'Bearer {token}'.encode()):
+        return True
+    return current_user.is_authenticated and current_user.role == 'admin'
+
+
+def metrics_view():
+    if not _can_read_metrics():
+        abort(403)
+    return Response(current_app.extensions['metrics'].render(), mimetype='text/plain; version=0.0.4')
+
+
+def init_metrics(app, db):
+    if not app.config.get('METRICS_ENABLED'):
+        return
+    app.config.setdefault('SLOW_QUERY_MS', 200)
+    app.extensions['metrics'] = Metrics()
+    app.before_request(_start_request)
+    app.after_request(_finish_request)
+    before_render_template.connect(_before_render, app)
+    template_rendered.connect(_rendered, app)
+    with app.app_context():
+        engines = list(db.engines.values())
+    for engine in engines:
+        watch_engine(engine)
+    app.add_url_rule('/metrics', 'metrics', metrics_view)
+
+
+def watch_engine(engine):
+    # Also used for engines made after init_metrics (fanout.py's async ones).
+    event.listen(engine, 'before_cursor_execute', _before_cursor)
+    event.listen(engine, 'after_cursor_execute', _after_cursor)
+    event.listen(engine, 'handle_error', _cursor_failed)
@@ -0,0 +1,198 @@
+import click
+from datetime import datetime
+from flask.cli import with_appcontext
+from sqlalchemy import MetaData, func, inspect
+from sqlalchemy.schema import CreateTable
+from models import (db, Doctor, Patient, Appointment, Treatment, DoctorAvailability, StatCounter, AvailabilityRule,
+                    ReplicaHeartbeat, AppointmentRollup, DepartmentRollup, AvailabilityRollup, RollupDirtyDay,
+                    ArchivedAppointment, ArchivedTreatment, PatientTimelineEntry)
+import analytics
+import counters
+import timeline
+
+# Versioned schema migrations. A fresh database is built straight from the
+# models and stamped with the latest version; an existing database (including
+# one created by the old db.create_all() startup code, which has no
+# schema_migrations table yet) runs every step it has not seen, each in its
+# own transaction. Steps must be idempotent so a half-migrated deployment can
+# simply be upgraded again.
+
+schema_migrations = db.Table(
+    'schema_migrations',
+    db.Column('version', db.Integer, primary_key=True),
+    db.Column('description', db.String(200), nullable=False),
+    db.Column('applied_at', db.DateTime, nullable=False, default=datetime.utcnow),
+)
+
+MIGRATIONS = []
+
+
+def migration(version, description):
+    def register(fn):
+        MIGRATIONS.append((version, description, fn))
+        MIGRATIONS.sort(key=lambda step: step[0])
+        return fn
+    return register
+
+
+def create_indexes(connection, table, names):
+    for index in table.indexes:
+        if index.name in names:
+            index.create(connection, checkfirst=True)
+
+
+@migration(1, 'Secondary indexes for hot appointment and availability predicates')
+def add_lookup_indexes(connection):
+    create_indexes(connection, Doctor.__table__, {'ix_doctors_user_id', 'ix_doctors_department_id'})
+    create_indexes(connection, Patient.__table__, {'ix_patients_user_id'})
+    create_indexes(connection, Treatment.__table__, {'ix_treatments_appointment_id'})
+    create_indexes(connection, DoctorAvailability.__table__, {'ix_doctor_availability_doctor_date_available'})
+    create_indexes(connection, Appointment.__table__, {
+        'ix_appointments_doctor_date_status',
+        'ix_appointments_patient_status_date',
+        'ix_appointments_status_date',
+        'ix_appointments_date_time',
+        'ix_appointments_created_at',
+    })
+
+
+@migration(2, 'Dashboard counters table')
+def add_stat_counters(connection):
+    StatCounter.__table__.create(connection, checkfirst=True)
+    counters.reconcile(connection)
+
+
+def rebuild_sqlite_table(connection, table):
+    # SQLite cannot drop a table constraint in place: build the table afresh
+    # from the model under a temporary name, copy the rows across, swap it in
+    # and recreate its indexes.
+    metadata = MetaData()
+    for referenced in db.metadata.sorted_tables:
+        referenced.to_metadata(metadata)
+    temporary = table.to_metadata(metadata, name=f'{table.name}_rebuild')
+    temporary.indexes.clear()
+    columns = ', '.join(column.name for column in table.columns)
+    connection.exec_driver_sql('PRAGMA foreign_keys=OFF')
+    connection.execute(CreateTable(temporary))
+    connection.exec_driver_sql(f'INSERT INTO {temporary.name} ({columns}) SELECT {columns} FROM {table.name}')
+    connection.exec_driver_sql(f'DROP TABLE {table.name}')
+    connection.exec_driver_sql(f'ALTER TABLE {temporary.name} RENAME TO {table.name}')
+    for index in table.indexes:
+        index.create(connection)
+
+
+@migration(3, 'Allow rebooking cancelled slots: partial unique index over active appointments')
+def partial_appointment_slot_index(connection):
+    if connection.dialect.name == 'sqlite':
+        rebuild_sqlite_table(connection, Appointment.__table__)
+        return
+    connection.exec_driver_sql(
+        'ALTER TABLE appointments DROP CONSTRAINT IF EXISTS _doctor_date_time_appointment_uc')
+    create_indexes(connection, Appointment.__table__, {'uq_appointments_doctor_slot_active'})
+
+
+@migration(4, 'Recurring weekly availability rules')
+def add_availability_rules(connection):
+    AvailabilityRule.__table__.create(connection, checkfirst=True)
+
+
+@migration(5, 'Replica lag heartbeat')
+def add_replica_heartbeat(connection):
+    ReplicaHeartbeat.__table__.create(connection, checkfirst=True)
+
+
+@migration(6, 'Appointment updated_at indexes for conditional GET validators')
+def add_updated_at_indexes(connection):
+    create_indexes(connection, Appointment.__table__, {
+        'ix_appointments_updated_at',
+        'ix_appointments_doctor_updated',
+        'ix_appointments_patient_updated',
+    })
+
+
+@migration(7, 'Daily analytics rollups')
+def add_analytics_rollups(connection):
+    for model in (AppointmentRollup, DepartmentRollup, AvailabilityRollup, RollupDirtyDay):
+        model.__table__.create(connection, checkfirst=True)
+    first, last = analytics.source_range(connection)
+    if first is not None:
+        analytics.rebuild_range(connection, first, last)
+
+
+@migration(8, 'Archive tables for old appointments and treatments')
+def add_archive_tables(connection):
+    for model in (ArchivedAppointment, ArchivedTreatment):
+        model.__table__.create(connection, checkfirst=True)
+
+
+@migration(9, 'Patient timeline read model for the history pages')
+def add_patient_timeline(connection):
+    PatientTimelineEntry.__table__.create(connection, checkfirst=True)
+    timeline.rebuild(connection)
+
+
+@migration(10, 'Archived appointment date index for exports')
+def add_archive_date_index(connection):
+    create_indexes(connection, ArchivedAppointment.__table__, {'ix_appointments_archive_date_time'})
+
+
+def head_version():
+    return MIGRATIONS[-1][0] if MIGRATIONS else 0
+
+
+def current_version(connection):
+    if not inspect(connection).has_table('schema_migrations'):
+        return None
+    return connection.execute(db.select(func.max(schema_migrations.c.version))).scalar() or 0
+
+
+def _record(connection, version, description):
+    connection.execute(schema_migrations.insert().values(
+        version=version, description=description, applied_at=datetime.utcnow()))
+
+
+def upgrade_database():
+    engine = db.engine
+    with engine.begin() as connection:
+        version = current_version(connection)
+        if version is None and not inspect(connection).has_table('users'):
+            db.metadata.create_all(connection)
+            for step_version, description, _ in MIGRATIONS:
+                _record(connection, step_version, description)
+            return []
+        if version is None:
+            schema_migrations.create(connection)
+            version = 0
+    applied = []
+    for step_version, description, step in MIGRATIONS:
+        if step_version <= version:
+            continue
+        with engine.begin() as connection:
+            step(connection)
+            _record(connection, step_version, description)
+        applied.append((step_version, description))
+    return applied
+
+
+@click.command('db-upgrade')
+@with_appcontext
+def db_upgrade_command():
+    """Create or migrate the database schema to the latest version."""
+    applied = upgrade_database()
+    for version, description in applied:
+        click.echo(f'Applied {version:04d}: {description}')
+    click.echo(f'Database schema at version {head_version()}.')
+
+
+@click.command('db-version')
+@with_appcontext
+def db_version_command():
+    """Show the current and latest schema versions."""
+    with db.engine.connect() as connection:
+        version = current_version(connection)
+    click.echo(f'Current: {version if version is not None else "unversioned"}, latest: {head_version()}')
+
+
+def init_migrations(app):
+    app.cli.add_command(db_upgrade_command)
+    app.cli.add_command(db_version_command)
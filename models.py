@@ -1,9 +1,10 @@
 from flask_sqlalchemy import SQLAlchemy
 from flask_login import UserMixin
-from werkzeug.security import generate_password_hash, check_password_hash
+from passwords import hash_password, verify_password, needs_rehash
+from replicas import RoutingSession
 from datetime import datetime
 
-db = SQLAlchemy()
+db = SQLAlchemy(session_options={'class_': RoutingSession})
 
 
 class User(UserMixin, db.Model):
@@ -21,10 +22,13 @@ class User(UserMixin, db.Model):
     patient = db.relationship('Patient', backref='user', uselist=False, cascade='all, delete-orphan')
 
     def set_password(self, password):
-        self.password_hash = generate_password_hash(password)
+        self.password_hash = hash_password(password)
 
     def check_password(self, password):
-        return check_password_hash(self.password_hash, password)
+        return verify_password(self.password_hash, password)
+
+    def password_needs_rehash(self):
+        return needs_rehash(self.password_hash)
 
     def __repr__(self):
         return f'<User {self.username}>'
@@ -48,9 +52,9 @@ class Doctor(db.Model):
     __tablename__ = 'doctors'
 
     id = db.Column(db.Integer, primary_key=True)
-    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False, index=True)
     full_name = db.Column(db.String(120), nullable=False)
-    department_id = db.Column(db.Integer, db.ForeignKey('departments.id'), nullable=False)
+    department_id = db.Column(db.Integer, db.ForeignKey('departments.id'), nullable=False, index=True)
     specialization = db.Column(db.String(100), nullable=False)
     qualification = db.Column(db.String(200))
     experience_years = db.Column(db.Integer)
@@ -59,6 +63,7 @@ class Doctor(db.Model):
 
     appointments = db.relationship('Appointment', backref='doctor', lazy=True)
     availability = db.relationship('DoctorAvailability', backref='doctor', lazy=True, cascade='all, delete-orphan')
+    availability_rules = db.relationship('AvailabilityRule', backref='doctor', lazy=True, cascade='all, delete-orphan')
 
     def __repr__(self):
         return f'<Doctor {self.full_name}>'
@@ -68,7 +73,7 @@ class Patient(db.Model):
     __tablename__ = 'patients'
 
     id = db.Column(db.Integer, primary_key=True)
-    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False, index=True)
     full_name = db.Column(db.String(120), nullable=False)
     date_of_birth = db.Column(db.Date)
     gender = db.Column(db.String(10))
@@ -94,12 +99,37 @@ class DoctorAvailability(db.Model):
     end_time = db.Column(db.Time, nullable=False)
     is_available = db.Column(db.Boolean, default=True)
 
-    __table_args__ = (db.UniqueConstraint('doctor_id', 'date', 'start_time', name='_doctor_date_time_uc'),)
+    __table_args__ = (
+        db.UniqueConstraint('doctor_id', 'date', 'start_time', name='_doctor_date_time_uc'),
+        db.Index('ix_doctor_availability_doctor_date_available', 'doctor_id', 'date', 'is_available'),
+    )
 
     def __repr__(self):
         return f'<Availability Doctor:{self.doctor_id} Date:{self.date}>'
 
 
+class AvailabilityRule(db.Model):
+    __tablename__ = 'availability_rules'
+
+    id = db.Column(db.Integer, primary_key=True)
+    doctor_id = db.Column(db.Integer, db.ForeignKey('doctors.id'), nullable=False, index=True)
+    weekday = db.Column(db.Integer, nullable=False)  # 0 = Monday
+    start_time = db.Column(db.Time, nullable=False)
+    end_time = db.Column(db.Time, nullable=False)
+    valid_from = db.Column(db.Date, nullable=False)
+    valid_until = db.Column(db.Date, nullable=False)
+    exceptions = db.Column(db.Text)  # comma-separated YYYY-MM-DD dates to skip
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    @property
+    def exception_dates(self):
+        return {datetime.strptime(value.strip(), '%Y-%m-%d').date()
+                for value in (self.exceptions or '').split(',') if value.strip()}
+
+    def __repr__(self):
+        return f'<AvailabilityRule Doctor:{self.doctor_id} Weekday:{self.weekday}>'
+
+
 class Appointment(db.Model):
     __tablename__ = 'appointments'
 
@@ -115,8 +145,23 @@ class Appointment(db.Model):
 
     treatment = db.relationship('Treatment', backref='appointment', uselist=False, cascade='all, delete-orphan')
 
-    __table_args__ = (db.UniqueConstraint('doctor_id', 'appointment_date', 'appointment_time',
-                                          name='_doctor_date_time_appointment_uc'),)
+    # A doctor's slot can be held by one active appointment at a time;
+    # cancelled rows are left out so the slot can be booked again.
+    __table_args__ = (
+        db.Index('uq_appointments_doctor_slot_active', 'doctor_id', 'appointment_date', 'appointment_time',
+                 unique=True,
+                 sqlite_where=db.text("status != 'Cancelled'"),
+                 postgresql_where=db.text("status != 'Cancelled'")),
+        db.Index('ix_appointments_doctor_date_status', 'doctor_id', 'appointment_date', 'status'),
+        db.Index('ix_appointments_patient_status_date', 'patient_id', 'status', 'appointment_date'),
+        db.Index('ix_appointments_status_date', 'status', 'appointment_date'),
+        db.Index('ix_appointments_date_time', 'appointment_date', 'appointment_time'),
+        db.Index('ix_appointments_created_at', 'created_at'),
+        # Conditional GET validators: newest change overall and per doctor/patient.
+        db.Index('ix_appointments_updated_at', 'updated_at'),
+        db.Index('ix_appointments_doctor_updated', 'doctor_id', 'updated_at'),
+        db.Index('ix_appointments_patient_updated', 'patient_id', 'updated_at'),
+    )
 
     def __repr__(self):
         return f'<Appointment {self.id} - {self.status}>'
@@ -126,7 +171,7 @@ class Treatment(db.Model):
     __tablename__ = 'treatments'
 
     id = db.Column(db.Integer, primary_key=True)
-    appointment_id = db.Column(db.Integer, db.ForeignKey('appointments.id'), nullable=False)
+    appointment_id = db.Column(db.Integer, db.ForeignKey('appointments.id'), nullable=False, index=True)
     diagnosis = db.Column(db.Text, nullable=False)
     prescription = db.Column(db.Text)
     notes = db.Column(db.Text)
@@ -135,3 +180,198 @@ class Treatment(db.Model):
 
     def __repr__(self):
         return f'<Treatment for Appointment {self.appointment_id}>'
+
+
+class StatCounter(db.Model):
+    __tablename__ = 'stat_counters'
+
+    id = db.Column(db.Integer, primary_key=True)
+    name = db.Column(db.String(50), nullable=False)
+    day = db.Column(db.Date)
+    value = db.Column(db.Integer, nullable=False, default=0)
+
+    __table_args__ = (db.Index('ix_stat_counters_day_name', 'day', 'name'),)
+
+    def __repr__(self):
+        return f'<StatCounter {self.name} {self.day or ""}={self.value}>'
+
+
+class ReplicaHeartbeat(db.Model):
+    __tablename__ = 'replica_heartbeat'
+
+    id = db.Column(db.Integer, primary_key=True)
+    beat_at = db.Column(db.DateTime, nullable=False)
+
+    def __repr__(self):
+        return f'<ReplicaHeartbeat {self.beat_at}>'
+
+
+class AppointmentRollup(db.Model):
+    # Appointments per day, doctor, hour and status (analytics.py).
+    __tablename__ = 'appointment_rollups'
+
+    id = db.Column(db.Integer, primary_key=True)
+    day = db.Column(db.Date, nullable=False)
+    doctor_id = db.Column(db.Integer, nullable=False)
+    department_id = db.Column(db.Integer, nullable=False)
+    hour = db.Column(db.Integer, nullable=False)
+    status = db.Column(db.String(20), nullable=False)
+    appointments = db.Column(db.Integer, nullable=False, default=0)
+    new_patients = db.Column(db.Integer, nullable=False, default=0)
+
+    __table_args__ = (
+        db.Index('uq_appointment_rollups_day_doctor_hour_status', 'day', 'doctor_id', 'hour', 'status', unique=True),
+        db.Index('ix_appointment_rollups_department_day', 'department_id', 'day'),
+        db.Index('ix_appointment_rollups_doctor_day', 'doctor_id', 'day'),
+    )
+
+    def __repr__(self):
+        return f'<AppointmentRollup {self.day} Doctor:{self.doctor_id} {self.hour}h {self.status}={self.appointments}>'
+
+
+class DepartmentRollup(db.Model):
+    # appointment_rollups summed over each department's doctors.
+    __tablename__ = 'department_rollups'
+
+    id = db.Column(db.Integer, primary_key=True)
+    day = db.Column(db.Date, nullable=False)
+    department_id = db.Column(db.Integer, nullable=False)
+    hour = db.Column(db.Integer, nullable=False)
+    status = db.Column(db.String(20), nullable=False)
+    appointments = db.Column(db.Integer, nullable=False, default=0)
+    new_patients = db.Column(db.Integer, nullable=False, default=0)
+
+    __table_args__ = (
+        db.Index('uq_department_rollups_day_department_hour_status', 'day', 'department_id', 'hour', 'status',
+                 unique=True),
+        db.Index('ix_department_rollups_department_day', 'department_id', 'day'),
+    )
+
+    def __repr__(self):
+        return f'<DepartmentRollup {self.day} Department:{self.department_id} {self.hour}h {self.status}>'
+
+
+class AvailabilityRollup(db.Model):
+    # Open availability minutes per day and doctor (analytics.py).
+    __tablename__ = 'availability_rollups'
+
+    id = db.Column(db.Integer, primary_key=True)
+    day = db.Column(db.Date, nullable=False)
+    doctor_id = db.Column(db.Integer, nullable=False)
+    department_id = db.Column(db.Integer, nullable=False)
+    available_minutes = db.Column(db.Integer, nullable=False, default=0)
+
+    __table_args__ = (
+        db.Index('uq_availability_rollups_day_doctor', 'day', 'doctor_id', unique=True),
+        db.Index('ix_availability_rollups_department_day', 'department_id', 'day'),
+        db.Index('ix_availability_rollups_doctor_day', 'doctor_id', 'day'),
+    )
+
+    def __repr__(self):
+        return f'<AvailabilityRollup {self.day} Doctor:{self.doctor_id}={self.available_minutes}>'
+
+
+class RollupDirtyDay(db.Model):
+    # Days whose rollups are out of date; one row per writing transaction.
+    __tablename__ = 'rollup_dirty_days'
+
+    id = db.Column(db.Integer, primary_key=True)
+    day = db.Column(db.Date, nullable=False, index=True)
+
+    def __repr__(self):
+        return f'<RollupDirtyDay {self.day}>'
+
+
+class ArchivedAppointment(db.Model):
+    # Completed and cancelled appointments moved out of `appointments` by
+    # archive.py, ids kept. Range partitioned by appointment_date on Postgres
+    # (one partition per year), so the key is part of the primary key.
+    __tablename__ = 'appointments_archive'
+
+    id = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    appointment_date = db.Column(db.Date, primary_key=True)
+    patient_id = db.Column(db.Integer, db.ForeignKey('patients.id'), nullable=False)
+    doctor_id = db.Column(db.Integer, db.ForeignKey('doctors.id'), nullable=False)
+    appointment_time = db.Column(db.Time, nullable=False)
+    status = db.Column(db.String(20), nullable=False)
+    reason = db.Column(db.Text)
+    created_at = db.Column(db.DateTime)
+    updated_at = db.Column(db.DateTime)
+    archived_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    # Ids stay unique in the archive, so the mapper keys rows (and loads
+    # treatments) by id alone: a plain IN list, which SQLite serves from the
+    # index where a row-value (id, date) IN would scan.
+    __mapper_args__ = {'primary_key': [id]}
+
+    doctor = db.relationship('Doctor')
+    patient = db.relationship('Patient')
+    treatment = db.relationship('ArchivedTreatment', uselist=False, viewonly=True,
+                                primaryjoin='ArchivedAppointment.id == foreign(ArchivedTreatment.appointment_id)')
+
+    __table_args__ = (
+        db.Index('ix_appointments_archive_patient_status_date', 'patient_id', 'status', 'appointment_date'),
+        db.Index('ix_appointments_archive_doctor_patient', 'doctor_id', 'patient_id'),
+        db.Index('ix_appointments_archive_date_time', 'appointment_date', 'appointment_time'),
+        {'postgresql_partition_by': 'RANGE (appointment_date)'},
+    )
+
+    def __repr__(self):
+        return f'<ArchivedAppointment {self.id} - {self.status}>'
+
+
+class ArchivedTreatment(db.Model):
+    # Treatments of archived appointments, partitioned like them.
+    __tablename__ = 'treatments_archive'
+
+    id = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    appointment_date = db.Column(db.Date, primary_key=True)
+    appointment_id = db.Column(db.Integer, nullable=False)
+    diagnosis = db.Column(db.Text, nullable=False)
+    prescription = db.Column(db.Text)
+    notes = db.Column(db.Text)
+    created_at = db.Column(db.DateTime)
+    updated_at = db.Column(db.DateTime)
+
+    __table_args__ = (
+        db.ForeignKeyConstraint(['appointment_id', 'appointment_date'],
+                                ['appointments_archive.id', 'appointments_archive.appointment_date']),
+        db.Index('ix_treatments_archive_appointment', 'appointment_id', 'appointment_date'),
+        {'postgresql_partition_by': 'RANGE (appointment_date)'},
+    )
+
+    def __repr__(self):
+        return f'<ArchivedTreatment for Appointment {self.appointment_id}>'
+
+
+class PatientTimelineEntry(db.Model):
+    # One row per completed visit with the names and treatment the history
+    # pages show, kept current by timeline.py.
+    __tablename__ = 'patient_timeline'
+
+    id = db.Column(db.Integer, primary_key=True)
+    appointment_id = db.Column(db.Integer, nullable=False)
+    patient_id = db.Column(db.Integer, nullable=False)
+    doctor_id = db.Column(db.Integer, nullable=False)
+    department_id = db.Column(db.Integer)
+    appointment_date = db.Column(db.Date, nullable=False)
+    appointment_time = db.Column(db.Time, nullable=False)
+    doctor_name = db.Column(db.String(120), nullable=False)
+    doctor_specialization = db.Column(db.String(100))
+    department_name = db.Column(db.String(100))
+    treatment_id = db.Column(db.Integer)
+    diagnosis = db.Column(db.Text)
+    prescription = db.Column(db.Text)
+    notes = db.Column(db.Text)
+
+    __table_args__ = (
+        db.Index('uq_patient_timeline_appointment', 'appointment_id', unique=True),
+        db.Index('ix_patient_timeline_patient_date', 'patient_id', 'appointment_date', 'appointment_time',
+                 'appointment_id'),
+        db.Index('ix_patient_timeline_doctor_patient_date', 'doctor_id', 'patient_id', 'appointment_date',
+                 'appointment_time', 'appointment_id'),
+        db.Index('ix_patient_timeline_department', 'department_id'),
+    )
+
+    def __repr__(self):
+        return f'<PatientTimelineEntry Patient:{self.patient_id} Appointment:{self.appointment_id}>'
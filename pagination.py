@@ -0,0 +1,139 @@
+from flask import request, current_app, url_for
+from sqlalchemy import and_, or_, tuple_
+from datetime import date, datetime, time
+import base64
+import json
+
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 200
+
+# Keyset (cursor) pagination: each page is fetched with a range predicate on
+# the sort key of the last row seen, so deep pages use the same index range
+# scan as the first one. order_by is a list of (column, descending) pairs and
+# must end with a unique column (normally the primary key) to be stable.
+
+
+class KeysetPage:
+    def __init__(self, items, next_cursor=None, prev_cursor=None):
+        self.items = items
+        self.next_cursor = next_cursor
+        self.prev_cursor = prev_cursor
+
+    @property
+    def has_next(self):
+        return self.next_cursor is not None
+
+    @property
+    def has_prev(self):
+        return self.prev_cursor is not None
+
+    @property
+    def next_url(self):
+        return _page_url(self.next_cursor) if self.has_next else None
+
+    @property
+    def prev_url(self):
+        return _page_url(self.prev_cursor) if self.has_prev else None
+
+    def __iter__(self):
+        return iter(self.items)
+
+    def __len__(self):
+        return len(self.items)
+
+    def __bool__(self):
+        return bool(self.items)
+
+
+def _page_url(cursor):
+    args = request.args.to_dict()
+    args.update(request.view_args or {})
+    args['cursor'] = cursor
+    return url_for(request.endpoint, **args)
+
+
+def _encode_value(value):
+    if isinstance(value, (date, datetime, time)):
+        return value.isoformat()
+    return value
+
+
+def _decode_value(column, value):
+    if value is None:
+        return None
+    python_type = column.type.python_type
+    if python_type in (date, datetime, time):
+        return python_type.fromisoformat(value)
+    return python_type(value)
+
+
+def encode_cursor(direction, item, order_by):
+    values = [_encode_value(getattr(item, column.key)) for column, _ in order_by]
+    raw = json.dumps([direction, values], separators=(',', ':')).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+
+def decode_cursor(cursor, order_by):
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        direction, values = json.loads(raw)
+        if direction not in ('next', 'prev') or len(values) != len(order_by):
+            return None
+        return direction, [_decode_value(column, value) for (column, _), value in zip(order_by, values)]
+    except (ValueError, TypeError):
+        return None
+
+
+def _after(order_by, values, reverse=False):
+    # Rows strictly after `values` in the given ordering (or before it when
+    # reverse is set). A uniform direction compiles to a row-value comparison
+    # that the composite index can seek on directly.
+    directions = {descending != reverse for _, descending in order_by}
+    columns = [column for column, _ in order_by]
+    if len(directions) == 1:
+        if directions.pop():
+            return tuple_(*columns) < tuple_(*values)
+        return tuple_(*columns) > tuple_(*values)
+    clauses = []
+    for i, (column, descending) in enumerate(order_by):
+        equal = [order_by[j][0] == values[j] for j in range(i)]
+        step = column < values[i] if descending != reverse else column > values[i]
+        clauses.append(and_(*equal, step))
+    return or_(*clauses)
+
+
+def _ordering(order_by, reverse=False):
+    return [column.desc() if descending != reverse else column.asc() for column, descending in order_by]
+
+
+def page_size():
+    default = current_app.config.get('PAGE_SIZE', DEFAULT_PAGE_SIZE)
+    limit = current_app.config.get('MAX_PAGE_SIZE', MAX_PAGE_SIZE)
+    per_page = request.args.get('per_page', default, type=int)
+    return max(1, min(per_page, limit))
+
+
+def keyset_paginate(query, order_by, cursor=None, per_page=None):
+    per_page = per_page or page_size()
+    decoded = decode_cursor(cursor, order_by) if cursor else None
+    direction, values = decoded if decoded else ('next', None)
+    reverse = direction == 'prev'
+    if values is not None:
+        query = query.filter(_after(order_by, values, reverse=reverse))
+    rows = query.order_by(None).order_by(*_ordering(order_by, reverse=reverse)).limit(per_page + 1).all()
+    has_more = len(rows) > per_page
+    rows = rows[:per_page]
+    if reverse:
+        rows.reverse()
+    if not rows:
+        return KeysetPage(rows)
+    next_cursor = prev_cursor = None
+    if has_more or reverse:
+        next_cursor = encode_cursor('next', rows[-1], order_by)
+    if (has_more and reverse) or (values is not None and not reverse):
+        prev_cursor = encode_cursor('prev', rows[0], order_by)
+    return KeysetPage(rows, next_cursor=next_cursor, prev_cursor=prev_cursor)
+
+
+def paginate(query, order_by):
+    return keyset_paginate(query, order_by, cursor=request.args.get('cursor'))
@@ -0,0 +1,71 @@
+import os
+import threading
+from functools import lru_cache
+from flask import current_app, has_app_context
+from werkzeug.security import generate_password_hash, check_password_hash
+
+# Password hashing policy. PASSWORD_HASH_METHOD is any Werkzeug method string
+# ("scrypt", "scrypt:16384:8:1", "pbkdf2:sha256:600000", ...); hashes stored
+# under other parameters still verify and are replaced with the current policy
+# the next time their owner signs in. Hashing is CPU bound, so at most
+# PASSWORD_HASH_CONCURRENCY hashes run at once per worker; further requests
+# wait up to PASSWORD_HASH_WAIT seconds for a turn and then fail with
+# PasswordHashBusy instead of tying up every request thread.
+
+DEFAULT_METHOD = 'scrypt'
+DEFAULT_WAIT = 5.0
+
+
+class PasswordHashBusy(Exception):
+    pass
+
+
+@lru_cache(maxsize=None)
+def method_parameters(method):
+    # Werkzeug fills in defaults ("scrypt" -> "scrypt:32768:8:1"); the
+    # stored prefix of a throwaway hash is the canonical form.
+    return generate_password_hash('', method=method).split('$', 1)[0]
+
+
+def password_method():
+    if has_app_context():
+        return current_app.config.get('PASSWORD_HASH_METHOD', DEFAULT_METHOD)
+    return DEFAULT_METHOD
+
+
+class HashSlots:
+    def __init__(self, concurrency, wait=DEFAULT_WAIT):
+        self.semaphore = threading.BoundedSemaphore(concurrency)
+        self.wait = wait
+
+    def run(self, fn, *args):
+        if not self.semaphore.acquire(timeout=self.wait):
+            raise PasswordHashBusy('Too many password checks in progress.')
+        try:
+            return fn(*args)
+        finally:
+            self.semaphore.release()
+
+
+def _run(fn, *args):
+    slots = current_app.extensions.get('password_slots') if has_app_context() else None
+    return slots.run(fn, *args) if slots else fn(*args)
+
+
+def hash_password(password, method=None):
+    return _run(generate_password_hash, password, method or password_method())
+
+
+def verify_password(password_hash, password):
+    return _run(check_password_hash, password_hash, password)
+
+
+def needs_rehash(password_hash, method=None):
+    return password_hash.split('$', 1)[0] != method_parameters(method or password_method())
+
+
+def init_passwords(app):
+    app.extensions['password_slots'] = HashSlots(
+        app.config.get('PASSWORD_HASH_CONCURRENCY') or os.cpu_count() or 1,
+        app.config.get('PASSWORD_HASH_WAIT', DEFAULT_WAIT),
+    )
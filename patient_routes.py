@@ -1,8 +1,17 @@
-from flask import Blueprint, render_template, request, redirect, url_for, flash
+from flask import Blueprint, render_template, request, redirect, url_for, flash, jsonify
 from flask_login import login_required, current_user
-from models import db, Department, Doctor, Patient, Appointment, DoctorAvailability
+from models import db, Doctor, Patient, Appointment
 from datetime import datetime, date, timedelta
 from functools import wraps
+import queries
+from pagination import paginate
+from search import paginate_matching, autocomplete
+from booking import claim_slot, BookingError
+from scheduling import SlotMap, next_free_slots
+from availability import upcoming_availability
+from replicas import use_primary
+from conditional import conditional, appointment_state, today_state
+from fanout import gather
 
 patient_bp = Blueprint('patient', __name__, url_prefix='/patient')
 
@@ -16,24 +25,37 @@ def patient_required(f):
         return f(*args, **kwargs)
     return decorated_function
 
+def parse_slot(value):
+    slot = datetime.strptime(value, '%Y-%m-%dT%H:%M')
+    return slot.date(), slot.time()
+
+def patient_scope():
+    return appointment_state(Appointment.patient_id == current_user.patient_id)
+
+
+def patient_today_scope():
+    return today_state(Appointment.patient_id == current_user.patient_id)
+
 @patient_bp.route('/dashboard')
 @login_required
 @patient_required
+@conditional(patient_today_scope)
 def patient_dashboard():
-    patient = Patient.query.filter_by(user_id=current_user.id).first()
-    departments = Department.query.all()
+    patient_id = current_user.patient_id
     today = date.today()
-    upcoming_appointments = Appointment.query.filter(
-        Appointment.patient_id == patient.id,
-        Appointment.appointment_date >= today,
-        Appointment.status == 'Booked'
-    ).order_by(Appointment.appointment_date, Appointment.appointment_time).all()
-    past_appointments = Appointment.query.filter(
-        Appointment.patient_id == patient.id,
-        Appointment.status == 'Completed'
-    ).order_by(Appointment.appointment_date.desc()).limit(5).all()
-    return render_template('patient/dashboard.html', patient=patient, departments=departments,
-        upcoming_appointments=upcoming_appointments, past_appointments=past_appointments)
+    results = gather(
+        upcoming=lambda: queries.appointments_for_patient().filter(
+            Appointment.patient_id == patient_id,
+            Appointment.appointment_date >= today,
+            Appointment.status == 'Booked'
+        ).order_by(Appointment.appointment_date, Appointment.appointment_time).all(),
+        past=lambda: queries.appointments_for_patient().filter(
+            Appointment.patient_id == patient_id,
+            Appointment.status == 'Completed'
+        ).order_by(Appointment.appointment_date.desc()).limit(5).all(),
+    )
+    return render_template('patient/dashboard.html',
+        upcoming_appointments=results['upcoming'], past_appointments=results['past'])
 
 @patient_bp.route('/doctors')
 @login_required
@@ -41,88 +63,88 @@ def patient_dashboard():
 def patient_doctors():
     search_query = request.args.get('search', '')
     department_id = request.args.get('department', '')
-    query = Doctor.query
     if search_query:
-        query = query.filter(
-            (Doctor.full_name.ilike(f'%{search_query}%')) |
-            (Doctor.specialization.ilike(f'%{search_query}%'))
-        )
-    if department_id:
-        query = query.filter_by(department_id=int(department_id))
-    doctors = query.all()
-    departments = Department.query.all()
-    today = date.today()
-    week_end = today + timedelta(days=7)
-    doctor_availability = {}
-    for doctor in doctors:
-        availability = DoctorAvailability.query.filter(
-            DoctorAvailability.doctor_id == doctor.id,
-            DoctorAvailability.date >= today,
-            DoctorAvailability.date <= week_end,
-            DoctorAvailability.is_available == True
-        ).order_by(DoctorAvailability.date, DoctorAvailability.start_time).all()
-        doctor_availability[doctor.id] = availability
+        query = queries.doctors_with_department()
+        if department_id:
+            query = query.filter(Doctor.department_id == int(department_id))
+        doctors = paginate_matching(query, Doctor, search_query)
+    else:
+        doctors = queries.doctor_roster(int(department_id) if department_id else None)
+    departments = queries.departments()
+    doctor_availability = upcoming_availability([doctor.id for doctor in doctors], per_doctor=3)
     return render_template('patient/doctors.html', doctors=doctors, departments=departments,
         doctor_availability=doctor_availability, search_query=search_query, selected_department=department_id)
 
+@patient_bp.route('/doctors/autocomplete')
+@login_required
+@patient_required
+def patient_doctors_autocomplete():
+    return jsonify(autocomplete(Doctor, request.args.get('q', '')))
+
 @patient_bp.route('/book/<int:doctor_id>', methods=['GET', 'POST'])
 @login_required
 @patient_required
 def patient_book_appointment(doctor_id):
-    doctor = Doctor.query.get_or_404(doctor_id)
-    patient = Patient.query.filter_by(user_id=current_user.id).first()
+    doctor = queries.doctors_with_department().filter(Doctor.id == doctor_id).first_or_404()
+    patient_id = current_user.patient_id
     if request.method == 'POST':
-        appointment_date = datetime.strptime(request.form.get('appointment_date'), '%Y-%m-%d').date()
-        appointment_time = datetime.strptime(request.form.get('appointment_time'), '%H:%M').time()
+        slot = request.form.get('slot')
+        if slot:
+            appointment_date, appointment_time = parse_slot(slot)
+        else:
+            appointment_date = datetime.strptime(request.form.get('appointment_date'), '%Y-%m-%d').date()
+            appointment_time = datetime.strptime(request.form.get('appointment_time'), '%H:%M').time()
         reason = request.form.get('reason')
-        existing = Appointment.query.filter_by(
-            doctor_id=doctor_id,
-            appointment_date=appointment_date,
-            appointment_time=appointment_time
-        ).filter(Appointment.status != 'Cancelled').first()
-        if existing:
-            flash('This time slot is already booked. Please choose another time.', 'danger')
+        try:
+            claim_slot(patient_id, doctor_id, appointment_date, appointment_time, reason=reason)
+        except BookingError as e:
+            flash(str(e), 'danger')
             return redirect(url_for('patient.patient_book_appointment', doctor_id=doctor_id))
-        appointment = Appointment(
-            patient_id=patient.id,
-            doctor_id=doctor_id,
-            appointment_date=appointment_date,
-            appointment_time=appointment_time,
-            reason=reason,
-            status='Booked'
-        )
-        db.session.add(appointment)
-        db.session.commit()
         flash('Appointment booked successfully!', 'success')
         return redirect(url_for('patient.patient_dashboard'))
     today = date.today()
-    week_end = today + timedelta(days=7)
-    availabilities = DoctorAvailability.query.filter(
-        DoctorAvailability.doctor_id == doctor_id,
-        DoctorAvailability.date >= today,
-        DoctorAvailability.date <= week_end,
-        DoctorAvailability.is_available == True
-    ).order_by(DoctorAvailability.date, DoctorAvailability.start_time).all()
-    return render_template('patient/book_appointment.html', doctor=doctor, availabilities=availabilities)
+    slot_map = SlotMap.load([doctor_id], today, today + timedelta(days=7))
+    return render_template('patient/book_appointment.html', doctor=doctor, slots_by_day=slot_map.by_day(doctor_id))
+
+@patient_bp.route('/slots')
+@login_required
+@patient_required
+@use_primary
+def patient_slots():
+    doctor_ids = request.args.getlist('doctor', type=int)
+    department_id = request.args.get('department', type=int)
+    if department_id:
+        doctor_ids += [doctor_id for (doctor_id,) in db.session.query(Doctor.id).filter(
+            Doctor.department_id == department_id)]
+    days = min(request.args.get('days', 7, type=int), 31)
+    limit = min(request.args.get('limit', 10, type=int), 100)
+    slots = next_free_slots(doctor_ids, days=days, limit=limit)
+    names = dict(db.session.query(Doctor.id, Doctor.full_name).filter(
+        Doctor.id.in_({slot['doctor_id'] for slot in slots})))
+    return jsonify([{
+        'doctor_id': slot['doctor_id'],
+        'doctor_name': names.get(slot['doctor_id']),
+        'date': slot['date'].isoformat(),
+        'time': slot['time'].strftime('%H:%M'),
+    } for slot in slots])
 
 @patient_bp.route('/appointments')
 @login_required
 @patient_required
+@conditional(patient_scope)
 def patient_appointments():
-    patient = Patient.query.filter_by(user_id=current_user.id).first()
-    appointments = Appointment.query.filter_by(patient_id=patient.id).order_by(
-        Appointment.appointment_date.desc(),
-        Appointment.appointment_time.desc()
-    ).all()
+    patient_id = current_user.patient_id
+    appointments = paginate(queries.appointments_for_patient().filter_by(patient_id=patient_id),
+                            queries.APPOINTMENT_ORDER)
     return render_template('patient/appointments.html', appointments=appointments)
 
 @patient_bp.route('/appointment/<int:appointment_id>/cancel', methods=['POST'])
 @login_required
 @patient_required
 def patient_cancel_appointment(appointment_id):
-    patient = Patient.query.filter_by(user_id=current_user.id).first()
+    patient_id = current_user.patient_id
     appointment = Appointment.query.get_or_404(appointment_id)
-    if appointment.patient_id != patient.id:
+    if appointment.patient_id != patient_id:
         flash('Unauthorized access.', 'danger')
         return redirect(url_for('patient.patient_dashboard'))
     if appointment.status != 'Booked':
@@ -137,7 +159,7 @@ def patient_cancel_appointment(appointment_id):
 @login_required
 @patient_required
 def patient_profile():
-    patient = Patient.query.filter_by(user_id=current_user.id).first()
+    patient = db.session.get(Patient, current_user.patient_id)
     if request.method == 'POST':
         patient.full_name = request.form.get('full_name')
         patient.contact_number = request.form.get('contact_number')
@@ -156,10 +178,8 @@ def patient_profile():
 @patient_bp.route('/history')
 @login_required
 @patient_required
+@conditional(patient_scope)
 def patient_history():
-    patient = Patient.query.filter_by(user_id=current_user.id).first()
-    completed_appointments = Appointment.query.filter_by(
-        patient_id=patient.id,
-        status='Completed'
-    ).order_by(Appointment.appointment_date.desc()).all()
-    return render_template('patient/history.html', appointments=completed_appointments)
+    patient_id = current_user.patient_id
+    visits = paginate(queries.patient_timeline(patient_id), queries.TIMELINE_ORDER)
+    return render_template('patient/history.html', visits=visits)
@@ -0,0 +1,227 @@
+import click
+import contextvars
+import re
+from flask import current_app, url_for
+from flask.cli import with_appcontext
+from sqlalchemy import event
+from models import db, User, Department, Doctor, Patient, Appointment
+
+# Query plan check: requests every GET view of the role blueprints and of
+# the JSON API as a signed-in user of each role, captures the SELECTs each
+# view issues and runs EXPLAIN on them against the configured database. A
+# plan that reads a whole table (SQLite "SCAN <table>", Postgres "Seq Scan
+# on <table>", or an index walk with no index condition) fails the check
+# unless the table is small reference data, or the walk follows the table's
+# key or an index in the requested order, drives a top-level LIMIT and nothing filters or
+# groups the rows it reads, so it stops after one page.
+
+# rollup_dirty_days is a queue emptied by every analytics refresh.
+REFERENCE_TABLES = {'departments', 'rollup_dirty_days'}
+
+# Bulk exports read every matching row by design.
+FULL_EXPORT_ENDPOINTS = {'admin.admin_export_appointments'}
+
+SEARCH_ARGS = {'search': 'a', 'q': 'a'}
+
+_SQLITE_SCAN = re.compile(r'^SCAN (\w+)')
+_POSTGRES_SCAN = re.compile(r'Seq Scan on (\w+)')
+_POSTGRES_INDEX_WALK = re.compile(r'Index (?:Only )?Scan (?:Backward )?using \w+ on (\w+)')
+_POSTGRES_SORT = re.compile(r'^\s*(->\s+)?(Incremental )?Sort\b')
+_PARENTHESISED = re.compile(r'\([^()]*\)')
+_ORDERED_PAGE = re.compile(r'\bORDER BY\b.*\bLIMIT\b', re.IGNORECASE | re.DOTALL)
+_FILTERED = re.compile(r'\b(WHERE|GROUP BY|HAVING)\b', re.IGNORECASE)
+
+
+def _table_name(name, tables):
+    # Eager loads alias joined tables as <table>_1, <table>_2, ...
+    base = re.sub(r'_\d+$', '', name)
+    return base if base in tables else None
+
+
+def _explain(statement, parameters):
+    connection = db.engine.raw_connection()
+    try:
+        cursor = connection.cursor()
+        if db.engine.dialect.name == 'sqlite':
+            # Rows are (id, parent, _, detail); indent each by its depth so
+            # nested loops read like the Postgres plan.
+            cursor.execute('EXPLAIN QUERY PLAN ' + statement, parameters)
+            depth, lines = {}, []
+            for node, parent, _, detail in cursor.fetchall():
+                depth[node] = depth[parent] + 1 if parent in depth else 0
+                lines.append('  ' * depth[node] + detail)
+            return lines
+        cursor.execute('EXPLAIN ' + statement, parameters)
+        return [row[0] for row in cursor.fetchall()]
+    finally:
+        connection.close()
+
+
+def _top_level(statement):
+    # The statement with every parenthesised part (subqueries, IN lists,
+    # function arguments) removed.
+    previous = None
+    while previous != statement:
+        previous, statement = statement, _PARENTHESISED.sub(' ', statement)
+    return statement
+
+
+def _unfiltered_page(statement):
+    # A top-level ORDER BY ... LIMIT over rows nothing filters or groups: a
+    # walk that already yields that order stops after one page.
+    outer = _top_level(statement)
+    return _ORDERED_PAGE.search(outer) is not None and _FILTERED.search(outer) is None
+
+
+def _sqlite_scans(plan, page):
+    # Without a temp b-tree the outermost loop (the rowid table or an index)
+    # already yields the ORDER BY.
+    sorted_in_memory = any('USE TEMP B-TREE' in line for line in plan)
+    scans = []
+    for number, line in enumerate(plan):
+        match = _SQLITE_SCAN.match(line.strip())
+        if not match or 'VIRTUAL TABLE' in line:
+            continue
+        driving = number == 0 and not line.startswith(' ')
+        if page and driving and not sorted_in_memory:
+            continue
+        scans.append(match.group(1))
+    return scans
+
+
+def _postgres_scans(plan, page):
+    # Group the text plan into nodes: a node line plus the detail lines
+    # (Filter:, Index Cond:, ...) under it.
+    nodes = []
+    for line in plan:
+        if not nodes or line.strip().startswith('->'):
+            nodes.append((line, []))
+        else:
+            nodes[-1][1].append(line.strip())
+    sorted_in_memory = any(_POSTGRES_SORT.search(line) for line, _ in nodes)
+    limited = page and nodes and nodes[0][0].strip().startswith('Limit')
+    scans = []
+    for number, (line, details) in enumerate(nodes):
+        match = _POSTGRES_SCAN.search(line)
+        if match:
+            scans.append(match.group(1))
+            continue
+        match = _POSTGRES_INDEX_WALK.search(line)
+        if not match or any(detail.startswith('Index Cond') for detail in details):
+            continue
+        filtered = any(detail.startswith('Filter') for detail in details)
+        if limited and number == 1 and not filtered and not sorted_in_memory:
+            continue
+        scans.append(match.group(1))
+    return scans
+
+
+def full_scans(statement, plan):
+    tables = set(db.metadata.tables) - REFERENCE_TABLES
+    page = _unfiltered_page(statement)
+    if db.engine.dialect.name == 'sqlite':
+        scans = _sqlite_scans(plan, page)
+    else:
+        scans = _postgres_scans(plan, page)
+    return [table for table in (_table_name(scan, tables) for scan in scans) if table]
+
+
+def role_fixtures():
+    fixtures = {}
+    admin = User.query.filter_by(role='admin').first()
+    appointment = Appointment.query.first()
+    department = Department.query.first()
+    if admin:
+        fixtures['admin'] = (admin, {
+            'doctor_id': appointment.doctor_id if appointment else None,
+            'patient_id': appointment.patient_id if appointment else None,
+            'department_id': department.id if department else None,
+        })
+    doctor = Doctor.query.join(Appointment).first() or Doctor.query.first()
+    if doctor:
+        own = Appointment.query.filter_by(doctor_id=doctor.id).first()
+        fixtures['doctor'] = (doctor.user, {
+            'appointment_id': own.id if own else None,
+            'patient_id': own.patient_id if own else None,
+        })
+    patient = Patient.query.join(Appointment).first() or Patient.query.first()
+    if patient:
+        fixtures['patient'] = (patient.user, {
+            'doctor_id': doctor.id if doctor else None,
+            'appointment_id': None,
+        })
+    return fixtures
+
+
+def view_urls(app, role, ids):
+    for rule in app.url_map.iter_rules():
+        if not rule.endpoint.startswith((role + '.', 'api.')) or 'GET' not in rule.methods:
+            continue
+        if any(ids.get(argument) is None for argument in rule.arguments):
+            continue
+        values = {argument: ids[argument] for argument in rule.arguments}
+        yield rule.endpoint, url_for(rule.endpoint, **values)
+        yield rule.endpoint, url_for(rule.endpoint, **values, **SEARCH_ARGS)
+
+
+def sign_in(client, user):
+    with client.session_transaction() as session:
+        session['_user_id'] = str(user.id)
+        session['_fresh'] = True
+
+
+def _fetch(client, url):
+    # Streamed responses run their queries while the body is read; read and
+    # close it inside the same context.
+    response = client.get(url)
+    response.get_data()
+    response.close()
+
+
+def check_plans():
+    app = current_app._get_current_object()
+    failures = []
+    checked = 0
+    captured = []
+
+    def capture(conn, cursor, statement, parameters, context, executemany):
+        if statement.lstrip().upper().startswith(('SELECT', 'WITH')):
+            captured.append((statement, parameters))
+
+    with app.test_request_context():
+        fixtures = role_fixtures()
+        views = {role: list(view_urls(app, role, ids)) for role, (user, ids) in fixtures.items()}
+    event.listen(db.engine, 'before_cursor_execute', capture)
+    try:
+        for role, (user, _) in fixtures.items():
+            client = app.test_client()
+            sign_in(client, user)
+            for endpoint, url in views[role]:
+                captured.clear()
+                # Run outside the CLI's app context so each request gets its
+                # own app context, session and g, as it would when served.
+                contextvars.Context().run(_fetch, client, url)
+                for statement, parameters in list(captured):
+                    plan = _explain(statement, parameters)
+                    checked += 1
+                    scans = full_scans(statement, plan)
+                    if scans and endpoint not in FULL_EXPORT_ENDPOINTS:
+                        failures.append((endpoint, url, scans, statement, plan))
+    finally:
+        event.remove(db.engine, 'before_cursor_execute', capture)
+    return checked, failures
+
+
+@click.command('db-check-plans')
+@with_appcontext
+def check_plans_command():
+    """EXPLAIN every blueprint query and fail on full table scans."""
+    checked, failures = check_plans()
+    for endpoint, url, scans, statement, plan in failures:
+        click.echo(f'FULL SCAN of {", ".join(sorted(set(scans)))} in {endpoint} ({url})')
+        click.echo('  ' + ' '.join(statement.split()))
+        for line in plan:
+            click.echo(f'    {line}')
+    click.echo(f'{checked} queries checked, {len(failures)} with full table scans.')
+    if failures:
+        raise SystemExit(1)
@@ -0,0 +1,120 @@
+from collections import namedtuple
+from flask import request
+from sqlalchemy import func
+from sqlalchemy.orm import configure_mappers, joinedload, selectinload
+from models import db, Department, Doctor, Patient, Appointment, PatientTimelineEntry
+from cache import DEPARTMENTS, DOCTORS, cached
+from pagination import KeysetPage, keyset_paginate, page_size
+
+# Relationships such as Appointment.patient are backrefs, which only exist
+# once the mappers are configured.
+configure_mappers()
+
+# Every list page builds its query here so that the relationships touched by
+# its template are loaded up front instead of one lazy SELECT per row.
+# Many-to-one sides are joined into the main query; the one-to-one treatment
+# is fetched with a single follow-up IN query.
+
+
+def doctors_with_department():
+    return Doctor.query.options(joinedload(Doctor.department))
+
+
+def patients_with_user():
+    return Patient.query.options(joinedload(Patient.user))
+
+
+def department_doctor_counts():
+    # One indexed count per department rather than a GROUP BY over every doctor.
+    doctor_count = db.select(func.count(Doctor.id)).where(
+        Doctor.department_id == Department.id).scalar_subquery()
+    return dict(db.session.query(Department.id, doctor_count).all())
+
+
+def appointments_with_parties():
+    # Admin views: patient and doctor names.
+    return Appointment.query.options(
+        joinedload(Appointment.patient),
+        joinedload(Appointment.doctor)
+    )
+
+
+def appointments_for_doctor():
+    # Doctor views: patient name and whether a treatment exists.
+    return Appointment.query.options(
+        joinedload(Appointment.patient),
+        selectinload(Appointment.treatment)
+    )
+
+
+def appointments_for_patient():
+    # Patient views: doctor, department and treatment details.
+    return Appointment.query.options(
+        joinedload(Appointment.doctor).joinedload(Doctor.department),
+        selectinload(Appointment.treatment)
+    )
+
+
+def appointment_detail(appointment_id):
+    return Appointment.query.options(
+        joinedload(Appointment.patient),
+        joinedload(Appointment.treatment)
+    ).filter(Appointment.id == appointment_id).first_or_404()
+
+
+def patient_timeline(patient_id):
+    # History pages read the timeline read model (timeline.py): one row per
+    # completed visit, names and treatment included, hot or archived.
+    return PatientTimelineEntry.query.filter(PatientTimelineEntry.patient_id == patient_id)
+
+
+# Sort keys used for keyset pagination; each ends with the primary key so
+# the ordering is total.
+APPOINTMENT_ORDER = [
+    (Appointment.appointment_date, True),
+    (Appointment.appointment_time, True),
+    (Appointment.id, True)
+]
+TIMELINE_ORDER = [
+    (PatientTimelineEntry.appointment_date, True),
+    (PatientTimelineEntry.appointment_time, True),
+    (PatientTimelineEntry.appointment_id, True)
+]
+DOCTOR_ORDER = [(Doctor.id, False)]
+PATIENT_ORDER = [(Patient.id, False)]
+
+
+# Reference data served from the cache (see cache.py) as plain rows, so a
+# cached copy never touches a session. Rows keep the attribute names the
+# templates already use.
+DepartmentRow = namedtuple('DepartmentRow', 'id name description')
+DoctorRow = namedtuple('DoctorRow', 'id full_name specialization qualification experience_years department')
+
+
+def departments():
+    return cached('departments', lambda: [
+        DepartmentRow(*row) for row in
+        db.session.query(Department.id, Department.name, Department.description).order_by(Department.id)
+    ], tags=(DEPARTMENTS,))
+
+
+def _doctor_row(doctor):
+    department = doctor.department
+    return DoctorRow(doctor.id, doctor.full_name, doctor.specialization, doctor.qualification,
+                     doctor.experience_years, DepartmentRow(department.id, department.name, department.description))
+
+
+def doctor_roster(department_id=None):
+    # One page of the patient-facing doctor list, keyed by filter and cursor.
+    cursor = request.args.get('cursor')
+    per_page = page_size()
+
+    def load():
+        query = doctors_with_department()
+        if department_id:
+            query = query.filter(Doctor.department_id == department_id)
+        page = keyset_paginate(query, DOCTOR_ORDER, cursor=cursor, per_page=per_page)
+        return KeysetPage([_doctor_row(doctor) for doctor in page.items], page.next_cursor, page.prev_cursor)
+
+    return cached(f'doctor-roster:{department_id or ""}:{cursor or ""}:{per_page}', load,
+                  tags=(DOCTORS, DEPARTMENTS))
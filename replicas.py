@@ -0,0 +1,169 @@
+import click
+import random
+import threading
+import time
+from datetime import datetime
+from flask import current_app, g, has_app_context, has_request_context, request, session as user_session
+from flask.cli import with_appcontext
+from flask_sqlalchemy.session import Session
+from sqlalchemy import event
+from sqlalchemy.exc import SQLAlchemyError
+
+# Read-replica routing. Replicas are extra binds (DATABASE_REPLICA_URLS,
+# comma separated) holding a copy of the primary. During GET/HEAD requests
+# the routing session sends SELECTs to a replica; flushes, anything after a
+# flush, and every other request go to the primary. After a request that
+# wrote, the same browser session reads from the primary for
+# REPLICA_READ_YOUR_WRITES_SECONDS so it sees its own changes. Views can
+# force a side with @use_primary / @use_replica.
+#
+# Lag is measured with a heartbeat row that the primary stamps every
+# REPLICA_LAG_CHECK_SECONDS: lag is how far the replica's copy of that row
+# trails the primary's. A replica more than REPLICA_MAX_LAG_SECONDS behind
+# (or unreachable) is skipped until a later check finds it caught up. This
+# works for any replication method, including copying SQLite files.
+
+REPLICA_BIND_PREFIX = 'replica_'
+READ_METHODS = {'GET', 'HEAD'}
+PRIMARY_UNTIL = '_db_primary_until'
+
+
+def use_primary(view):
+    view.db_route = 'primary'
+    return view
+
+
+def use_replica(view):
+    view.db_route = 'replica'
+    return view
+
+
+class RoutingSession(Session):
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        if bind is None and getattr(clause, 'is_select', False) and not self.info.get('wrote'):
+            engine = _request_replica(self._db, mapper)
+            if engine is not None:
+                return engine
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+
+
+def _request_replica(db, mapper):
+    if not has_app_context() or g.get('db_route') != 'replica':
+        return None
+    if mapper is not None and mapper.persist_selectable.info.get('bind_key') is not None:
+        return None
+    if 'db_replica' not in g:
+        replicas = current_app.extensions.get('replicas')
+        g.db_replica = replicas.choose() if replicas else None
+    return g.db_replica
+
+
+def _route_request():
+    view = current_app.view_functions.get(request.endpoint)
+    forced = getattr(view, 'db_route', None)
+    if forced:
+        g.db_route = forced
+    elif request.method not in READ_METHODS or user_session.get(PRIMARY_UNTIL, 0) > time.time():
+        g.db_route = 'primary'
+    else:
+        g.db_route = 'replica'
+
+
+def _mark_wrote(session, flush_context):
+    session.info['wrote'] = True
+
+
+def _pin_to_primary(session):
+    if session.info.pop('wrote', False) and has_request_context():
+        seconds = current_app.config.get('REPLICA_READ_YOUR_WRITES_SECONDS', 10)
+        user_session[PRIMARY_UNTIL] = time.time() + seconds
+        g.db_route = 'primary'
+
+
+class ReplicaSet:
+    def __init__(self, db, app, keys):
+        self.db = db
+        self.app = app
+        self.keys = keys
+        self.max_lag = app.config.get('REPLICA_MAX_LAG_SECONDS', 10)
+        self.interval = app.config.get('REPLICA_LAG_CHECK_SECONDS', 5)
+        self.lags = {}
+        self.checked_at = 0.0
+        self.lock = threading.Lock()
+
+    def choose(self):
+        self.refresh()
+        healthy = [key for key in self.keys if self.lags.get(key, float('inf')) <= self.max_lag]
+        return self.db.engines[random.choice(healthy)] if healthy else None
+
+    def refresh(self, force=False):
+        if not force and time.monotonic() - self.checked_at < self.interval:
+            return
+        if not self.lock.acquire(blocking=False):
+            return
+        try:
+            self.lags = {key: measure_lag(self.db, key, self.interval) for key in self.keys}
+            self.checked_at = time.monotonic()
+        finally:
+            self.lock.release()
+
+
+def measure_lag(db, key, interval):
+    from models import ReplicaHeartbeat
+    table = ReplicaHeartbeat.__table__
+    beat = db.select(table.c.beat_at).where(table.c.id == 1)
+    try:
+        # Replica first: a beat stamped below cannot have replicated yet.
+        with db.engines[key].connect() as connection:
+            replica_beat = connection.execute(beat).scalar()
+        with db.engine.begin() as connection:
+            primary_beat = connection.execute(beat).scalar()
+            now = datetime.utcnow()
+            if primary_beat is None:
+                connection.execute(table.insert().values(id=1, beat_at=now))
+            elif (now - primary_beat).total_seconds() >= interval:
+                connection.execute(table.update().where(table.c.id == 1).values(beat_at=now))
+    except SQLAlchemyError:
+        return float('inf')
+    if primary_beat is None:
+        return 0.0
+    if replica_beat is None:
+        return float('inf')
+    return max(0.0, (primary_beat - replica_beat).total_seconds())
+
+
+def replica_binds(urls):
+    binds = {}
+    for number, url in enumerate(value.strip() for value in urls.split(',') if value.strip()):
+        if url.startswith('postgres://'):
+            url = url.replace('postgres://', 'postgresql://', 1)
+        binds[f'{REPLICA_BIND_PREFIX}{number}'] = url
+    return binds
+
+
+@click.command('replica-status')
+@with_appcontext
+def replica_status_command():
+    """Show each read replica's measured lag."""
+    replicas = current_app.extensions.get('replicas')
+    if not replicas:
+        click.echo('No read replicas configured (DATABASE_REPLICA_URLS).')
+        return
+    replicas.refresh(force=True)
+    for key in replicas.keys:
+        lag = replicas.lags.get(key, float('inf'))
+        state = 'ok' if lag <= replicas.max_lag else 'skipped'
+        click.echo(f'{key}: lag {lag:.1f}s ({state}, max {replicas.max_lag}s)')
+
+
+def init_replicas(app, db):
+    app.cli.add_command(replica_status_command)
+    keys = sorted(key for key in app.config.get('SQLALCHEMY_BINDS') or {}
+                  if key.startswith(REPLICA_BIND_PREFIX))
+    if not keys:
+        return
+    app.extensions['replicas'] = ReplicaSet(db, app, keys)
+    app.before_request(_route_request)
+    for name, listener in (('after_flush', _mark_wrote), ('after_commit', _pin_to_primary)):
+        if not event.contains(RoutingSession, name, listener):
+            event.listen(RoutingSession, name, listener)
@@ -0,0 +1,132 @@
+import heapq
+from flask import current_app
+from datetime import date, datetime, time, timedelta
+from models import db, Appointment, DoctorAvailability
+
+# Discrete bookable slots. Each doctor-day is a bitmap over the day's
+# SLOT_MINUTES slots: bit i set means slot i (starting i * SLOT_MINUTES after
+# midnight) is free. Availability windows are OR-ed in, active appointments
+# masked out, so "what is free" for a whole roster is a handful of integer
+# operations per doctor-day instead of comparing every slot with every
+# appointment. Both inputs are read with one range query each.
+
+DEFAULT_SLOT_MINUTES = 15
+
+
+def slot_minutes():
+    return current_app.config.get('SLOT_MINUTES', DEFAULT_SLOT_MINUTES)
+
+
+def _minutes(value):
+    return value.hour * 60 + value.minute
+
+
+def slot_index(value, minutes):
+    return _minutes(value) // minutes
+
+
+def slot_time(index, minutes):
+    start = index * minutes
+    return time(start // 60, start % 60)
+
+
+def is_slot_start(value, minutes=None):
+    minutes = minutes or slot_minutes()
+    return value.second == 0 and value.microsecond == 0 and _minutes(value) % minutes == 0
+
+
+def window_mask(start_time, end_time, minutes):
+    # Slots lying entirely inside [start_time, end_time).
+    first = -(-_minutes(start_time) // minutes)
+    last = _minutes(end_time) // minutes
+    if last <= first:
+        return 0
+    return ((1 << (last - first)) - 1) << first
+
+
+def _lowest_bits(mask):
+    while mask:
+        low = mask & -mask
+        yield low.bit_length() - 1
+        mask ^= low
+
+
+def _slot_stream(doctor_id, day, mask):
+    for index in _lowest_bits(mask):
+        yield day, index, doctor_id
+
+
+class SlotMap:
+    def __init__(self, minutes, masks):
+        self.minutes = minutes
+        self.masks = masks
+
+    @classmethod
+    def load(cls, doctor_ids, start_date, end_date, minutes=None, now=None):
+        minutes = minutes or slot_minutes()
+        doctor_ids = list(doctor_ids)
+        masks = {}
+        if not doctor_ids:
+            return cls(minutes, masks)
+        windows = db.session.query(
+            DoctorAvailability.doctor_id, DoctorAvailability.date,
+            DoctorAvailability.start_time, DoctorAvailability.end_time
+        ).filter(
+            DoctorAvailability.doctor_id.in_(doctor_ids),
+            DoctorAvailability.date >= start_date,
+            DoctorAvailability.date <= end_date,
+            DoctorAvailability.is_available == True
+        )
+        for doctor_id, day, start_time, end_time in windows:
+            key = (doctor_id, day)
+            masks[key] = masks.get(key, 0) | window_mask(start_time, end_time, minutes)
+        booked = db.session.query(
+            Appointment.doctor_id, Appointment.appointment_date, Appointment.appointment_time
+        ).filter(
+            Appointment.doctor_id.in_(doctor_ids),
+            Appointment.appointment_date >= start_date,
+            Appointment.appointment_date <= end_date,
+            Appointment.status != 'Cancelled'
+        )
+        taken = {}
+        for doctor_id, day, appointment_time in booked:
+            key = (doctor_id, day)
+            if key in masks:
+                taken[key] = taken.get(key, 0) | (1 << slot_index(appointment_time, minutes))
+        for key, mask in taken.items():
+            masks[key] &= ~mask
+        now = now or datetime.now()
+        if start_date <= now.date() <= end_date:
+            # Drop slots of today that have already started.
+            elapsed = (1 << (slot_index(now.time(), minutes) + 1)) - 1
+            for key in masks:
+                if key[1] == now.date():
+                    masks[key] &= ~elapsed
+        return cls(minutes, masks)
+
+    def free_slots(self, doctor_id, day):
+        return [slot_time(index, self.minutes) for index in _lowest_bits(self.masks.get((doctor_id, day), 0))]
+
+    def is_free(self, doctor_id, day, value):
+        return bool(self.masks.get((doctor_id, day), 0) >> slot_index(value, self.minutes) & 1)
+
+    def earliest(self, limit=10):
+        # Next `limit` free (day, time, doctor) slots across every loaded
+        # doctor, merged in time order by lazily walking each bitmap.
+        streams = [_slot_stream(doctor_id, day, mask) for (doctor_id, day), mask in self.masks.items() if mask]
+        slots = []
+        for day, index, doctor_id in heapq.merge(*streams):
+            slots.append({'doctor_id': doctor_id, 'date': day, 'time': slot_time(index, self.minutes)})
+            if len(slots) >= limit:
+                break
+        return slots
+
+    def by_day(self, doctor_id):
+        days = sorted(day for (owner, day), mask in self.masks.items() if owner == doctor_id and mask)
+        return [(day, self.free_slots(doctor_id, day)) for day in days]
+
+
+def next_free_slots(doctor_ids, days=7, limit=10, start_date=None):
+    start_date = start_date or date.today()
+    slot_map = SlotMap.load(doctor_ids, start_date, start_date + timedelta(days=days))
+    return slot_map.earliest(limit)
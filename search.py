@@ -0,0 +1,278 @@
+import click
+import re
+import sqlite3
+from functools import lru_cache
+from flask import current_app
+from flask.cli import with_appcontext
+from sqlalchemy import event, func, literal_column, or_, text, type_coerce
+from sqlalchemy.exc import DBAPIError
+from models import db, Doctor, Patient
+from pagination import KeysetPage, paginate
+
+# Indexed name/specialization/contact search. Each backend turns a search term
+# into a subquery of (id, rank) rows for a model; lower rank sorts first.
+#   * sqlite:   FTS5 tables kept in sync by mapper events
+#   * postgres: tsvector prefix match plus pg_trgm for contact numbers, both
+#               backed by GIN expression indexes
+#   * like:     the old leading-wildcard ILIKE scan, kept as a fallback and
+#               as the baseline for benchmarks/search.py
+
+SEARCH_FIELDS = {
+    Doctor: ('full_name', 'specialization'),
+    Patient: ('full_name', 'contact_number'),
+}
+
+AUTOCOMPLETE_LIMIT = 10
+
+_TOKEN_RE = re.compile(r'\w+', re.UNICODE)
+
+
+def _tokens(term):
+    return _TOKEN_RE.findall(term or '')
+
+
+class LikeSearch:
+    name = 'like'
+
+    def install(self):
+        pass
+
+    def rebuild(self):
+        pass
+
+    def add_rows(self, connection, model, rows):
+        pass
+
+    def matches(self, model, term):
+        pattern = f'%{term}%'
+        columns = [getattr(model, field) for field in SEARCH_FIELDS[model]]
+        return db.select(model.id.label('id'), literal_column('0').label('rank')).filter(
+            or_(*[column.ilike(pattern) for column in columns])
+        ).subquery()
+
+
+class SqliteFtsSearch:
+    name = 'sqlite-fts5'
+
+    def table(self, model):
+        return f'{model.__tablename__}_fts'
+
+    def install(self):
+        for model, fields in SEARCH_FIELDS.items():
+            db.session.execute(text(
+                f"CREATE VIRTUAL TABLE IF NOT EXISTS {self.table(model)} "
+                f"USING fts5({', '.join(fields)}, tokenize='unicode61')"
+            ))
+        db.session.commit()
+        for model in SEARCH_FIELDS:
+            if not db.session.execute(text(f'SELECT 1 FROM {self.table(model)} LIMIT 1')).first():
+                self.rebuild()
+                break
+
+    def rebuild(self):
+        for model, fields in SEARCH_FIELDS.items():
+            table = self.table(model)
+            columns = ', '.join(fields)
+            db.session.execute(text(f'DELETE FROM {table}'))
+            db.session.execute(text(
+                f'INSERT INTO {table} (rowid, {columns}) '
+                f'SELECT id, {columns} FROM {model.__tablename__}'
+            ))
+        db.session.commit()
+
+    def add_rows(self, connection, model, rows):
+        # Bulk inserts skip the mapper events; index their rows in one go.
+        if not rows:
+            return
+        fields = SEARCH_FIELDS[model]
+        connection.execute(text(
+            f"INSERT INTO {self.table(model)} (rowid, {', '.join(fields)}) "
+            f"VALUES (:id, {', '.join(':' + field for field in fields)})"
+        ), [{'id': row['id'], **{field: row.get(field) for field in fields}} for row in rows])
+
+    def sync(self, connection, target, delete=False):
+        model = type(target)
+        table = self.table(model)
+        connection.execute(text(f'DELETE FROM {table} WHERE rowid = :id'), {'id': target.id})
+        if not delete:
+            fields = SEARCH_FIELDS[model]
+            params = {field: getattr(target, field) for field in fields}
+            params['id'] = target.id
+            connection.execute(text(
+                f"INSERT INTO {table} (rowid, {', '.join(fields)}) "
+                f"VALUES (:id, {', '.join(':' + field for field in fields)})"
+            ), params)
+
+    def matches(self, model, term):
+        tokens = _tokens(term)
+        if not tokens:
+            return LikeSearch().matches(model, term)
+        table = self.table(model)
+        # Every token must match as a word prefix; FTS5's bm25 rank is
+        # negative with the best match lowest.
+        match = ' '.join(f'"{token}"*' for token in tokens)
+        return text(
+            f'SELECT rowid AS id, rank FROM {table} WHERE {table} MATCH :match'
+        ).bindparams(match=match).columns(id=db.Integer, rank=db.Float).subquery()
+
+
+class PostgresSearch:
+    name = 'postgres'
+
+    def _document(self, model):
+        fields = [field for field in SEARCH_FIELDS[model] if field != 'contact_number']
+        parts = [func.coalesce(getattr(model, field), '') for field in fields]
+        document = parts[0]
+        for part in parts[1:]:
+            document = document + ' ' + part
+        return func.to_tsvector('simple', document)
+
+    def install(self):
+        db.session.execute(text('CREATE EXTENSION IF NOT EXISTS pg_trgm'))
+        for model, fields in SEARCH_FIELDS.items():
+            table = model.__tablename__
+            document = " || ' ' || ".join(
+                f"coalesce({field}, '')" for field in fields if field != 'contact_number')
+            db.session.execute(text(
+                f'CREATE INDEX IF NOT EXISTS ix_{table}_search_tsv ON {table} '
+                f"USING gin (to_tsvector('simple', {document}))"
+            ))
+            if 'contact_number' in fields:
+                db.session.execute(text(
+                    f'CREATE INDEX IF NOT EXISTS ix_{table}_contact_trgm ON {table} '
+                    f'USING gin (contact_number gin_trgm_ops)'
+                ))
+        db.session.commit()
+
+    def rebuild(self):
+        for model in SEARCH_FIELDS:
+            db.session.execute(text(f'REINDEX TABLE {model.__tablename__}'))
+        db.session.commit()
+
+    def add_rows(self, connection, model, rows):
+        # Expression indexes on the base tables pick new rows up by themselves.
+        pass
+
+    def matches(self, model, term):
+        tokens = _tokens(term)
+        if not tokens:
+            return LikeSearch().matches(model, term)
+        document = self._document(model)
+        query = func.to_tsquery('simple', ' & '.join(f'{token}:*' for token in tokens))
+        conditions = [document.op('@@')(query)]
+        if 'contact_number' in SEARCH_FIELDS[model]:
+            # Phone numbers are matched anywhere through the trigram index.
+            conditions.append(model.contact_number.ilike(f'%{term}%'))
+        return db.select(model.id.label('id'), (-func.ts_rank(document, query)).label('rank')).filter(
+            or_(*conditions)
+        ).subquery()
+
+
+def _on_change(mapper, connection, target):
+    backend = current_app.extensions.get('search')
+    if isinstance(backend, SqliteFtsSearch):
+        backend.sync(connection, target)
+
+
+def _on_delete(mapper, connection, target):
+    backend = current_app.extensions.get('search')
+    if isinstance(backend, SqliteFtsSearch):
+        backend.sync(connection, target, delete=True)
+
+
+@lru_cache(maxsize=None)
+def _sqlite_has_fts5():
+    # Checked on a throwaway in-memory database so that picking the backend
+    # at app creation never touches the application database.
+    connection = sqlite3.connect(':memory:')
+    try:
+        connection.execute('CREATE VIRTUAL TABLE probe USING fts5(body)')
+        return True
+    except sqlite3.OperationalError:
+        return False
+    finally:
+        connection.close()
+
+
+def _select_backend(app):
+    configured = app.config.get('SEARCH_BACKEND')
+    if configured == 'like':
+        return LikeSearch()
+    uri = app.config['SQLALCHEMY_DATABASE_URI']
+    if uri.startswith('sqlite'):
+        return SqliteFtsSearch() if _sqlite_has_fts5() else LikeSearch()
+    if uri.startswith('postgresql'):
+        return PostgresSearch()
+    return LikeSearch()
+
+
+def init_search(app):
+    app.extensions['search'] = _select_backend(app)
+    for model in SEARCH_FIELDS:
+        for name, listener in (('after_insert', _on_change), ('after_update', _on_change),
+                               ('after_delete', _on_delete)):
+            if not event.contains(model, name, listener):
+                event.listen(model, name, listener)
+    app.cli.add_command(search_reindex_command)
+
+
+def install_search():
+    backend = current_app.extensions['search']
+    try:
+        backend.install()
+    except DBAPIError:
+        # SQLite builds without FTS5 (or Postgres without pg_trgm rights)
+        # fall back to the plain ILIKE scan.
+        db.session.rollback()
+        current_app.extensions['search'] = LikeSearch()
+
+
+def get_backend():
+    return current_app.extensions['search']
+
+
+def index_rows(connection, model, rows):
+    # For rows written with bulk INSERTs; each row needs its id and the
+    # model's SEARCH_FIELDS.
+    get_backend().add_rows(connection, model, rows)
+
+
+def filter_matching(query, model, term, backend=None):
+    matches = (backend or get_backend()).matches(model, term)
+    return query.filter(model.id.in_(db.select(matches.c.id)))
+
+
+def ranked_matching(query, model, term, backend=None):
+    matches = (backend or get_backend()).matches(model, term)
+    return query.join(matches, matches.c.id == model.id).order_by(matches.c.rank, model.id)
+
+
+def paginate_matching(query, model, term, backend=None):
+    # Keyset pages over the ranked matches: the cursor carries (rank, id) of
+    # the edge row, so Next/Prev walk the same ranking as the first page.
+    matches = (backend or get_backend()).matches(model, term)
+    rank = type_coerce(matches.c.rank, db.Float).label('rank')
+    query = query.join(matches, matches.c.id == model.id).add_columns(rank, model.id)
+    page = paginate(query, [(rank, False), (model.id, False)])
+    return KeysetPage([row[0] for row in page.items], page.next_cursor, page.prev_cursor)
+
+
+def autocomplete(model, term, limit=AUTOCOMPLETE_LIMIT):
+    if not _tokens(term):
+        return []
+    label_field, detail_field = SEARCH_FIELDS[model]
+    rows = ranked_matching(
+        db.session.query(model.id, getattr(model, label_field), getattr(model, detail_field)),
+        model, term
+    ).limit(limit).all()
+    return [{'id': row[0], 'label': row[1], 'detail': row[2]} for row in rows]
+
+
+@click.command('search-reindex')
+@with_appcontext
+def search_reindex_command():
+    """Rebuild the doctor/patient search index from the base tables."""
+    backend = get_backend()
+    backend.install()
+    backend.rebuild()
+    click.echo(f'Search index rebuilt ({backend.name}).')
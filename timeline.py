@@ -0,0 +1,116 @@
+import click
+from flask.cli import with_appcontext
+from sqlalchemy import event, inspect, true
+from models import (db, Department, Doctor, Appointment, Treatment, ArchivedAppointment, ArchivedTreatment,
+                    PatientTimelineEntry)
+
+# Patient timeline read model. patient_timeline holds one row per completed
+# visit (hot or archived) with the doctor's name and specialization, the
+# department and the treatment, so a history page is one index range scan
+# over (patient_id, appointment_date, appointment_time, appointment_id) with
+# nothing left to load per row.
+#
+# Rows are rewritten inside the flush that changes their source: completing
+# or cancelling an appointment (doctor_complete_appointment and friends) and
+# saving its treatment rewrite that visit's row; renaming a doctor or a
+# department, or moving a doctor, rewrites the copied names. Archival moves
+# rows with Core statements and leaves the timeline alone, which already
+# holds them. `flask timeline-rebuild` rebuilds the table from the base
+# tables.
+
+timeline = PatientTimelineEntry.__table__
+
+COLUMNS = ['appointment_id', 'patient_id', 'doctor_id', 'department_id', 'appointment_date', 'appointment_time',
+           'doctor_name', 'doctor_specialization', 'department_name', 'treatment_id', 'diagnosis', 'prescription',
+           'notes']
+
+# Source columns whose change rewrites a visit's row.
+WATCHED = ('status', 'appointment_date', 'appointment_time', 'doctor_id', 'patient_id')
+DOCTOR_WATCHED = ('full_name', 'specialization', 'department_id')
+
+
+def visits_select(appointment, treatment, where):
+    return db.select(
+        appointment.id, appointment.patient_id, appointment.doctor_id, Doctor.department_id,
+        appointment.appointment_date, appointment.appointment_time, Doctor.full_name, Doctor.specialization,
+        Department.name, treatment.id, treatment.diagnosis, treatment.prescription, treatment.notes
+    ).join(Doctor, Doctor.id == appointment.doctor_id).outerjoin(
+        Department, Department.id == Doctor.department_id
+    ).outerjoin(treatment, treatment.appointment_id == appointment.id).where(
+        appointment.status == 'Completed', where)
+
+
+def refresh_visits(connection, appointment_ids):
+    connection.execute(timeline.delete().where(timeline.c.appointment_id.in_(appointment_ids)))
+    connection.execute(timeline.insert().from_select(
+        COLUMNS, visits_select(Appointment, Treatment, Appointment.id.in_(appointment_ids))))
+
+
+def rebuild(connection):
+    connection.execute(timeline.delete())
+    sources = [(Appointment, Treatment)]
+    if inspect(connection).has_table(ArchivedAppointment.__tablename__):
+        sources.append((ArchivedAppointment, ArchivedTreatment))
+    for appointment, treatment in sources:
+        connection.execute(timeline.insert().from_select(COLUMNS, visits_select(appointment, treatment, true())))
+
+
+def _changed(target, names):
+    state = inspect(target)
+    return any(state.attrs[name].history.has_changes() for name in names)
+
+
+def _appointment_inserted(mapper, connection, target):
+    if target.status == 'Completed':
+        refresh_visits(connection, [target.id])
+
+
+def _appointment_deleted(mapper, connection, target):
+    connection.execute(timeline.delete().where(timeline.c.appointment_id == target.id))
+
+
+def _appointment_updated(mapper, connection, target):
+    if _changed(target, WATCHED):
+        refresh_visits(connection, [target.id])
+
+
+def _treatment_written(mapper, connection, target):
+    # Flushed after its appointment, so the row sees both.
+    refresh_visits(connection, [target.appointment_id])
+
+
+event.listen(Appointment, 'after_insert', _appointment_inserted)
+event.listen(Appointment, 'after_update', _appointment_updated)
+event.listen(Appointment, 'after_delete', _appointment_deleted)
+for _event in ('after_insert', 'after_update', 'after_delete'):
+    event.listen(Treatment, _event, _treatment_written)
+
+
+@event.listens_for(Doctor, 'after_update')
+def _doctor_updated(mapper, connection, target):
+    if not _changed(target, DOCTOR_WATCHED):
+        return
+    department = db.select(Department.name).where(Department.id == target.department_id).scalar_subquery()
+    connection.execute(timeline.update().where(timeline.c.doctor_id == target.id).values(
+        doctor_name=target.full_name, doctor_specialization=target.specialization,
+        department_id=target.department_id, department_name=department))
+
+
+@event.listens_for(Department, 'after_update')
+def _department_updated(mapper, connection, target):
+    if _changed(target, ('name',)):
+        connection.execute(timeline.update().where(timeline.c.department_id == target.id).values(
+            department_name=target.name))
+
+
+@click.command('timeline-rebuild')
+@with_appcontext
+def timeline_rebuild_command():
+    """Rebuild the patient timeline from appointments and treatments."""
+    with db.engine.begin() as connection:
+        rebuild(connection)
+    click.echo(f'{PatientTimelineEntry.query.count()} timeline row(s) written.')
+
+
+def init_timeline(app):
+    app.cli.add_command(timeline_rebuild_command)